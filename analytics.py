@@ -0,0 +1,281 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from sqlalchemy import Integer, and_, case, cast, delete, extract, func, or_, select, update
+
+from counters import BufferedWriter
+from ranking import current_hour, upsert_add
+
+logger = logging.getLogger(__name__)
+
+# Bucket sizes in seconds; buckets are numbered from the Unix epoch, in UTC
+GRAINS = {"hour": 3600, "day": 86400}
+COUNTS = ("views", "likes", "uploads")
+
+
+def epoch_hours(column, dialect_name):
+    """SQL for the hour (since the Unix epoch) a DateTime column falls in."""
+    if dialect_name == "sqlite":
+        return cast(func.strftime("%s", column), Integer) // 3600
+    if dialect_name == "postgresql":
+        return cast(func.floor(extract("epoch", column) / 3600), Integer)
+    return cast(func.floor(func.unix_timestamp(column) / 3600), Integer)
+
+
+class Analytics(BufferedWriter):
+    """
+    Views, likes and uploads per user and per upload, pre-aggregated so a
+    dashboard reads a handful of keyed rows however much activity is behind
+    them.
+
+    `record()` is called with every counted view or like (see `count()` in
+    extensions.py), `upload_added()` from the upload event and
+    `upload_removed()` from delete_upload (views/media.py). Counts are summed in memory per (upload, hour) and every
+    `ANALYTICS_FLUSH_INTERVAL` seconds added, by upserts in one transaction,
+    to:
+
+        stats         running totals per user over their current uploads
+        activity      views, likes and new uploads per user and hour or day
+        upload_days   views and likes per upload and day
+
+    The owners of the counted uploads are looked up once per flush; counts
+    for uploads or users deleted in the meantime are dropped. Hourly rows
+    are kept for `ANALYTICS_HOURLY_RETENTION` hours, daily ones for good.
+    Reads see other workers' counts once they flushed.
+    """
+
+    def __init__(self, upload_table, user_table, view_table, stats_table, activity_table, upload_days_table,
+                 app=None, db=None):
+        self.uploads = upload_table
+        self.users = user_table
+        self.views = view_table
+        self.stats = stats_table
+        self.activity = activity_table
+        self.upload_days = upload_days_table
+        self._lock = threading.Lock()
+        self._counted = defaultdict(Counter)  # (upload_id, hour) -> views/likes
+        self._added = Counter()               # (user_id, hour) -> new uploads
+        self._removed = defaultdict(Counter)  # user_id -> uploads/views/likes leaving their totals
+        self._last_prune = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("ANALYTICS_FLUSH_INTERVAL", float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", 10)))
+        app.config.setdefault("ANALYTICS_HOURLY_RETENTION", int(os.environ.get("ANALYTICS_HOURLY_RETENTION", 7 * 24)))
+        app.extensions["analytics"] = self
+        atexit.register(self.flush)
+
+    @property
+    def flush_interval(self):
+        return self.app.config["ANALYTICS_FLUSH_INTERVAL"]
+
+    # ---------- recording ----------
+    def record(self, upload_id, column, n=1):
+        """Counts `n` views or likes (n may be negative) in the current hour."""
+        self._ensure_flusher()
+        with self._lock:
+            self._counted[(upload_id, current_hour())][column] += n
+
+    def upload_added(self, user_id):
+        self._ensure_flusher()
+        with self._lock:
+            self._added[(user_id, current_hour())] += 1
+
+    def upload_removed(self, upload):
+        """
+        Call before an upload's rows are deleted: it leaves its owner's totals
+        with the views and likes of its daily rows, which the same flushes
+        added to the totals (its own counters may still be buffered). What it
+        counted stays in their activity.
+        """
+        d = self.upload_days
+        views, likes = self.db.session.execute(
+            select(func.coalesce(func.sum(d.c.views), 0), func.coalesce(func.sum(d.c.likes), 0))
+            .where(d.c.upload_id == upload.id)
+        ).one()
+        self._ensure_flusher()
+        with self._lock:
+            self._removed[upload.user_id].update(uploads=1, views=views, likes=likes)
+
+    def flush(self):
+        with self._lock:
+            counted, added, removed = self._counted, self._added, self._removed
+            self._counted, self._added, self._removed = defaultdict(Counter), Counter(), defaultdict(Counter)
+        if not (counted or added or removed):
+            return
+
+        now = time.time()
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    self._write(conn, counted, added, removed)
+                    if now - self._last_prune > 3600:
+                        self._prune(conn, now)
+                        self._last_prune = now
+        except Exception:
+            logger.exception("Analytics flush failed; will retry")
+            with self._lock:
+                for key, counts in counted.items():
+                    self._counted[key].update(counts)
+                self._added.update(added)
+                for key, counts in removed.items():
+                    self._removed[key].update(counts)
+
+    def _write(self, conn, counted, added, removed, totals=True):
+        up = self.uploads
+        ids = {upload_id for upload_id, _ in counted}
+        owners = dict(conn.execute(select(up.c.id, up.c.user_id).where(up.c.id.in_(ids))).all()) if ids else {}
+        users = set(owners.values())
+        others = {user_id for user_id, _ in added} | set(removed)
+        if others - users:
+            users |= set(conn.execute(select(self.users.c.id).where(self.users.c.id.in_(others - users))).scalars())
+
+        stats = defaultdict(Counter)        # user_id -> counts
+        activity = defaultdict(Counter)     # (user_id, grain, bucket) -> counts
+        upload_days = defaultdict(Counter)  # (upload_id, day) -> counts
+        for (upload_id, hour), counts in counted.items():
+            user_id = owners.get(upload_id)
+            if user_id is None:
+                continue
+            stats[user_id].update(counts)
+            activity[(user_id, "hour", hour)].update(counts)
+            activity[(user_id, "day", hour // 24)].update(counts)
+            upload_days[(upload_id, hour // 24)].update(counts)
+        for (user_id, hour), n in added.items():
+            if user_id in users:
+                stats[user_id]["uploads"] += n
+                activity[(user_id, "hour", hour)]["uploads"] += n
+                activity[(user_id, "day", hour // 24)]["uploads"] += n
+        for user_id, counts in removed.items():
+            if user_id in users:
+                stats[user_id].subtract(counts)
+
+        dialect = conn.dialect.name
+        if totals and stats:
+            s = self.stats
+            conn.execute(upsert_add(s, dialect, ["user_id"], *COUNTS), [
+                {"user_id": user_id, **{c: counts[c] for c in COUNTS}} for user_id, counts in stats.items()
+            ])
+            shrunk = [user_id for user_id in removed if user_id in stats]
+            if shrunk:
+                # Totals from before the rollups never saw some of what the daily
+                # rows counted: removing an upload never takes them below 0
+                conn.execute(
+                    update(s).where(s.c.user_id.in_(shrunk), or_(*[s.c[c] < 0 for c in COUNTS]))
+                    .values({c: case((s.c[c] < 0, 0), else_=s.c[c]) for c in COUNTS})
+                )
+        if activity:
+            conn.execute(upsert_add(self.activity, dialect, ["user_id", "grain", "bucket"], *COUNTS), [
+                {"user_id": user_id, "grain": grain, "bucket": bucket, **{c: counts[c] for c in COUNTS}}
+                for (user_id, grain, bucket), counts in activity.items()
+            ])
+        if upload_days:
+            conn.execute(upsert_add(self.upload_days, dialect, ["upload_id", "day"], "views", "likes"), [
+                {"upload_id": upload_id, "day": day, "views": counts["views"], "likes": counts["likes"]}
+                for (upload_id, day), counts in upload_days.items()
+            ])
+
+    def _prune(self, conn, now):
+        a = self.activity
+        oldest = current_hour(now) - self.app.config["ANALYTICS_HOURLY_RETENTION"]
+        conn.execute(delete(a).where(a.c.grain == "hour", a.c.bucket < oldest))
+
+    # ---------- reading ----------
+    def totals(self, user_id):
+        """{"uploads": n, "views": n, "likes": n} over the user's current uploads."""
+        s = self.stats
+        row = self.db.session.execute(select(s.c.uploads, s.c.views, s.c.likes).where(s.c.user_id == user_id)).first()
+        return dict(row._mapping) if row else dict.fromkeys(COUNTS, 0)
+
+    def user_activity(self, user_id, spans, now=None):
+        """
+        The user's last buckets for each grain in `spans` ({"hour": 48, "day": 30}),
+        read in one query. Returns: {grain: [bucket, ...]}, oldest first, see `_series()`.
+        """
+        a = self.activity
+        last = {grain: self._bucket(grain, now) for grain in spans}
+        rows = self.db.session.execute(
+            select(a.c.grain, a.c.bucket, a.c.views, a.c.likes, a.c.uploads)
+            .where(a.c.user_id == user_id, or_(*[
+                and_(a.c.grain == grain, a.c.bucket > last[grain] - n) for grain, n in spans.items()
+            ]))
+        ).all()
+        return {
+            grain: self._series(grain, last[grain], n, [r for r in rows if r.grain == grain], COUNTS)
+            for grain, n in spans.items()
+        }
+
+    def upload_activity(self, upload_id, days, now=None):
+        """The upload's views and likes over its last `days` days, oldest first."""
+        d = self.upload_days
+        last = self._bucket("day", now)
+        rows = self.db.session.execute(
+            select(d.c.day.label("bucket"), d.c.views, d.c.likes)
+            .where(d.c.upload_id == upload_id, d.c.day > last - days)
+        ).all()
+        return self._series("day", last, days, rows, ("views", "likes"))
+
+    @staticmethod
+    def _bucket(grain, now=None):
+        return int((now or time.time()) // GRAINS[grain])
+
+    @staticmethod
+    def _series(grain, last, n, rows, columns):
+        """One {"start": datetime (UTC), column: n, ...} per bucket, empty ones included."""
+        found = {row.bucket: row for row in rows}
+        series = []
+        for bucket in range(last - n + 1, last + 1):
+            row = found.get(bucket)
+            entry = {"start": datetime.utcfromtimestamp(bucket * GRAINS[grain])}
+            entry.update({c: (getattr(row, c) or 0) if row else 0 for c in columns})
+            series.append(entry)
+        return series
+
+    # ---------- backfill ----------
+    def rebuild(self):
+        """
+        Recomputes every table from the uploads and the recorded views:
+        totals from the uploads' own counters, history from when each view
+        was recorded and each upload created. Likes keep no time, so the
+        rebuilt history has none. Returns: the number of users with stats.
+        """
+        up, views, s = self.uploads, self.views, self.stats
+        with self.app.app_context():
+            with self.db.engine.begin() as conn:
+                dialect = conn.dialect.name
+                for table in (self.stats, self.activity, self.upload_days):
+                    conn.execute(delete(table))
+                users = conn.execute(s.insert().from_select(
+                    ["user_id", "uploads", "views", "likes"],
+                    select(up.c.user_id, func.count(), func.coalesce(func.sum(up.c.views), 0),
+                           func.coalesce(func.sum(up.c.likes), 0)).group_by(up.c.user_id),
+                )).rowcount
+
+                hour = epoch_hours(up.c.created_at, dialect)
+                added = Counter({
+                    (user_id, h): n for user_id, h, n in conn.execute(
+                        select(up.c.user_id, hour, func.count())
+                        .where(up.c.created_at.isnot(None)).group_by(up.c.user_id, hour)
+                    )
+                })
+                self._write(conn, {}, added, {}, totals=False)
+
+                hour = epoch_hours(views.c.created_at, dialect)
+                result = conn.execute(
+                    select(views.c.upload_id, hour, func.count())
+                    .where(views.c.created_at.isnot(None)).group_by(views.c.upload_id, hour)
+                    .execution_options(yield_per=5000)
+                )
+                for rows in result.partitions():
+                    counted = {(upload_id, h): Counter(views=n) for upload_id, h, n in rows}
+                    self._write(conn, counted, Counter(), {}, totals=False)
+                self._prune(conn, time.time())
+        return users
@@ -0,0 +1,297 @@
+"""
+ASGI entry point: serves the same Flask `app`, with the same routes and
+behavior, from an event loop.
+
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker -w 2
+    uvicorn asgi:application --port 8000
+
+Views stay synchronous and run on thread pools, so ORM access never blocks
+the loop. What moves onto the loop is waiting on the network:
+
+* request bodies are received on the loop and spooled (memory, then disk)
+  before a thread is taken, so a slow upload - the form or a chunked
+  session PUT - holds a socket, not a thread;
+* response bodies are pulled from the WSGI iterable one block at a time on
+  the pool and written on the loop, so a slow client watching a video from
+  /media holds no thread between blocks;
+* /view and /like POSTs run on their own small pool, so counter traffic
+  keeps flowing while page renders saturate the main one;
+* the live count streams of /api/live are served by the loop itself,
+  without Flask: a waiting client holds a socket and no thread, so a
+  worker keeps thousands of them open (see live.py).
+
+ASGI_THREADS + ASGI_COUNTER_THREADS should stay within the SQLAlchemy
+connection pool (pool_size + max_overflow, 15 by default).
+"""
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.wsgi import FileWrapper
+
+from app import app, chunked_uploads, live
+
+app.config.setdefault('ASGI_THREADS', int(os.environ.get('ASGI_THREADS', 10)))
+app.config.setdefault('ASGI_COUNTER_THREADS', int(os.environ.get('ASGI_COUNTER_THREADS', 4)))
+app.config.setdefault('ASGI_STREAM_BLOCK', int(os.environ.get('ASGI_STREAM_BLOCK', 256 * 1024)))
+app.config.setdefault('ASGI_SPOOL_MEMORY', int(os.environ.get('ASGI_SPOOL_MEMORY', 1024 * 1024)))
+app.config.setdefault('ASGI_SPOOL_DIR', os.environ.get('ASGI_SPOOL_DIR', chunked_uploads.staging_dir))
+# Largest body accepted at all; room for the multipart envelope around MAX_UPLOAD_SIZE
+app.config.setdefault('ASGI_MAX_BODY', app.config['MAX_UPLOAD_SIZE'] + 1024 * 1024)
+
+COUNTER_ROUTES = re.compile(r"^/(view|like)/\d+$")
+LIVE_PATH = "/api/live"
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class WSGIBridge:
+    """
+    Runs a WSGI app under ASGI. Unlike a plain WSGI-to-ASGI adapter, no
+    thread is held while the client is sending or receiving bytes.
+    """
+
+    def __init__(self, wsgi_app, config, live=None):
+        self.wsgi_app = wsgi_app
+        self.config = config
+        self.live = live
+        self._pools = {}
+        self._pid = None
+        self._spool_ready = False
+        self._lock = threading.Lock()
+
+    def _pool(self, lane):
+        # Pools are created lazily so each forked worker gets its own threads
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pools = {}
+                self._pid = os.getpid()
+            if lane not in self._pools:
+                size = self.config['ASGI_COUNTER_THREADS'] if lane == "counters" else self.config['ASGI_THREADS']
+                self._pools[lane] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"asgi-{lane}")
+            return self._pools[lane]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise NotImplementedError(f"Unsupported ASGI scope: {scope['type']}")
+        if self.live is not None and scope["method"] == "GET" and scope["path"] == LIVE_PATH:
+            return await self._live(scope, receive, send)
+
+        lane = "counters" if scope["method"] == "POST" and COUNTER_ROUTES.match(scope["path"]) else "app"
+        try:
+            body, length = await self._read_body(scope, receive)
+        except BodyTooLarge:
+            return await self._respond(send, 413, b"Request Entity Too Large")
+        except ClientDisconnected:
+            return
+
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            await self._run(self._pool(lane), self._environ(scope, body, length), send, disconnected)
+        finally:
+            watcher.cancel()
+            body.close()
+
+    async def _run(self, pool, environ, send, disconnected):
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+            return started.setdefault("written", []).append
+
+        result = await loop.run_in_executor(pool, self.wsgi_app, environ, start_response)
+        try:
+            if isinstance(result, (list, tuple)):
+                # Rendered pages and JSON: already in memory, no more thread hops
+                chunks, iterator = list(result), None
+            else:
+                # File and streamed responses: start_response may wait for the first block
+                iterator = iter(result)
+                first = await loop.run_in_executor(pool, next, iterator, None)
+                chunks = [] if first is None else [first]
+                if first is None:
+                    iterator = None
+
+            started["sent"] = True
+            await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+            for chunk in started.get("written", []) + chunks:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            while iterator is not None and not disconnected.is_set():
+                chunk = await loop.run_in_executor(pool, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(result, "close"):
+                await loop.run_in_executor(pool, result.close)
+
+    async def _live(self, scope, receive, send):
+        """
+        Streams count updates until the client leaves. Only the first
+        message, the current counts, takes a thread, for its query.
+        """
+        query = parse_qs(scope["query_string"].decode("latin1"))
+        try:
+            ids = self.live.parse_ids(query.get("ids", [""])[0])
+        except ValueError as e:
+            return await self._respond(send, 400, str(e).encode())
+
+        loop = asyncio.get_running_loop()
+        # Subscribed before the query, so no change in between is missed
+        subscription = self.live.subscribe(ids)
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        watcher.add_done_callback(lambda _: subscription.wake.set())
+        try:
+            # Cached pages can show older counts, and a reconnecting client missed some
+            current = await loop.run_in_executor(self._pool("app"), self.live.values, ids)
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),  # nginx: don't buffer the stream
+                ],
+            })
+            await send({"type": "http.response.body", "body": self.live.message(current), "more_body": True})
+            while not disconnected.is_set():
+                try:
+                    await asyncio.wait_for(subscription.wake.wait(), self.config['LIVE_HEARTBEAT'])
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                    continue
+                changes = subscription.take()
+                if changes:
+                    await send({"type": "http.response.body", "body": self.live.message(changes), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+            self.live.unsubscribe(subscription)
+
+    async def _read_body(self, scope, receive):
+        limit = self.config['ASGI_MAX_BODY']
+        declared = next((v for k, v in scope["headers"] if k == b"content-length"), None)
+        if declared is not None and int(declared) > limit:
+            raise BodyTooLarge()
+
+        if not self._spool_ready:
+            # Like the upload folders, created on first use rather than at import
+            os.makedirs(self.config['ASGI_SPOOL_DIR'], exist_ok=True)
+            self._spool_ready = True
+        body = tempfile.SpooledTemporaryFile(
+            max_size=self.config['ASGI_SPOOL_MEMORY'], dir=self.config['ASGI_SPOOL_DIR']
+        )
+        length = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                raise ClientDisconnected()
+            chunk = message.get("body", b"")
+            length += len(chunk)
+            if length > limit:
+                body.close()
+                raise BodyTooLarge()
+            if chunk:
+                body.write(chunk)
+            more_body = message.get("more_body", False)
+        body.seek(0)
+        return body, length
+
+    async def _watch_disconnect(self, receive, disconnected):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                return
+
+    def _file_wrapper(self, file, buffer_size=8192):
+        # Bigger blocks than Werkzeug's 8 KiB default: one thread hop per block
+        return FileWrapper(file, max(buffer_size, self.config['ASGI_STREAM_BLOCK']))
+
+    def _environ(self, scope, body, length):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin1"),
+            "QUERY_STRING": scope["query_string"].decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1] or 80),
+            "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+            "wsgi.file_wrapper": self._file_wrapper,
+        }
+        if length or scope["method"] not in ("GET", "HEAD"):
+            # The spooled body is complete, so its size is the real length even for chunked requests
+            environ["CONTENT_LENGTH"] = str(length)
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin1"), value.decode("latin1")
+            if name == "content-length":
+                continue
+            if name == "content-type":
+                environ["CONTENT_TYPE"] = value
+                continue
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def _respond(self, send, status, body):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.live is not None:
+                    self.live.close()
+                with self._lock:
+                    for pool in self._pools.values():
+                        pool.shutdown(wait=False)
+                    self._pools = {}
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = WSGIBridge(app, app.config, live)
@@ -0,0 +1,56 @@
+"""
+Measures bcrypt throughput at several work factors, on one core and across
+a process pool, to help pick PASSWORD_HASH_ROUNDS and PASSWORD_HASH_WORKERS.
+
+    python benchmarks/bench_bcrypt.py --rounds 10 11 12 13 --seconds 3
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import _hash, _verify  # noqa: E402
+
+PASSWORD = "Correct-Horse-9!"
+
+
+def hashes_in(seconds, rounds):
+    """Hashes as many passwords as fit in `seconds`; returns the count."""
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        _hash(PASSWORD, rounds)
+        done += 1
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    # Sanity check that verify agrees with hash before timing anything
+    assert _verify(_hash(PASSWORD, 4), PASSWORD)
+
+    print(f"{'rounds':>6}  {'ms/hash':>8}  {'1 core h/s':>10}  {args.workers:>3} procs h/s  {'h/s per core':>12}")
+    for rounds in args.rounds:
+        single = hashes_in(args.seconds, rounds) / args.seconds
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # Warm the pool so process start-up isn't timed
+            list(pool.map(_hash, [PASSWORD] * args.workers, [4] * args.workers))
+            start = time.perf_counter()
+            counts = list(pool.map(hashes_in, [args.seconds] * args.workers, [rounds] * args.workers))
+            elapsed = time.perf_counter() - start
+        pooled = sum(counts) / elapsed
+
+        print(f"{rounds:>6}  {1000 / single:>8.1f}  {single:>10.1f}  {pooled:>13.1f}  {pooled / args.workers:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
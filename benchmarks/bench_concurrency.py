@@ -0,0 +1,247 @@
+"""
+Compares the sync (gunicorn app:app) and async (gunicorn asgi:application
+with uvicorn workers) serving modes under many concurrent connections.
+
+For each mode and concurrency level a local server is started, every client
+connection loops over one scenario for --duration seconds with keep-alive,
+and throughput, latency percentiles and errors are reported:
+
+    media  GET a --media-size file from /media, read at --read-rate KiB/s
+           per connection (0 = as fast as possible) to model slow phones
+    view   POST /view/<id>, the counter endpoint
+    page   GET /gallery
+
+    python benchmarks/bench_concurrency.py
+    python benchmarks/bench_concurrency.py --scenario view --concurrency 100 1000 5000 --workers 4
+
+5,000 connections need a high open-file limit (`ulimit -n 20000`) for both
+the benchmark and the server, and --client-procs > 1 on a small machine so
+the load generator is not the bottleneck. Without DATABASE_URL a throwaway
+SQLite file in the temp directory is used; it is dropped and recreated.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.gettempdir(), "gamerhub_concurrency.db")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERVERS = {
+    "sync": ["gunicorn", "app:app"],
+    "async": ["gunicorn", "asgi:application", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def seed(media_size):
+    """Creates one user, one upload and its media file; returns (upload id, file path)."""
+    from app import app, db, Upload, User  # noqa: E402
+
+    filename = f"{uuid.uuid4().hex}_bench.bin"
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username="bench", email="bench@example.com", password="x" * 60)
+        db.session.add(user)
+        db.session.commit()
+        upload = Upload(filename=filename, filetype="video", user_id=user.id)
+        db.session.add(upload)
+        db.session.commit()
+        upload_id = upload.id
+        path = os.path.join(ROOT, app.config["UPLOAD_FOLDER"], filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(os.urandom(media_size))
+    return upload_id, path
+
+
+def start_server(mode, port, workers):
+    cmd = SERVERS[mode] + ["-w", str(workers), "-b", f"127.0.0.1:{port}", "--backlog", "8192", "--timeout", "120"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start: {' '.join(cmd)}")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+async def read_response(reader, read_rate):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("closed")
+    status = int(status_line.split()[1])
+    length = 0
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+        elif name.lower() == "connection" and value.strip().lower() == "close":
+            keep_alive = False  # gunicorn sync workers close after every response
+
+    block = 64 * 1024
+    while length > 0:
+        data = await reader.read(min(block, length))
+        if not data:
+            raise ConnectionError("truncated body")
+        length -= len(data)
+        if read_rate:
+            await asyncio.sleep(len(data) / (read_rate * 1024))
+    return status, keep_alive
+
+
+async def connect(port, read_rate):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if read_rate:
+        # Loopback buffers would otherwise swallow whole files and hide slow readers
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64 * 1024)
+    sock.setblocking(False)
+    try:
+        await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    except OSError:
+        sock.close()
+        raise
+    return await asyncio.open_connection(sock=sock)
+
+
+async def client(request, port, deadline, read_rate, timeout, results):
+    reader = writer = None
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(connect(port, read_rate), timeout)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await asyncio.wait_for(read_response(reader, read_rate), timeout)
+        except (OSError, ConnectionError, asyncio.TimeoutError, ValueError, IndexError):
+            results["errors"] += 1  # connect/read failures and timeouts
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.1)
+            continue
+        results["latencies"].append(time.perf_counter() - start)
+        if status >= 400:
+            results["failed"] += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+def run_clients(request, port, connections, duration, read_rate, timeout):
+    raise_file_limit()
+    results = {"latencies": [], "failed": 0, "errors": 0}
+
+    async def main():
+        deadline = time.time() + duration
+        await asyncio.gather(*(
+            client(request, port, deadline, read_rate, timeout, results) for _ in range(connections)
+        ))
+
+    asyncio.run(main())
+    return results
+
+
+def load(request, port, connections, duration, read_rate, timeout, procs):
+    """Spreads `connections` over `procs` client processes; returns merged results."""
+    shares = [connections // procs + (1 if i < connections % procs else 0) for i in range(procs)]
+    args = [(request, port, n, duration, read_rate, timeout) for n in shares if n]
+    if len(args) == 1:
+        return run_clients(*args[0])
+    with multiprocessing.Pool(len(args)) as pool:
+        parts = pool.starmap(run_clients, args)
+    return {
+        "latencies": [t for part in parts for t in part["latencies"]],
+        "failed": sum(part["failed"] for part in parts),
+        "errors": sum(part["errors"] for part in parts),
+    }
+
+
+def build_request(scenario, upload_id, media_path):
+    if scenario == "media":
+        line = f"GET /media/{os.path.basename(media_path)} HTTP/1.1"
+    elif scenario == "view":
+        line = f"POST /view/{upload_id} HTTP/1.1\r\nContent-Length: 0"
+    else:
+        line = "GET /gallery HTTP/1.1"
+    return f"{line}\r\nHost: 127.0.0.1\r\n\r\n".encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=sorted(SERVERS), default=["sync", "async"])
+    parser.add_argument("--scenario", choices=["media", "view", "page"], default="media")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--workers", type=int, default=2, help="server worker processes")
+    parser.add_argument("--client-procs", type=int, default=1)
+    parser.add_argument("--media-size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--read-rate", type=int, default=256, help="KiB/s per connection for media, 0 = unthrottled")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--port", type=int, default=8071)
+    args = parser.parse_args()
+
+    print(f"Open file limit: {raise_file_limit()}")
+    upload_id, media_path = seed(args.media_size)
+    request = build_request(args.scenario, upload_id, media_path)
+    read_rate = args.read_rate if args.scenario == "media" else 0
+
+    print(f"\n{'mode':>5}  {'conns':>5}  {'req/s':>8}  {'p50 ms':>8}  {'p99 ms':>8}  {'http 4xx/5xx':>12}  {'conn errors':>11}")
+    try:
+        for connections in args.concurrency:
+            for mode in args.modes:
+                proc = start_server(mode, args.port, args.workers)
+                try:
+                    results = load(request, args.port, connections, args.duration, read_rate,
+                                   args.timeout, args.client_procs)
+                finally:
+                    stop_server(proc)
+                latencies = sorted(results["latencies"])
+                p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+                p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000 if latencies else float("nan")
+                print(f"{mode:>5}  {connections:>5}  {len(latencies) / args.duration:>8.1f}  "
+                      f"{p50:>8.1f}  {p99:>8.1f}  {results['failed']:>12}  {results['errors']:>11}")
+    finally:
+        os.remove(media_path)
+
+
+if __name__ == "__main__":
+    main()
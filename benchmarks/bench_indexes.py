@@ -0,0 +1,174 @@
+"""
+Seeds a synthetic dataset and compares query plans and timings of the hot
+access paths with and without the indexes from revision cd5ef4955998.
+
+    python benchmarks/bench_indexes.py --users 20000 --uploads 200000
+    DATABASE_URL=postgresql://localhost/gamerhub_bench python benchmarks/bench_indexes.py
+
+Without DATABASE_URL a throwaway SQLite file in the temp directory is used.
+Never point it at a database you care about: it drops and recreates tables.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.gettempdir(), "gamerhub_bench.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy as sa  # noqa: E402
+
+from app import app, db, Upload, User, VideoLike  # noqa: E402
+
+# Index name -> DDL, in the shape the migration creates them
+INDEXES = {
+    "ix_upload_user_id_id": "CREATE INDEX ix_upload_user_id_id ON upload (user_id, id DESC)",
+    "ix_upload_created_at": "CREATE INDEX ix_upload_created_at ON upload (created_at)",
+    "ix_user_email_lower": 'CREATE INDEX ix_user_email_lower ON "user" (lower(email))',
+}
+
+# Name -> (SQL, params factory)
+QUERIES = {
+    "dashboard (uploads by user)": (
+        "SELECT id, filename, views, likes FROM upload WHERE user_id = :uid ORDER BY id DESC",
+        lambda n: {"uid": random.randint(1, n["users"])},
+    ),
+    "feed page (keyset on id)": (
+        "SELECT id, filename, views, likes FROM upload WHERE id < :after ORDER BY id DESC LIMIT 24",
+        lambda n: {"after": random.randint(25, n["uploads"])},
+    ),
+    "uploads in last day": (
+        "SELECT count(*) FROM upload WHERE created_at >= :since",
+        lambda n: {"since": datetime(2026, 1, 1) - timedelta(days=1)},
+    ),
+    "login by email": (
+        'SELECT id, password FROM "user" WHERE lower(email) = :email',
+        lambda n: {"email": f"player{random.randint(1, n['users'])}@example.com"},
+    ),
+    "liked? (video_like)": (
+        "SELECT 1 FROM video_like WHERE video_id = :vid AND user_id = :viewer",
+        lambda n: {"vid": random.randint(1, n["uploads"]), "viewer": f"user:{random.randint(1, n['users'])}"},
+    ),
+}
+
+
+def seed(counts, batch=5000):
+    db.drop_all()
+    db.create_all()
+    now = datetime(2026, 1, 1)
+
+    def insert_batches(table, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= batch:
+                db.session.execute(table.insert(), chunk)
+                chunk = []
+        if chunk:
+            db.session.execute(table.insert(), chunk)
+        db.session.commit()
+
+    insert_batches(User.__table__, (
+        {"id": i, "username": f"player{i}", "email": f"Player{i}@example.com", "password": "x" * 60, "xp": 0}
+        for i in range(1, counts["users"] + 1)
+    ))
+    insert_batches(Upload.__table__, (
+        {
+            "id": i,
+            "filename": f"{i:032x}_clip.mp4",
+            "filetype": "video" if i % 3 else "image",
+            "user_id": random.randint(1, counts["users"]),
+            "created_at": now - timedelta(minutes=counts["uploads"] - i),
+            "views": random.randint(0, 5000),
+            "likes": random.randint(0, 500),
+        }
+        for i in range(1, counts["uploads"] + 1)
+    ))
+    seen = set()
+    likes = []
+    while len(likes) < counts["likes"]:
+        key = (random.randint(1, counts["uploads"]), f"user:{random.randint(1, counts['users'])}")
+        if key not in seen:
+            seen.add(key)
+            likes.append({"video_id": key[0], "user_id": key[1], "filename": "x", "filetype": "video"})
+    insert_batches(VideoLike.__table__, likes)
+
+
+def explain(conn, sql, params):
+    if conn.dialect.name == "postgresql":
+        rows = conn.execute(sa.text("EXPLAIN ANALYZE " + sql), params).all()
+        return [r[0] for r in rows]
+    rows = conn.execute(sa.text("EXPLAIN QUERY PLAN " + sql), params).all()
+    return [r[-1] for r in rows]
+
+
+def time_queries(conn, counts, repeat):
+    results = {}
+    for name, (sql, make_params) in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            params = make_params(counts)
+            start = time.perf_counter()
+            conn.execute(sa.text(sql), params).all()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results[name] = {
+            "plan": explain(conn, sql, make_params(counts)),
+            "p50": statistics.median(timings),
+            "p95": timings[int(len(timings) * 0.95) - 1],
+        }
+    return results
+
+
+def set_indexes(conn, enabled):
+    for name, ddl in INDEXES.items():
+        conn.execute(sa.text(f"DROP INDEX IF EXISTS {name}"))
+        if enabled:
+            conn.execute(sa.text(ddl))
+    conn.execute(sa.text("ANALYZE"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--uploads", type=int, default=200000)
+    parser.add_argument("--likes", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data from a previous run")
+    args = parser.parse_args()
+    counts = {"users": args.users, "uploads": args.uploads, "likes": args.likes}
+
+    with app.app_context():
+        print(f"Database: {db.engine.url.render_as_string(hide_password=True)}")
+        if not args.skip_seed:
+            start = time.perf_counter()
+            seed(counts)
+            print(f"Seeded {counts} in {time.perf_counter() - start:.1f}s")
+
+        report = {}
+        for label, enabled in (("before", False), ("after", True)):
+            with db.engine.begin() as conn:
+                set_indexes(conn, enabled)
+            with db.engine.connect() as conn:
+                report[label] = time_queries(conn, counts, args.repeat)
+
+    for name in QUERIES:
+        before, after = report["before"][name], report["after"][name]
+        speedup = before["p50"] / after["p50"] if after["p50"] else float("inf")
+        print(f"\n== {name}")
+        print(f"   before: p50 {before['p50']:.3f} ms  p95 {before['p95']:.3f} ms")
+        for line in before["plan"]:
+            print(f"           {line}")
+        print(f"   after:  p50 {after['p50']:.3f} ms  p95 {after['p95']:.3f} ms  ({speedup:.1f}x)")
+        for line in after["plan"]:
+            print(f"           {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Times leaderboard operations as the number of players grows: a score
+update, a rank lookup, reading one page of 50, and loading a board from a
+snapshot. Ranks are checked against a plain sorted list along the way.
+
+    python benchmarks/bench_leaderboard.py --players 10000 100000 500000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import Leaderboard  # noqa: E402
+
+
+def per_op_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'players':>8}  {'load ms':>8}  {'update us':>9}  {'rank us':>8}  {'page us':>8}")
+    for n in args.players:
+        entries = [(uid, random.randint(0, 100000)) for uid in range(1, n + 1)]
+
+        start = time.perf_counter()
+        board = Leaderboard(entries)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        def bump():
+            uid = random.randint(1, n)
+            board.set(uid, board.values[uid] + random.randint(1, 50))
+
+        update = per_op_us(bump, args.repeat)
+        rank = per_op_us(lambda: board.rank(random.randint(1, n)), args.repeat)
+        page = per_op_us(lambda: board.page(random.randrange(0, n - 50), 50), args.repeat)
+
+        expected = sorted(board.values.items(), key=lambda kv: (-kv[1], kv[0]))
+        for uid in random.sample(range(1, n + 1), 100):
+            assert expected[board.rank(uid) - 1][0] == uid
+        offset = random.randrange(0, n - 50)
+        assert [(uid, v) for _, uid, v in board.page(offset, 50)] == expected[offset:offset + 50]
+
+        print(f"{n:>8}  {load_ms:>8.1f}  {update:>9.2f}  {rank:>8.2f}  {page:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
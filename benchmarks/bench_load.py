@@ -0,0 +1,817 @@
+"""
+Load test for the whole app. Seeds a scratch database with --users users
+and --uploads uploads (real image and video files in the media store, with
+their thumbnails and HLS renditions), then for each scenario starts a local
+gunicorn server and lets --concurrency virtual users (each with its own
+cookies and client IP) replay a traffic mix against it:
+
+    browse   anonymous visitors: home, gallery tabs and pages, upload pages,
+             thumbnails, originals and HLS playlists/segments, profiles,
+             the user list, search and leaderboards
+    engage   view counter and like POST storms on a few hot uploads, every
+             like from a fresh anonymous visitor
+    login    login bursts (bcrypt bound) followed by the dashboard,
+             sign-ups, password reset pages
+    upload   signed-in users uploading images in one request and through
+             chunked upload sessions, deleting them, changing avatars and
+             bios, and playing games for leaderboard scores
+    mixed    all of the above, weighted like a normal day
+
+Each scenario reports, per route (method + Flask endpoint), the requests,
+errors, throughput and client-side p50/p95/p99 latency, the largest worker
+RSS seen after that route's requests (metrics.py), and the peak RSS of
+the whole server. --output saves it all as JSON so runs can be compared
+across commits; --compare checks a run against a saved one and exits 1 when
+a route got slower, lost throughput or grew in memory by more than
+--threshold:
+
+    python benchmarks/bench_load.py --users 2000 --uploads 5000 --output load-$(git rev-parse --short HEAD).json
+    python benchmarks/bench_load.py --scenario browse engage --concurrency 100 --duration 60
+    python benchmarks/bench_load.py --no-seed --output new.json --compare old.json
+    python benchmarks/bench_load.py --compare old.json new.json
+
+Without DATABASE_URL a throwaway SQLite file in the temp directory is used;
+pass a PostgreSQL URL (--database-url) to test that backend. Seeding drops
+and recreates every table and adds files to the media store, so never
+point it at real data. Videos need ffmpeg (FFMPEG_BINARY); without it only
+images are seeded.
+"""
+import argparse
+import asyncio
+import atexit
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.gettempdir(), "gamerhub_load.db")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_concurrency import SERVERS, raise_file_limit, start_server, stop_server  # noqa: E402
+
+PASSWORD = "load-test-password"
+
+WORDS = (
+    "dark knight shadow pixel ninja dragon storm wolf fire ice gamer pro noob legend "
+    "sniper speed runner candy pool chess master ghost blade star moon sun rocket"
+).split()
+
+SCENARIOS = ("browse", "engage", "login", "upload", "mixed")
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+# ---------- synthetic media ----------
+def make_image(rng, size=(640, 480), fmt="JPEG"):
+    """A distinct image of blocky noise: cheap to make, but real work to thumbnail."""
+    from PIL import Image
+
+    small = Image.frombytes("RGB", (size[0] // 20, size[1] // 20), rng.randbytes(size[0] // 20 * size[1] // 20 * 3))
+    out = io.BytesIO()
+    small.resize(size, Image.NEAREST).save(out, fmt, quality=85)
+    return out.getvalue()
+
+
+def make_video(path, n, ffmpeg, seconds=6):
+    """A short H.264/AAC clip, distinct for every `n` (test pattern and tone vary)."""
+    subprocess.run([
+        ffmpeg, "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=24:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency={220 + 10 * n}:duration={seconds}",
+        "-vf", f"hue=h={n * 37 % 360}", "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path,
+    ], check=True, capture_output=True, timeout=120)
+
+
+# ---------- seeding ----------
+def seed(gamerhub, args, rng):
+    """Drops every table and fills them with `args.users` users and `args.uploads` uploads."""
+    from ingest import hash_file
+    from storage import content_key
+    from thumbnails import process_media
+
+    app, db, storage = gamerhub.app, gamerhub.db, gamerhub.storage
+    ffmpeg = app.config["FFMPEG_BINARY"]
+    videos = args.videos if shutil.which(ffmpeg) else 0
+    if args.videos and not videos:
+        print(f"{ffmpeg} not found: seeding images only")
+
+    with app.app_context():
+        start = time.perf_counter()
+        db.drop_all()
+        db.create_all()
+        gamerhub.search.ensure_schema()
+
+        # One hash for everybody: bcrypt at the configured cost, made once
+        hashed = gamerhub.passwords.hash(PASSWORD)
+        users = [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "password": hashed,
+             "bio": " ".join(rng.choices(WORDS, k=rng.randint(0, 8))) or "I'm a gamer!",
+             "avatar": "default-avatar.png", "xp": int(rng.paretovariate(1.2) * 10)}
+            for i in range(1, args.users + 1)
+        ]
+        stats = [
+            {"user_id": u["id"], "game": game, "plays": 10, "wins": rng.randint(0, 10),
+             "best_score": rng.randint(0, 5000) if game == "candy" else 0, "xp": 0, "updated_at": datetime.utcnow()}
+            for u in users if rng.random() < 0.3 for game in gamerhub.GAMES
+        ]
+        with db.engine.begin() as conn:
+            for i in range(0, len(users), 10000):
+                conn.execute(gamerhub.User.__table__.insert(), users[i:i + 10000])
+            for i in range(0, len(stats), 10000):
+                conn.execute(gamerhub.GameStat.__table__.insert(), stats[i:i + 10000])
+        print(f"seeded {len(users)} users in {time.perf_counter() - start:.1f}s")
+
+        # Distinct files, each shared by several uploads once there are more uploads than files
+        start = time.perf_counter()
+        n_videos = round(args.uploads * args.video_share) if videos else 0
+        media = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for n in range(min(args.distinct_images, args.uploads - n_videos)):
+                path = os.path.join(tmp, f"img{n}.jpg")
+                with open(path, "wb") as fh:
+                    fh.write(make_image(rng))
+                media.append(("image", ".jpg", path))
+            for n in range(min(videos, n_videos)):
+                path = os.path.join(tmp, f"clip{n}.mp4")
+                make_video(path, n, ffmpeg)
+                media.append(("video", ".mp4", path))
+
+            stored = {"image": [], "video": []}
+            for filetype, ext, path in media:
+                digest = hash_file(path).hexdigest()
+                name = storage.put(path, content_key(digest, ext))
+                with storage.workspace(name) as folder:
+                    derived = process_media(folder, name, filetype, ffmpeg)
+                stored[filetype].append(dict(derived, filename=name, content_hash=digest))
+
+        now = datetime.utcnow()
+        rows, refs = [], Counter()
+        for i in range(args.uploads):
+            filetype = "video" if i < n_videos else "image"
+            blob = rng.choice(stored[filetype])
+            refs[blob["filename"]] += 1
+            rows.append(dict(
+                blob, filetype=filetype, user_id=rng.randint(1, args.users),
+                original_name="_".join(rng.choices(WORDS, k=rng.randint(1, 3))) + (".mp4" if filetype == "video" else ".jpg"),
+                created_at=now - timedelta(seconds=rng.randint(0, 30 * 86400)),
+                views=int(rng.paretovariate(1.1) * 5), likes=int(rng.paretovariate(1.3)),
+            ))
+        rows.sort(key=lambda r: r["created_at"])
+        with db.engine.begin() as conn:
+            for i in range(0, len(rows), 10000):
+                conn.execute(gamerhub.Upload.__table__.insert(), rows[i:i + 10000])
+        for name, n in refs.items():
+            storage.retain(name, n - 1)  # put() counted the first
+        for blob in stored["video"]:
+            gamerhub.transcode_video(blob["filename"])
+
+        # Bulk rows skip the events that normally feed the search index
+        gamerhub.search.rebuild()
+        if db.engine.dialect.name in ("sqlite", "postgresql"):
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql("ANALYZE")
+        print(f"seeded {len(rows)} uploads ({len(media)} distinct files) in {time.perf_counter() - start:.1f}s")
+
+
+def load_fixture(gamerhub):
+    """What the virtual users pick from: user names and upload ids/files, read from the database."""
+    Upload, User = gamerhub.Upload, gamerhub.User
+    with gamerhub.app.app_context():
+        usernames = [name for (name,) in User.query.with_entities(User.username).filter(
+            User.username.like("user%")).order_by(User.id).limit(100000)]
+        uploads = [
+            {"id": u.id, "filename": u.filename, "filetype": u.filetype,
+             "thumbnail": u.thumbnail, "hls_playlist": u.hls_playlist, "views": u.views}
+            for u in Upload.query.with_entities(
+                Upload.id, Upload.filename, Upload.filetype, Upload.thumbnail, Upload.hls_playlist, Upload.views
+            ).order_by(Upload.id.desc()).limit(100000)
+        ]
+    if not usernames or not uploads:
+        raise SystemExit("The database has no seeded users or uploads; run without --no-seed first")
+    hot = sorted(uploads, key=lambda u: -(u["views"] or 0))[:20]
+    with gamerhub.app.app_context():
+        reset_tokens = [
+            gamerhub.serializer().dumps(f"{name}@example.com", salt="password-reset-salt") for name in usernames[:100]
+        ]
+    return {"usernames": usernames, "uploads": uploads, "hot": hot, "reset_tokens": reset_tokens}
+
+
+# ---------- HTTP client ----------
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("closed")
+    status = int(status_line.split()[1])
+    headers = []
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin1").partition(":")
+        headers.append((name.strip().lower(), value.strip()))
+    fields = dict(headers)
+    keep_alive = fields.get("connection", "").lower() != "close"
+
+    if "content-length" in fields:
+        body = await reader.readexactly(int(fields["content-length"]))
+    elif fields.get("transfer-encoding", "").lower() == "chunked":
+        parts = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if not size:
+                await reader.readline()
+                break
+            parts.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(parts)
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return status, headers, body, keep_alive
+
+
+class Client:
+    """A keep-alive connection with a cookie jar, seen by the app as coming from `ip`."""
+
+    def __init__(self, port, ip):
+        self.port = port
+        self.ip = ip
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b"", content_type=None, headers=None):
+        for attempt in (1, 2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+            lines = [
+                f"{method} {path} HTTP/1.1",
+                f"Host: 127.0.0.1:{self.port}",
+                f"X-Forwarded-For: {self.ip}",
+                f"Content-Length: {len(body)}",
+            ]
+            if content_type:
+                lines.append(f"Content-Type: {content_type}")
+            if self.cookies:
+                lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+            lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+            try:
+                self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin1") + body)
+                status, response_headers, data, keep_alive = await read_response(self.reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if reused and attempt == 1:
+                    continue  # the server closed an idle keep-alive connection
+                raise
+            break
+        for name, value in response_headers:
+            if name == "set-cookie":
+                cookie, _, attrs = value.partition(";")
+                key, _, val = cookie.partition("=")
+                if val and "max-age=0" not in attrs.lower():
+                    self.cookies[key.strip()] = val.strip()
+                else:
+                    self.cookies.pop(key.strip(), None)
+        if not keep_alive:
+            self.close()
+        return status, dict(response_headers), data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def multipart(field, filename, data, content_type="application/octet-stream"):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+# ---------- virtual users ----------
+class Recorder:
+    """Latencies and outcomes per route ("GET social.gallery"), for the requests made while `recording`."""
+
+    def __init__(self):
+        self.recording = False
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def add(self, route, seconds, status, ok):
+        if not self.recording:
+            return
+        self.latencies[route].append(seconds)
+        self.statuses[route][str(status)] += 1
+        if not ok:
+            self.errors[route] += 1
+
+
+class VirtualUser:
+    def __init__(self, port, recorder, fixture, rng, images):
+        self.port = port
+        self.recorder = recorder
+        self.fixture = fixture
+        self.rng = rng
+        self.images = images
+        self.client = Client(port, self.new_ip())
+        self.username = None
+        self.own_uploads = []
+
+    def new_ip(self):
+        return f"10.{self.rng.randint(0, 255)}.{self.rng.randint(0, 255)}.{self.rng.randint(1, 254)}"
+
+    async def call(self, endpoint, method, path, ok=(200,), **kwargs):
+        """One timed request. Returns (status, headers, body), or None when it failed outright."""
+        route = f"{method} {endpoint}"
+        start = time.perf_counter()
+        try:
+            status, headers, body = await self.client.request(method, path, **kwargs)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.recorder.add(route, time.perf_counter() - start, "error", False)
+            return None
+        self.recorder.add(route, time.perf_counter() - start, status, status in ok)
+        return status, headers, body
+
+    async def call_json(self, endpoint, method, path, ok=(200,), **kwargs):
+        result = await self.call(endpoint, method, path, ok, **kwargs)
+        if result is None or result[0] not in ok:
+            return None
+        try:
+            return json.loads(result[2])
+        except ValueError:
+            return None
+
+    def upload(self):
+        return self.rng.choice(self.fixture["uploads"])
+
+    def anonymous(self):
+        """Becomes a new visitor: no cookies, another IP."""
+        self.client.close()
+        self.client = Client(self.port, self.new_ip())
+        self.username = None
+        self.own_uploads = []
+
+    async def ensure_login(self):
+        if self.username:
+            return True
+        return await self.login()
+
+    async def login(self):
+        self.client.ip = self.new_ip()  # login limits are per IP, as for real visitors
+        username = self.rng.choice(self.fixture["usernames"])
+        body = urlencode({"username": username, "password": PASSWORD}).encode()
+        result = await self.call("auth.login", "POST", "/login", ok=(302,), body=body,
+                                 content_type="application/x-www-form-urlencoded")
+        if result is None or result[0] != 302 or "/dashboard" not in result[1].get("location", ""):
+            return False
+        self.username = username
+        return True
+
+    # ----- anonymous browsing -----
+    async def home(self):
+        await self.call("social.index", "GET", "/")
+
+    async def gallery(self):
+        sort = self.rng.choice(["new", "new", "trending", "top_day", "top_week"])
+        await self.call("social.gallery", "GET", "/gallery" + (f"?sort={sort}" if sort != "new" else ""))
+        # Scrolling down: the next pages come from the JSON feed
+        page = await self.call_json("social.api_uploads", "GET", f"/api/uploads?sort={sort}")
+        for _ in range(self.rng.randint(0, 3)):
+            if not page or not page.get("next_cursor"):
+                break
+            page = await self.call_json("social.api_uploads", "GET", f"/api/uploads?sort={sort}&after={page['next_cursor']}")
+
+    async def watch(self):
+        upload = self.upload()
+        await self.call("social.view_upload", "GET", f"/view/{upload['id']}")
+        if upload["thumbnail"]:
+            await self.call("media.media", "GET", f"/media/{upload['thumbnail']}")
+        await self.call("social.api_increment_view", "POST", f"/view/{upload['id']}")
+        if upload["hls_playlist"]:
+            await self.play_hls(upload["hls_playlist"])
+        else:
+            await self.call("media.media", "GET", f"/media/{upload['filename']}")
+
+    async def play_hls(self, playlist):
+        """Master playlist, the first variant's playlist and its first few segments."""
+        result = await self.call("media.media", "GET", f"/media/{playlist}")
+        variants = [line for line in (result[2].decode().splitlines() if result else []) if line and not line.startswith("#")]
+        if not variants:
+            return
+        base = playlist.rsplit("/", 1)[0]
+        variant = f"{base}/{variants[0]}"
+        result = await self.call("media.media", "GET", f"/media/{variant}")
+        segments = [line for line in (result[2].decode().splitlines() if result else []) if line and not line.startswith("#")]
+        for segment in segments[:3]:
+            await self.call("media.media", "GET", f"/media/{variant.rsplit('/', 1)[0]}/{segment}")
+
+    async def people(self):
+        await self.call("profile.profile", "GET", f"/profile/{self.rng.choice(self.fixture['usernames'])}")
+        if self.rng.random() < 0.2:
+            await self.call("social.users", "GET", "/users")
+
+    async def search(self):
+        word = self.rng.choice(WORDS)
+        for n in range(1, min(len(word), 4) + 1):
+            # Typing, one autocomplete request per key
+            await self.call("social.api_autocomplete", "GET", f"/api/search/autocomplete?q={word[:n]}")
+        if self.rng.random() < 0.5:
+            await self.call("social.search_page", "GET", f"/search?q={word}")
+        else:
+            await self.call("social.api_search", "GET", f"/api/search?q={word}")
+
+    async def leaderboards(self):
+        board = self.rng.choice(["xp", "candy", "pool", "tic_tac_toe"])
+        if self.rng.random() < 0.5:
+            await self.call("social.leaderboard", "GET", f"/leaderboard/{board}")
+        else:
+            await self.call("social.api_leaderboard", "GET", f"/api/leaderboard/{board}?offset={self.rng.choice([0, 0, 50, 500])}")
+
+    # ----- engagement -----
+    async def view_storm(self):
+        upload = self.rng.choice(self.fixture["hot"])
+        await self.call("social.api_increment_view", "POST", f"/view/{upload['id']}")
+
+    async def like_storm(self):
+        self.anonymous()
+        upload = self.rng.choice(self.fixture["hot"])
+        await self.call("social.like_upload", "POST", f"/like/{upload['id']}")
+
+    # ----- accounts -----
+    async def login_burst(self):
+        self.anonymous()
+        await self.call("auth.login", "GET", "/login")
+        if await self.login():
+            await self.call("profile.dashboard", "GET", "/dashboard")
+            await self.call("auth.logout", "GET", "/logout", ok=(302,))
+            self.username = None
+
+    async def sign_up(self):
+        self.anonymous()
+        name = f"new_{uuid.uuid4().hex[:12]}"
+        body = urlencode({"username": name, "email": f"{name}@example.com", "password": PASSWORD}).encode()
+        await self.call("auth.register", "POST", "/register", ok=(302,), body=body,
+                        content_type="application/x-www-form-urlencoded")
+
+    async def reset_password(self):
+        await self.call("auth.forgot_password", "GET", "/forgot_password")
+        body = urlencode({"email": f"{self.rng.choice(self.fixture['usernames'])}@example.com"}).encode()
+        result = await self.call("auth.forgot_password", "POST", "/forgot_password", body=body,
+                                 content_type="application/x-www-form-urlencoded")
+        if result:
+            # The link from the mail; the form is only shown, a new password would break later logins
+            await self.call("auth.reset_password", "GET", f"/reset_password/{self.rng.choice(self.fixture['reset_tokens'])}")
+
+    # ----- signed-in users -----
+    async def post_upload(self):
+        if not await self.ensure_login():
+            return
+        await self.call("media.upload_file", "GET", "/upload")
+        body, content_type = multipart("file", f"{self.rng.choice(WORDS)}.jpg", self.rng.choice(self.images), "image/jpeg")
+        await self.call("media.upload_file", "POST", "/upload", ok=(302,), body=body, content_type=content_type)
+        await self.call("profile.dashboard", "GET", "/dashboard")
+
+    async def chunked_upload(self):
+        if not await self.ensure_login():
+            return
+        data = self.rng.choice(self.images)
+        started = await self.call_json("media.start_upload_session", "POST", "/api/upload-sessions", ok=(201,),
+                                       body=json.dumps({"filename": f"{self.rng.choice(WORDS)}.jpg", "size": len(data)}).encode(),
+                                       content_type="application/json")
+        if not started:
+            return
+        token, chunk = started["token"], max(1, min(started["chunk_size"], len(data) // 2 or 1))
+        for offset in range(0, len(data), chunk):
+            if not await self.call_json("media.upload_session_chunk", "PUT", f"/api/upload-sessions/{token}",
+                                        body=data[offset:offset + chunk], content_type="application/offset+octet-stream",
+                                        headers={"Upload-Offset": str(offset)}):
+                return
+        await self.call("media.upload_session_status", "GET", f"/api/upload-sessions/{token}")
+        done = await self.call_json("media.finalize_upload_session", "POST", f"/api/upload-sessions/{token}/finalize", ok=(201,))
+        if done:
+            self.own_uploads.append(done["id"])
+
+    async def delete_own_upload(self):
+        if self.own_uploads and self.username:
+            await self.call("media.delete_upload", "POST", f"/delete/{self.own_uploads.pop(0)}", ok=(302,))
+
+    async def edit_profile(self):
+        if not await self.ensure_login():
+            return
+        if self.rng.random() < 0.5:
+            body, content_type = multipart("avatar", "me.jpg", self.rng.choice(self.images), "image/jpeg")
+            await self.call("profile.upload_avatar", "POST", "/upload_avatar", ok=(302,), body=body, content_type=content_type)
+        else:
+            body = urlencode({"bio": " ".join(self.rng.choices(WORDS, k=5))}).encode()
+            await self.call("profile.profile", "POST", f"/profile/{self.username}", ok=(302,), body=body,
+                            content_type="application/x-www-form-urlencoded")
+        await self.call("profile.profile", "GET", f"/profile/{self.username}")
+        await self.call("auth.change_password", "GET", "/change_password")
+        await self.call("profile.change_username", "GET", "/change_username")
+
+    async def play_game(self):
+        if not await self.ensure_login():
+            return
+        started = await self.call_json("social.start_game", "POST", "/api/games/tic_tac_toe/sessions", ok=(201,),
+                                       body=b"{}", content_type="application/json")
+        if not started:
+            return
+        await asyncio.sleep(3.2)  # tic-tac-toe games shorter than 3s are rejected
+        result = self.rng.choice(["win", "lose", "draw"])
+        await self.call("social.submit_score", "POST", "/api/games/tic_tac_toe/scores", ok=(200, 429),
+                        body=json.dumps({"token": started["token"], "score": 0, "result": result}).encode(),
+                        content_type="application/json")
+
+
+# (weight, action) per scenario
+MIXES = {
+    "browse": [
+        (10, VirtualUser.home), (25, VirtualUser.gallery), (30, VirtualUser.watch),
+        (15, VirtualUser.people), (12, VirtualUser.search), (8, VirtualUser.leaderboards),
+    ],
+    "engage": [(60, VirtualUser.view_storm), (40, VirtualUser.like_storm)],
+    "login": [(80, VirtualUser.login_burst), (10, VirtualUser.sign_up), (10, VirtualUser.reset_password)],
+    "upload": [
+        (35, VirtualUser.post_upload), (25, VirtualUser.chunked_upload), (15, VirtualUser.delete_own_upload),
+        (15, VirtualUser.edit_profile), (10, VirtualUser.play_game),
+    ],
+}
+MIXES["mixed"] = (
+    [(w * 6, a) for w, a in MIXES["browse"]] + [(w * 2, a) for w, a in MIXES["engage"]]
+    + [(w // 2, a) for w, a in MIXES["login"]] + [(w // 2, a) for w, a in MIXES["upload"]]
+)
+
+
+async def virtual_user(vu, mix, deadline, think):
+    actions, weights = zip(*[(a, w) for w, a in mix if w])
+    while time.monotonic() < deadline:
+        await vu.rng.choices(actions, weights)[0](vu)
+        if think:
+            await asyncio.sleep(vu.rng.expovariate(1 / think))
+    vu.client.close()
+
+
+# ---------- server memory ----------
+def process_tree(pid):
+    """`pid` and all its descendants, from /proc."""
+    parents = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as fh:
+                    ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            parents[ppid].append(int(entry))
+    tree, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        tree.append(p)
+        todo += parents.get(p, [])
+    return tree
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+async def sample_rss(pids, peak, interval=0.25):
+    """Keeps `peak["total"]`, the most the server processes used together, up to date."""
+    while True:
+        total = sum(rss_bytes(p) for pid in pids for p in process_tree(pid))
+        peak["total"] = max(peak.get("total", 0), total)
+        await asyncio.sleep(interval)
+
+
+def route_rss(metrics_dir):
+    """Largest worker RSS after each route's requests, from the snapshots the workers wrote (see metrics.py)."""
+    peaks = {}
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        with open(path) as fh:
+            for name, labels, series in json.load(fh):
+                if name == "process_peak_rss_bytes":
+                    fields = dict(labels)
+                    route = f"{fields['method']} {fields['endpoint']}"
+                    peaks[route] = max(peaks.get(route, 0), series[0])
+    return peaks
+
+
+# ---------- running ----------
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run_scenario(name, args, port, fixture, images, pids):
+    recorder = Recorder()
+    rng = random.Random(f"{args.seed}-{name}")
+    users = [VirtualUser(port, recorder, fixture, random.Random(rng.random()), images) for _ in range(args.concurrency)]
+    peak = {}
+    sampler = asyncio.ensure_future(sample_rss(pids, peak))
+    try:
+        # Warm-up: fill caches and connection pools, then start counting
+        deadline = time.monotonic() + args.warmup
+        await asyncio.gather(*(virtual_user(vu, MIXES[name], deadline, args.think) for vu in users))
+        recorder.recording = True
+        peak.clear()
+        start = time.monotonic()
+        await asyncio.gather(*(virtual_user(vu, MIXES[name], start + args.duration, args.think) for vu in users))
+        elapsed = time.monotonic() - start
+    finally:
+        sampler.cancel()
+    return recorder, elapsed, peak.get("total", 0)
+
+
+def summarize(recorder, elapsed, server_peak, rss):
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        ordered = sorted(latencies)
+        routes[route] = {
+            "requests": len(ordered),
+            "errors": recorder.errors[route],
+            "statuses": dict(recorder.statuses[route]),
+            "rps": round(len(ordered) / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+            "peak_rss_mb": round(rss[route] / 2 ** 20, 1) if route in rss else None,
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "errors": sum(r["errors"] for r in routes.values()),
+        "rps": round(total / elapsed, 2),
+        "server_peak_rss_mb": round(server_peak / 2 ** 20, 1),
+        "routes": routes,
+    }
+
+
+def print_scenario(name, result):
+    print(f"\n== {name}: {result['requests']} requests, {result['rps']:.0f} req/s, "
+          f"{result['errors']} errors, server peak RSS {result['server_peak_rss_mb']:.0f} MB")
+    print(f"{'route':<34} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>7}")
+    for route, r in result["routes"].items():
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+        print(f"{route:<34} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {rss:>7}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold, min_requests):
+    """
+    Prints every route's change from `baseline` to `current` and flags
+    regressions past `threshold` (0.2 = 20%) in p95 latency, throughput or
+    peak RSS. Routes with fewer than `min_requests` requests are too noisy
+    to flag. Returns: the number of regressions.
+    """
+    print(f"\nbaseline {(baseline['meta'].get('commit') or '?')[:10]}  ->  current {(current['meta'].get('commit') or '?')[:10]}")
+    print(f"{'scenario / route':<44} {'p95 ms':>17} {'req/s':>17} {'RSS MB':>13}")
+    regressions = 0
+    for scenario, result in current["scenarios"].items():
+        old_routes = baseline["scenarios"].get(scenario, {}).get("routes", {})
+        for route, new in result["routes"].items():
+            old = old_routes.get(route)
+            if old is None:
+                print(f"{scenario + ' ' + route:<44} {'(new)':>17}")
+                continue
+            flags = []
+            if min(old["requests"], new["requests"]) >= min_requests:
+                if new["p95_ms"] > old["p95_ms"] * (1 + threshold):
+                    flags.append("slower")
+                if new["rps"] < old["rps"] * (1 - threshold):
+                    flags.append("less throughput")
+            if old["peak_rss_mb"] and new["peak_rss_mb"] and new["peak_rss_mb"] > old["peak_rss_mb"] * (1 + threshold):
+                flags.append("more memory")
+            regressions += bool(flags)
+            print(f"{scenario + ' ' + route:<44} {old['p95_ms']:>7.1f} -> {new['p95_ms']:<7.1f} "
+                  f"{old['rps']:>7.1f} -> {new['rps']:<7.1f} {old['peak_rss_mb'] or 0:>5.0f} -> {new['peak_rss_mb'] or 0:<5.0f}"
+                  + ("  << " + ", ".join(flags) if flags else ""))
+        if result["server_peak_rss_mb"] > baseline["scenarios"].get(scenario, {}).get("server_peak_rss_mb", float("inf")) * (1 + threshold):
+            print(f"{scenario + ' (whole server)':<44} peak RSS {baseline['scenarios'][scenario]['server_peak_rss_mb']:.0f} "
+                  f"-> {result['server_peak_rss_mb']:.0f} MB  << more memory")
+            regressions += 1
+    print(f"\n{regressions} regression(s) past {threshold:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--uploads", type=int, default=2000)
+    parser.add_argument("--distinct-images", type=int, default=300, help="image files shared by the seeded uploads")
+    parser.add_argument("--videos", type=int, default=3, help="video files shared by the seeded video uploads")
+    parser.add_argument("--video-share", type=float, default=0.2)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the database from an earlier run")
+    parser.add_argument("--database-url", default=os.environ["DATABASE_URL"])
+    parser.add_argument("--mode", choices=sorted(SERVERS), default="sync")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds run before measuring")
+    parser.add_argument("--think", type=float, default=0, help="mean pause between a user's actions, seconds")
+    parser.add_argument("--job-worker", action="store_true", help="also run worker.py, so uploads get thumbnails")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--compare", nargs="+", metavar="JSON",
+                        help="BASELINE: compare this run with it; BASELINE CURRENT: only compare two saved runs")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--min-requests", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            sys.exit(1 if compare(json.load(a), json.load(b), args.threshold, args.min_requests) else 0)
+
+    # The server and job worker inherit these; state files stay out of the real temp paths
+    run_dir = tempfile.mkdtemp(prefix="gamerhub-load-")
+    atexit.register(shutil.rmtree, run_dir, ignore_errors=True)  # after the app's own exit hooks
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["LEADERBOARD_SNAPSHOT_PATH"] = os.path.join(run_dir, "leaderboards.json.gz")
+    os.environ["CACHE_DIR"] = os.path.join(run_dir, "cache")
+    os.environ["METRICS_DIR"] = os.path.join(run_dir, "metrics-seed")
+    if args.database_url.startswith("sqlite:///") and not args.no_seed and os.path.exists(args.database_url[10:]):
+        os.remove(args.database_url[10:])
+    os.chdir(ROOT)  # UPLOAD_FOLDER is relative
+    import app as gamerhub  # noqa: E402  (reads DATABASE_URL at import)
+
+    rng = random.Random(args.seed)
+    if not args.no_seed:
+        seed(gamerhub, args, rng)
+    fixture = load_fixture(gamerhub)
+    with gamerhub.app.app_context():
+        database = gamerhub.db.engine.dialect.name
+        gamerhub.db.engine.dispose()  # the server gets the database to itself
+    images = [make_image(rng, size=(800, 600)) for _ in range(50)]
+    raise_file_limit()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "database": database,
+            "users": len(fixture["usernames"]),
+            "uploads": len(fixture["uploads"]),
+            **{k: getattr(args, k) for k in ("mode", "workers", "concurrency", "duration", "warmup", "think", "job_worker")},
+        },
+        "scenarios": {},
+    }
+    for name in args.scenario:
+        # A fresh server and metrics per scenario, so memory peaks are the scenario's own
+        metrics_dir = os.environ["METRICS_DIR"] = os.path.join(run_dir, f"metrics-{name}")
+        server = start_server(args.mode, args.port, args.workers)
+        worker = subprocess.Popen([sys.executable, "worker.py"], cwd=ROOT) if args.job_worker else None
+        try:
+            pids = [server.pid] + ([worker.pid] if worker else [])
+            recorder, elapsed, server_peak = asyncio.run(run_scenario(name, args, args.port, fixture, images, pids))
+        finally:
+            if worker:
+                worker.terminate()
+                worker.wait()
+            stop_server(server)  # workers write their final metrics snapshot as they exit
+        result = results["scenarios"][name] = summarize(recorder, elapsed, server_peak, route_rss(metrics_dir))
+        print_scenario(name, result)
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        with open(args.compare[0]) as fh:
+            sys.exit(1 if compare(json.load(fh), results, args.threshold, args.min_requests) else 0)
+
+
+if __name__ == "__main__":
+    main()
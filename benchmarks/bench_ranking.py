@@ -0,0 +1,49 @@
+"""
+Times the in-memory ranking structure as the number of ranked uploads grows:
+recording a counted view/like, reading a gallery page, and the full rebuild
+done once an hour on each worker's background thread.
+
+    python benchmarks/bench_ranking.py --uploads 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ranking import TopK  # noqa: E402
+
+
+def per_op_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--top-k", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'uploads':>9}  {'record us':>9}  {'page us':>8}  {'rebuild ms':>10}")
+    for n in args.uploads:
+        # Long-tailed popularity, like real traffic
+        scores = {i: random.paretovariate(1.2) for i in range(1, n + 1)}
+        top = TopK(args.top_k)
+
+        start = time.perf_counter()
+        top.rebuild(scores)
+        rebuild_ms = (time.perf_counter() - start) * 1000
+
+        record = per_op_us(lambda: top.add(random.randint(1, n), 1.0), args.repeat)
+        page = per_op_us(lambda: top.page(random.randrange(0, args.top_k - 24), 24), args.repeat)
+        print(f"{n:>9}  {record:>9.2f}  {page:>8.2f}  {rebuild_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
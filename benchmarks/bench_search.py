@@ -0,0 +1,124 @@
+"""
+Times search as the number of users grows: username autocomplete for short
+and long prefixes, and full-text search over bios and upload names.
+Autocomplete results are checked against a plain sorted list of names.
+
+Runs against the app's own models and indexes in a scratch database (SQLite
+by default; pass a PostgreSQL URL to time that backend). Existing rows are
+deleted first, so never point it at real data.
+
+    python benchmarks/bench_search.py --users 10000 100000 1000000
+    python benchmarks/bench_search.py --database-url postgresql://localhost/bench
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "dark knight shadow pixel ninja dragon storm wolf fire ice gamer pro noob legend "
+    "sniper speed runner candy pool chess master ghost blade star moon sun rocket"
+).split()
+
+
+def random_name(rng):
+    style = rng.random()
+    if style < 0.4:
+        return rng.choice(WORDS) + rng.choice(["_", "", "-"]) + rng.choice(WORDS) + str(rng.randint(0, 9999))
+    if style < 0.7:
+        return rng.choice(WORDS).capitalize() + str(rng.randint(0, 99999))
+    return "".join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(4, 14)))
+
+
+def timed_ms(fn, args_list):
+    times = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--uploads-per-user", type=float, default=0.5)
+    parser.add_argument("--database-url", default="sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_search.db"))
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    if args.database_url.startswith("sqlite:///") and os.path.exists(args.database_url[10:]):
+        os.remove(args.database_url[10:])
+    import app as gamerhub  # noqa: E402  (reads DATABASE_URL at import)
+
+    db, search = gamerhub.db, gamerhub.search
+    users_t, uploads_t = gamerhub.User.__table__, gamerhub.Upload.__table__
+    rng = random.Random(42)
+    names, seen = [], set()
+
+    with gamerhub.app.app_context():
+        db.create_all()
+        search.ensure_schema()
+        with db.engine.begin() as conn:
+            conn.execute(uploads_t.delete())
+            conn.execute(users_t.delete())
+
+        print(f"{'users':>8}  {'index s':>7}  {'ac-1 p50/p99 ms':>15}  {'ac-3 p50/p99 ms':>15}  "
+              f"{'users p50/p99 ms':>16}  {'uploads p50/p99 ms':>18}")
+        for n in args.users:
+            batch_users, batch_uploads = [], []
+            while len(names) < n:
+                name = random_name(rng)
+                if name.lower() in seen:
+                    continue
+                seen.add(name.lower())
+                names.append(name)
+                uid = len(names)
+                bio = " ".join(rng.choices(WORDS, k=rng.randint(0, 8))) or "I'm a gamer!"
+                batch_users.append({"id": uid, "username": name, "email": f"u{uid}@example.com",
+                                    "password": "x", "bio": bio, "avatar": None, "xp": 0})
+                if rng.random() < args.uploads_per_user:
+                    words = "_".join(rng.choices(WORDS, k=rng.randint(1, 3)))
+                    batch_uploads.append({"filename": f"{rng.getrandbits(256):064x}.mp4", "original_name": f"{words}.mp4",
+                                          "filetype": "video", "user_id": uid, "views": 0, "likes": 0})
+
+            start = time.perf_counter()
+            with db.engine.begin() as conn:
+                for i in range(0, len(batch_users), 10000):
+                    conn.execute(users_t.insert(), batch_users[i:i + 10000])
+                for i in range(0, len(batch_uploads), 10000):
+                    conn.execute(uploads_t.insert(), batch_uploads[i:i + 10000])
+            # SQLite's FTS5 tables are normally fed row by row from events; bulk rows need a rebuild
+            search.rebuild()
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql("ANALYZE")
+            index_s = time.perf_counter() - start
+
+            ordered = sorted(name.lower() for name in names)
+            short = [(rng.choice(string.ascii_lowercase),) for _ in range(args.queries)]
+            longer = [(rng.choice(names)[:3],) for _ in range(args.queries)]
+            for (prefix,) in short[:20] + longer[:20]:
+                got = [u["username"].lower() for u in search.autocomplete(prefix)]
+                expected = [s for s in ordered if s.startswith(prefix.lower())][:len(got) or 10]
+                assert got == expected, (prefix, got, expected)
+
+            ac1 = timed_ms(search.autocomplete, short)
+            ac3 = timed_ms(search.autocomplete, longer)
+            queries = [(" ".join(rng.choices(WORDS, k=rng.randint(1, 2)))[:-1],) for _ in range(args.queries // 5)]
+            users_q = timed_ms(lambda q: search.search("users", q), queries)
+            uploads_q = timed_ms(lambda q: search.search("uploads", q), queries)
+
+            print(f"{n:>8}  {index_s:>7.1f}  {ac1[0]:>7.2f}/{ac1[1]:<7.2f}  {ac3[0]:>7.2f}/{ac3[1]:<7.2f}  "
+                  f"{users_q[0]:>8.2f}/{users_q[1]:<7.2f}  {uploads_q[0]:>9.2f}/{uploads_q[1]:<8.2f}")
+
+
+if __name__ == "__main__":
+    main()
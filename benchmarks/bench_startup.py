@@ -0,0 +1,208 @@
+"""
+Measures how long the app takes to start, each time in a fresh interpreter:
+
+    import   `import app` (split into its dependencies, flask/sqlalchemy,
+             and the app itself); also checked against a database that is
+             not reachable, which must not matter until the first request
+    request  the first request to each --paths entry right after the
+             import (the cost of whatever is set up lazily on first use:
+             connections, threads, folders) next to the warm median
+    server   for each serving mode, gunicorn with and without preload
+             (gunicorn.conf.py, GUNICORN_PRELOAD): time from launch to the
+             first 200, then the RSS and PSS (shared pages split between the
+             processes sharing them) of the master and every worker once
+             each has served requests
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --paths / /gallery --workers 8 --mode sync async
+
+Without DATABASE_URL a throwaway SQLite file in the temp directory is used;
+it is recreated with `flask init-db`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.gettempdir(), "gamerhub_startup.db")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_concurrency import SERVERS, stop_server  # noqa: E402
+
+PATHS = ["/", "/gallery", "/api/uploads", "/users", "/leaderboard", "/search?q=a", "/login"]
+
+UNREACHABLE_DB = "postgresql://bench@127.0.0.1:9/bench?sslmode=disable&connect_timeout=1"
+
+# Runs in the fresh interpreter; prints one JSON line
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import flask, flask_sqlalchemy, sqlalchemy
+t1 = time.perf_counter()
+import app
+t2 = time.perf_counter()
+result = {"deps_ms": (t1 - t0) * 1000, "app_ms": (t2 - t1) * 1000}
+path, warm = sys.argv[1], int(sys.argv[2])
+if path:
+    client = app.app.test_client()
+    timings = []
+    for _ in range(1 + warm):
+        start = time.perf_counter()
+        status = client.get(path).status_code
+        timings.append((time.perf_counter() - start) * 1000)
+    result.update(status=status, first_ms=timings[0], warm_ms=sorted(timings[1:])[len(timings[1:]) // 2])
+print(json.dumps(result))
+"""
+
+
+def probe(path="", warm=0, env=None):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, path, str(warm)], cwd=ROOT, env={**os.environ, **(env or {})},
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def init_db():
+    url = os.environ["DATABASE_URL"]
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        if os.path.exists(path):
+            os.remove(path)
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+# ---------- server ----------
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as fh:
+            return [int(p) for p in fh.read().split()]
+    except OSError:
+        return []
+
+
+def memory_kib(pid):
+    """(RSS, PSS) in KiB, from /proc."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as fh:
+            for line in fh:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values.get("Rss", 0), values.get("Pss", 0)
+
+
+def get(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        resp.read()
+        return resp.status
+
+
+def time_to_first_200(mode, preload, workers, port, path, requests):
+    env = {**os.environ, "GUNICORN_PRELOAD": "1" if preload else "0"}
+    cmd = SERVERS[mode] + ["-w", str(workers), "-b", f"127.0.0.1:{port}"]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}{path}"
+        deadline = time.time() + 60
+        while True:
+            try:
+                if get(url) == 200:
+                    break
+            except OSError:
+                pass
+            if proc.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"server did not start: {' '.join(cmd)}")
+            time.sleep(0.01)
+        ready_ms = (time.perf_counter() - start) * 1000
+
+        # Let every worker get past its own first request before looking at memory
+        for _ in range(requests):
+            get(url)
+        time.sleep(0.5)
+        workers_mem = [memory_kib(pid) for pid in children(proc.pid)]
+        master_rss, master_pss = memory_kib(proc.pid)
+        return {
+            "ready_ms": ready_ms,
+            "master_rss_kib": master_rss,
+            "worker_rss_kib": statistics.mean(rss for rss, _ in workers_mem) if workers_mem else 0,
+            "worker_pss_kib": statistics.mean(pss for _, pss in workers_mem) if workers_mem else 0,
+            "total_pss_kib": master_pss + sum(pss for _, pss in workers_mem),
+        }
+    finally:
+        stop_server(proc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--paths", nargs="+", default=PATHS)
+    parser.add_argument("--warm", type=int, default=20, help="requests after the first, for the warm median")
+    parser.add_argument("--mode", nargs="+", choices=sorted(SERVERS), default=["sync"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--server-requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--no-server", action="store_true", help="skip the gunicorn measurements")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    init_db()
+    results = {"import": {}, "request": {}, "server": {}}
+
+    print("cold import (median of %d)" % args.runs)
+    for label, env in (("default", None), ("unreachable db", {"DATABASE_URL": UNREACHABLE_DB})):
+        runs = [probe(env=env) for _ in range(args.runs)]
+        row = {key: statistics.median(r[key] for r in runs) for key in ("deps_ms", "app_ms")}
+        results["import"][label] = row
+        print(f"  {label:<15} deps {row['deps_ms']:7.1f} ms   app {row['app_ms']:7.1f} ms   "
+              f"total {row['deps_ms'] + row['app_ms']:7.1f} ms")
+
+    print(f"\nfirst request after import (median of {args.runs})")
+    print(f"  {'path':<20} {'status':>6} {'first ms':>9} {'warm ms':>8}")
+    for path in args.paths:
+        runs = [probe(path, args.warm) for _ in range(args.runs)]
+        row = {
+            "status": runs[-1]["status"],
+            "first_ms": statistics.median(r["first_ms"] for r in runs),
+            "warm_ms": statistics.median(r["warm_ms"] for r in runs),
+        }
+        results["request"][path] = row
+        print(f"  {path:<20} {row['status']:>6} {row['first_ms']:>9.1f} {row['warm_ms']:>8.2f}")
+
+    if not args.no_server:
+        print(f"\ngunicorn, {args.workers} workers (median of {args.runs} launches)")
+        print(f"  {'mode':<6} {'preload':<8} {'first 200 ms':>12} {'master RSS':>11} {'worker RSS':>11} "
+              f"{'worker PSS':>11} {'total PSS':>10}  (MiB)")
+        for mode in args.mode:
+            for preload in (False, True):
+                runs = [
+                    time_to_first_200(mode, preload, args.workers, args.port, args.paths[0], args.server_requests)
+                    for _ in range(args.runs)
+                ]
+                row = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+                results["server"][f"{mode}{'-preload' if preload else ''}"] = row
+                print(f"  {mode:<6} {'yes' if preload else 'no':<8} {row['ready_ms']:>12.0f} "
+                      f"{row['master_rss_kib'] / 1024:>11.1f} {row['worker_rss_kib'] / 1024:>11.1f} "
+                      f"{row['worker_pss_kib'] / 1024:>11.1f} {row['total_pss_kib'] / 1024:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
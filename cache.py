@@ -0,0 +1,252 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per-entry TTL. Each worker has its own copy.
+    Counters (`incr()`) are kept apart and never evicted.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._counters = {}         # key -> int
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires, value = item
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+class FileBackend:
+    """
+    Pickled entries under `directory`, sharded by key hash. Shared by every
+    worker on the host; writes go through a temp file and `os.replace` so
+    readers never see half an entry. Counters are plain numbers under
+    `directory/counters`, which sweeps leave alone.
+
+    Loading a pickle can run code, so `directory` must belong to the user
+    running the app and be closed to everyone else (mode 700).
+    """
+
+    SWEEP_EVERY = 1000  # sets per process between expired-entry sweeps
+    COUNTERS = "counters"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._sets = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.stat(directory)
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise RuntimeError(
+                f"Cache directory {directory} must be owned by this user and closed to others (chmod 700)"
+            )
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                expires, value = pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return _MISSING
+        return value
+
+    def set(self, key, value, ttl=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        expires = time.time() + ttl if ttl else None
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump((expires, value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        self._sets += 1
+        if self._sets % self.SWEEP_EVERY == 0:
+            self.sweep()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _counter_path(self, key):
+        return os.path.join(self.directory, self.COUNTERS, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def counter(self, key):
+        try:
+            with open(self._counter_path(key)) as fh:
+                return int(fh.read())
+        except (OSError, ValueError):
+            return 0
+
+    def incr(self, key):
+        path = self._counter_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            value = self.counter(key) + 1
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "w") as fh:
+                fh.write(str(value))
+            os.replace(tmp, path)
+            return value
+
+    def sweep(self):
+        """Deletes expired entries."""
+        now = time.time()
+        for root, dirs, files in os.walk(self.directory):
+            if root == self.directory and self.COUNTERS in dirs:
+                dirs.remove(self.COUNTERS)
+            for name in files:
+                if name.endswith(".lock"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "rb") as fh:
+                        expires, _ = pickle.load(fh)
+                    if expires is not None and expires < now:
+                        os.remove(path)
+                except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                    continue
+
+    def clear(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    os.remove(os.path.join(root, name))
+                except OSError:
+                    pass
+
+
+class Cache:
+    """
+    Read-through cache for query results and rendered fragments.
+
+    Entries are grouped by the namespaces they depend on ("feed",
+    "upload:42", ...). Each namespace has a generation number that is part
+    of the key; `invalidate()` bumps it, so every entry built from the old
+    data becomes unreachable at once and simply ages out. Generations are
+    backend counters, never evicted: one that went back to 0 would make old
+    entries reachable again.
+
+    `CACHE_BACKEND` is "filesystem" (shared by every process on the host
+    through `CACHE_DIR`), "memory" (per process: development or a single
+    process) or "none". Invalidations only reach the processes sharing the
+    backend: under gunicorn, with the job worker beside it, "memory" would
+    leave the other workers serving stale entries until their TTL ran out.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_BACKEND", os.environ.get("CACHE_BACKEND", "filesystem"))
+        # Not a shared folder like /tmp: whoever can write entries can run code in the app
+        app.config.setdefault("CACHE_DIR", os.environ.get("CACHE_DIR", os.path.join(app.instance_path, "cache")))
+        app.config.setdefault("CACHE_DEFAULT_TTL", int(os.environ.get("CACHE_DEFAULT_TTL", 300)))
+        app.config.setdefault("CACHE_MAX_ENTRIES", int(os.environ.get("CACHE_MAX_ENTRIES", 10000)))
+
+        kind = app.config["CACHE_BACKEND"]
+        if kind == "filesystem":
+            self.backend = FileBackend(app.config["CACHE_DIR"])
+        elif kind == "memory":
+            self.backend = MemoryBackend(app.config["CACHE_MAX_ENTRIES"])
+        elif kind == "none":
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND: {kind}")
+        self.default_ttl = app.config["CACHE_DEFAULT_TTL"]
+        app.extensions["cache"] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def generation(self, namespace):
+        if not self.enabled:
+            return 0
+        return self.backend.counter(f"gen:{namespace}")
+
+    def invalidate(self, *namespaces):
+        if not self.enabled:
+            return
+        for namespace in namespaces:
+            self.backend.incr(f"gen:{namespace}")
+
+    def key(self, name, *parts, depends=()):
+        gens = ",".join(f"{ns}@{self.generation(ns)}" for ns in depends)
+        return f"{name}:{':'.join(map(str, parts))}|{gens}"
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        value = self.backend.get(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=None):
+        if self.enabled:
+            self.backend.set(key, value, ttl or self.default_ttl)
+
+    def get_or_set(self, key, producer, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = producer()
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
@@ -0,0 +1,161 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import bindparam, func, update
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    """
+    Base for per-worker write buffers that are flushed by a background thread.
+    Subclasses implement `flush()` and `flush_interval`.
+    """
+
+    _thread = None
+    _pid = None
+
+    @property
+    def flush_interval(self):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def _ensure_flusher(self):
+        # Gunicorn forks workers after import, so each process starts its own thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name=f"{type(self).__name__}-flush", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+class CounterBuffer(BufferedWriter):
+    """
+    Write-batched counters for integer columns (views, likes, ...).
+
+    Increments are summed in memory per worker and flushed as one
+    `UPDATE ... SET col = col + :n` executemany per column, either every
+    `COUNTER_FLUSH_INTERVAL` seconds or once `COUNTER_FLUSH_THRESHOLD`
+    increments are pending. The update is relative, so concurrent workers
+    never overwrite each other's counts.
+
+    With `COUNTER_STRICT = True` every increment is written synchronously
+    inside the caller's transaction instead.
+
+    `on_flush(row_ids)` is called with the rows whose counts were just
+    written, after the commit.
+    """
+
+    def __init__(self, table, columns, on_flush=None, app=None, db=None):
+        self.table = table
+        self.columns = tuple(columns)
+        self.on_flush = on_flush
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)   # (column, row_id) -> delta
+        self._inflight = defaultdict(int)  # deltas being written right now
+        self._pending_total = 0
+        self._statements = {
+            column: update(table)
+            .where(table.c.id == bindparam("_id"))
+            .values({column: func.coalesce(table.c[column], 0) + bindparam("_n")})
+            for column in self.columns
+        }
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("COUNTER_STRICT", os.environ.get("COUNTER_STRICT") == "1")
+        app.config.setdefault("COUNTER_FLUSH_INTERVAL", float(os.environ.get("COUNTER_FLUSH_INTERVAL", 2)))
+        app.config.setdefault("COUNTER_FLUSH_THRESHOLD", int(os.environ.get("COUNTER_FLUSH_THRESHOLD", 500)))
+        app.extensions["counters"] = self
+        atexit.register(self.flush)
+
+    @property
+    def strict(self):
+        return self.app.config["COUNTER_STRICT"]
+
+    @property
+    def flush_interval(self):
+        return self.app.config["COUNTER_FLUSH_INTERVAL"]
+
+    def incr(self, row_id, column, n=1):
+        if column not in self._statements:
+            raise ValueError(f"Unknown counter column: {column}")
+
+        if self.strict:
+            self.db.session.execute(self._statements[column], [{"_id": row_id, "_n": n}])
+            self.db.session.commit()
+            if self.on_flush:
+                self.on_flush({row_id})
+            return
+
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[(column, row_id)] += n
+            self._pending_total += abs(n)
+            flush_now = self._pending_total >= self.app.config["COUNTER_FLUSH_THRESHOLD"]
+        if flush_now:
+            self.flush()
+
+    def pending(self, row_id, column):
+        """Increments for a row that are not yet visible in the database."""
+        key = (column, row_id)
+        with self._lock:
+            return self._pending.get(key, 0) + self._inflight.get(key, 0)
+
+    def value(self, row, column):
+        """Column value of a loaded row plus this worker's unflushed increments."""
+        return (getattr(row, column) or 0) + self.pending(row.id, column)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = defaultdict(int)
+            self._pending_total = 0
+            for key, n in batch.items():
+                self._inflight[key] += n
+
+        by_column = defaultdict(list)
+        for (column, row_id), n in batch.items():
+            by_column[column].append({"_id": row_id, "_n": n})
+
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    for column, params in by_column.items():
+                        conn.execute(self._statements[column], params)
+        except Exception:
+            logger.exception("Counter flush failed, keeping %d rows for retry", len(batch))
+            with self._lock:
+                for key, n in batch.items():
+                    self._pending[key] += n
+                    self._pending_total += abs(n)
+        else:
+            if self.on_flush:
+                self.on_flush({row_id for _, row_id in batch})
+        finally:
+            with self._lock:
+                for key, n in batch.items():
+                    self._inflight[key] -= n
+                    if self._inflight[key] == 0:
+                        del self._inflight[key]
@@ -0,0 +1,228 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import NullPool, Pool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+
+
+# ------------------------ POOLS ------------------------
+class TimedPoolMixin:
+    """
+    Notes on each connection record how long getting it took and which
+    engine's pool it came from (`pool_logging_name`), for the checkout event.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        record = super()._do_get()
+        record.info["checkout_wait"] = time.perf_counter() - start
+        record.info["engine"] = self.logging_name
+        return record
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    pass
+
+
+# ------------------------ SESSION ------------------------
+class RoutingSession(Session):
+    """
+    `db.session` that sends plain SELECTs to a replica (see DatabaseRouter)
+    and everything else to the primary. Once it has written, or run
+    anything that might have, it stays on the primary so the request reads
+    its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            reading = (
+                not self._flushing
+                and getattr(clause, "is_select", False)
+                and getattr(clause, "_for_update_arg", None) is None
+            )
+            if not reading:
+                self.info["primary"] = self.info["wrote"] = True
+            elif not self.info.get("primary"):
+                router = current_app.extensions.get("db_router")
+                replica = router.replica_for(self) if router else None
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# ------------------------ ROUTER ------------------------
+class DatabaseRouter:
+    """
+    Engine settings and read/write routing for `db`.
+
+    `SQLALCHEMY_REPLICA_URIS` lists read replicas; each becomes a bind
+    ("replica1", ...) and `db.session` spreads its SELECTs over them, one
+    replica per request, skipping a replica for `DB_REPLICA_RETRY` seconds
+    after it failed. Writes, `SELECT ... FOR UPDATE` and every read after a
+    write go to the primary, and so does the same client for
+    `DB_REPLICA_STICKY` seconds after a request that wrote (a cookie), so
+    replica lag never hides someone's own upload or edit. Code that uses
+    `db.engine` directly (buffered counters, jobs, search) always talks to
+    the primary.
+
+    Pools: `DB_POOL_SIZE`/`DB_MAX_OVERFLOW` for the primary and
+    `DB_REPLICA_POOL_SIZE`/`DB_REPLICA_MAX_OVERFLOW` per replica, recycled
+    after `DB_POOL_RECYCLE` seconds; `DB_POOL_PRE_PING` (a round trip per
+    checkout) is off by default. With `DB_PGBOUNCER` the app keeps no pool
+    of its own and opens a connection to PgBouncer per checkout.
+
+    Every checkout's wait and hold time, and the most connections checked
+    out at once, go to `metrics` per engine, for sizing the pools.
+    """
+
+    def __init__(self, metrics=None, app=None, db=None):
+        self.metrics = metrics
+        self.replica_keys = []
+        self._replicas = None
+        self._turn = itertools.count()
+        self._down = {}    # replica engine -> time.monotonic() it may be retried at
+        self._in_use = {}  # engine label -> connections checked out
+        self._lock = threading.Lock()
+        self._listening = False
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """Sets up the engine options; call before `db.init_app(app)` builds the engines."""
+        self.app = app
+        self.db = db
+        self.replica_keys = []
+        self._replicas = None
+        app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+        app.config.setdefault("DB_POOL_SIZE", int(os.environ.get("DB_POOL_SIZE", 5)))
+        app.config.setdefault("DB_MAX_OVERFLOW", int(os.environ.get("DB_MAX_OVERFLOW", 10)))
+        app.config.setdefault("DB_REPLICA_POOL_SIZE", int(os.environ.get(
+            "DB_REPLICA_POOL_SIZE", app.config["DB_POOL_SIZE"])))
+        app.config.setdefault("DB_REPLICA_MAX_OVERFLOW", int(os.environ.get(
+            "DB_REPLICA_MAX_OVERFLOW", app.config["DB_MAX_OVERFLOW"])))
+        app.config.setdefault("DB_POOL_TIMEOUT", float(os.environ.get("DB_POOL_TIMEOUT", 30)))
+        app.config.setdefault("DB_POOL_RECYCLE", int(os.environ.get("DB_POOL_RECYCLE", 300)))
+        app.config.setdefault("DB_POOL_PRE_PING", os.environ.get("DB_POOL_PRE_PING") == "1")
+        app.config.setdefault("DB_PGBOUNCER", os.environ.get("DB_PGBOUNCER") == "1")
+        app.config.setdefault("DB_REPLICA_STICKY", int(os.environ.get("DB_REPLICA_STICKY", 5)))
+        app.config.setdefault("DB_REPLICA_RETRY", float(os.environ.get("DB_REPLICA_RETRY", 30)))
+        app.config.setdefault("DB_REPLICA_COOKIE", "db_primary")
+
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", self.engine_options(
+            app.config["SQLALCHEMY_DATABASE_URI"], PRIMARY,
+            app.config["DB_POOL_SIZE"], app.config["DB_MAX_OVERFLOW"],
+        ))
+        binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+        for n, uri in enumerate(app.config["SQLALCHEMY_REPLICA_URIS"], start=1):
+            key = f"replica{n}"
+            binds.setdefault(key, {"url": uri, **self.engine_options(
+                uri, key, app.config["DB_REPLICA_POOL_SIZE"], app.config["DB_REPLICA_MAX_OVERFLOW"],
+            )})
+            self.replica_keys.append(key)
+
+        if self.replica_keys:
+            app.after_request(self._stick_to_primary)
+        if not self._listening:
+            self._listening = True
+            event.listen(Pool, "checkout", self._checked_out)
+            event.listen(Pool, "checkin", self._checked_in)
+            event.listen(Engine, "handle_error", self._engine_failed)
+        app.extensions["db_router"] = self
+
+    def engine_options(self, uri, label, pool_size, max_overflow):
+        options = {"pool_logging_name": label}
+        if uri is None:
+            return options
+        url = make_url(uri)
+        if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+            return options  # one shared in-memory connection; Flask-SQLAlchemy picks the pool
+        if self.app.config["DB_PGBOUNCER"]:
+            # PgBouncer pools (in transaction mode) for every worker: hold nothing here
+            options["poolclass"] = TimedNullPool
+            return options
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=self.app.config["DB_POOL_TIMEOUT"],
+            pool_recycle=self.app.config["DB_POOL_RECYCLE"],
+            pool_pre_ping=self.app.config["DB_POOL_PRE_PING"],
+        )
+        return options
+
+    # ---------- routing ----------
+    def replica_for(self, session):
+        """The replica this session reads from, or None for the primary."""
+        if not self.replica_keys:
+            return None
+        replica = session.info.get("replica")
+        if replica is not None:
+            return replica
+        if has_request_context() and request.cookies.get(self.app.config["DB_REPLICA_COOKIE"]):
+            session.info["primary"] = True  # this client wrote a moment ago
+            return None
+
+        if self._replicas is None:
+            self._replicas = [self.db.engines[key] for key in self.replica_keys]
+        now = time.monotonic()
+        healthy = [engine for engine in self._replicas if self._down.get(engine, 0) <= now]
+        if not healthy:
+            return None
+        replica = session.info["replica"] = healthy[next(self._turn) % len(healthy)]
+        return replica
+
+    def use_primary(self):
+        """Sends the rest of this request's queries to the primary."""
+        self.db.session.info["primary"] = True
+
+    def _stick_to_primary(self, response):
+        if self.db.session.registry.has() and self.db.session.info.get("wrote"):
+            response.set_cookie(
+                self.app.config["DB_REPLICA_COOKIE"], "1", max_age=self.app.config["DB_REPLICA_STICKY"],
+                httponly=True, samesite="Lax",
+            )
+        return response
+
+    def _engine_failed(self, context):
+        engine = context.engine
+        if self._replicas and engine in self._replicas and (
+            context.is_disconnect or context.connection is None
+        ):
+            logger.warning("Replica %s failed, reading from the others for a while", engine.url)
+            self._down[engine] = time.monotonic() + self.app.config["DB_REPLICA_RETRY"]
+
+    # ---------- pool statistics ----------
+    def _checked_out(self, dbapi_connection, record, proxy):
+        label = record.info.get("engine")
+        if label is None or self.metrics is None:
+            return
+        record.info["checked_out_at"] = time.perf_counter()
+        wait = record.info.pop("checkout_wait", None)
+        if wait is not None:
+            self.metrics.observe("db_pool_wait_seconds", {"engine": label}, wait)
+        with self._lock:
+            in_use = self._in_use[label] = self._in_use.get(label, 0) + 1
+        self.metrics.observe_max("db_pool_in_use_peak", {"engine": label}, in_use)
+
+    def _checked_in(self, dbapi_connection, record):
+        start = record.info.pop("checked_out_at", None)
+        if start is None:
+            return
+        label = record.info["engine"]
+        self.metrics.observe("db_pool_hold_seconds", {"engine": label}, time.perf_counter() - start)
+        with self._lock:
+            self._in_use[label] = max(0, self._in_use.get(label, 0) - 1)
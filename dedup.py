@@ -0,0 +1,206 @@
+import atexit
+import hashlib
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from counters import BufferedWriter
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys (no false negatives)."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+def insert_ignore(table, dialect_name):
+    """INSERT that silently skips rows violating a unique constraint."""
+    if dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return table.insert().prefix_with("IGNORE")
+
+
+class DedupStore(BufferedWriter):
+    """
+    "Has this viewer already done X to this upload?" backed by a table with a
+    unique (upload, viewer) constraint, e.g. UploadView or VideoLike.
+
+    Each worker keeps one Bloom filter per recently touched upload. A negative
+    answer is trusted and the new row is queued for a batched
+    `INSERT ... ON CONFLICT DO NOTHING`; only a positive answer costs a
+    lookup. Rows another worker (or this one before a restart) inserted
+    first are reported to `on_duplicate(upload_id)` at flush time so callers
+    can undo their count; until then the viewer saw it counted.
+
+    That is fine for views, not for anything the viewer must never see
+    twice: with `buffered=False` (likes) every `add()` is one synchronous
+    insert and the unique constraint decides. `COUNTER_STRICT = True` does
+    that for every store.
+    """
+
+    def __init__(self, model, upload_column, viewer_column, on_duplicate=None, buffered=True, app=None, db=None):
+        self.model = model
+        self.table = model.__table__
+        self.upload_column = upload_column
+        self.viewer_column = viewer_column
+        self.on_duplicate = on_duplicate
+        self.buffered = buffered
+        self._lock = threading.Lock()
+        self._filters = OrderedDict()  # upload_id -> BloomFilter, LRU order
+        self._pending = {}             # (upload_id, viewer) -> row
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("COUNTER_STRICT", os.environ.get("COUNTER_STRICT") == "1")
+        app.config.setdefault("DEDUP_FILTER_CAPACITY", int(os.environ.get("DEDUP_FILTER_CAPACITY", 1000)))
+        app.config.setdefault("DEDUP_FILTER_ERROR_RATE", float(os.environ.get("DEDUP_FILTER_ERROR_RATE", 0.01)))
+        app.config.setdefault("DEDUP_MAX_FILTERS", int(os.environ.get("DEDUP_MAX_FILTERS", 2048)))
+        app.config.setdefault("DEDUP_FLUSH_INTERVAL", float(os.environ.get("DEDUP_FLUSH_INTERVAL", 1)))
+        app.config.setdefault("DEDUP_FLUSH_THRESHOLD", int(os.environ.get("DEDUP_FLUSH_THRESHOLD", 200)))
+        app.extensions.setdefault("dedup", {})[self.table.name] = self
+        atexit.register(self.flush)
+
+    @property
+    def strict(self):
+        return self.app.config["COUNTER_STRICT"]
+
+    @property
+    def flush_interval(self):
+        return self.app.config["DEDUP_FLUSH_INTERVAL"]
+
+    def _filter(self, upload_id):
+        bloom = self._filters.get(upload_id)
+        if bloom is None:
+            bloom = BloomFilter(
+                self.app.config["DEDUP_FILTER_CAPACITY"],
+                self.app.config["DEDUP_FILTER_ERROR_RATE"],
+            )
+            self._filters[upload_id] = bloom
+            if len(self._filters) > self.app.config["DEDUP_MAX_FILTERS"]:
+                self._filters.popitem(last=False)
+        else:
+            self._filters.move_to_end(upload_id)
+        return bloom
+
+    def _exists(self, upload_id, viewer):
+        stmt = select(self.table.c.id).where(
+            self.table.c[self.upload_column] == upload_id,
+            self.table.c[self.viewer_column] == viewer,
+        ).limit(1)
+        return self.db.session.execute(stmt).first() is not None
+
+    def add(self, upload_id, viewer, **extra):
+        """
+        Record that `viewer` acted on `upload_id`.
+        Returns: True if this is the first time, False if already recorded.
+        """
+        row = {self.upload_column: upload_id, self.viewer_column: viewer, **extra}
+
+        if self.strict or not self.buffered:
+            stmt = insert_ignore(self.table, self.db.engine.dialect.name)
+            result = self.db.session.execute(stmt, row)
+            self.db.session.commit()
+            return result.rowcount == 1
+
+        key = (upload_id, viewer)
+        with self._lock:
+            if key in self._pending:
+                return False
+            maybe_seen = viewer in self._filter(upload_id)
+
+        if maybe_seen and self._exists(upload_id, viewer):
+            return False
+
+        self._ensure_flusher()
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._filter(upload_id).add(viewer)
+            self._pending[key] = row
+            flush_now = len(self._pending) >= self.app.config["DEDUP_FLUSH_THRESHOLD"]
+        if flush_now:
+            self.flush()
+        return True
+
+    def seen_many(self, upload_ids, viewer):
+        """Subset of `upload_ids` the viewer has already acted on (one query)."""
+        upload_ids = list(upload_ids)
+        if not upload_ids:
+            return set()
+        with self._lock:
+            seen = {uid for uid in upload_ids if (uid, viewer) in self._pending}
+        stmt = select(self.table.c[self.upload_column]).where(
+            self.table.c[self.upload_column].in_(upload_ids),
+            self.table.c[self.viewer_column] == viewer,
+        )
+        seen.update(self.db.session.execute(stmt).scalars())
+        return seen
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = {}
+
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    duplicates = self._insert(conn, batch)
+        except Exception:
+            logger.exception("Dedup flush failed, keeping %d rows for retry", len(batch))
+            with self._lock:
+                for key, row in batch.items():
+                    self._pending.setdefault(key, row)
+            return
+
+        if self.on_duplicate:
+            for upload_id in duplicates:
+                self.on_duplicate(upload_id)
+
+    def _insert(self, conn, batch):
+        """Writes the batch. Returns: the upload id of every row that was already there"""
+        t = self.table
+        upload_col, viewer_col = t.c[self.upload_column], t.c[self.viewer_column]
+        stmt = insert_ignore(t, conn.dialect.name)
+        if conn.dialect.insert_executemany_returning:
+            # A multi-row INSERT ... RETURNING: whatever it didn't return was a duplicate
+            inserted = set(conn.execute(stmt.returning(upload_col, viewer_col), list(batch.values())).tuples())
+        else:
+            # No RETURNING (MySQL): look the batch up first, in the same transaction
+            existing = conn.execute(select(upload_col, viewer_col).where(
+                upload_col.in_({upload_id for upload_id, _ in batch}),
+                viewer_col.in_({viewer for _, viewer in batch}),
+            )).tuples()
+            inserted = set(batch) - set(existing)
+            conn.execute(stmt, [row for key, row in batch.items() if key in inserted])
+        return [upload_id for upload_id, viewer in batch if (upload_id, viewer) not in inserted]
@@ -0,0 +1,43 @@
+"""
+Domain events emitted by the write routes.
+
+Subsystems that keep derived state (caches, indexes, rankings, ...) connect
+to these instead of being called from every route that changes the data,
+when their blueprint is registered on the app:
+
+    def on_upload(sender, upload, **extra):
+        ...
+
+    @bp.record_once
+    def connect_events(state):
+        upload_created.connect(on_upload, sender=state.app)
+
+Every signal is sent with the Flask app as sender, see `emit()`.
+"""
+from blinker import Namespace
+from flask import current_app
+
+_signals = Namespace()
+
+# upload=<Upload>
+upload_created = _signals.signal("upload-created")
+# upload=<Upload> (already deleted from the session, attributes still loaded)
+upload_deleted = _signals.signal("upload-deleted")
+# upload_ids=<list of int> deleted together in one transaction (an account's uploads)
+uploads_purged = _signals.signal("uploads-purged")
+# upload_id=<int>, viewer=<str>
+upload_liked = _signals.signal("upload-liked")
+# upload_ids=<list of int> whose derived files (thumbnail, poster, HLS renditions) changed
+upload_processed = _signals.signal("upload-processed")
+
+# user=<User>
+user_registered = _signals.signal("user-registered")
+# user=<User>, fields=<set of changed column names>, old_username=<str> when renamed
+user_updated = _signals.signal("user-updated")
+# user_id=<int>
+user_deleted = _signals.signal("user-deleted")
+
+
+def emit(signal, **kwargs):
+    """Sends `signal` from the current app: receivers are connected to the app object, not its proxy."""
+    return signal.send(current_app._get_current_object(), **kwargs)
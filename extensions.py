@@ -0,0 +1,156 @@
+"""
+The app's extensions and services, created here without an app and bound by
+`create_app()` (app.py) through `init_app()`. Blueprints import them from
+here, so importing a view module neither builds an app nor touches the
+database; every extension opens connections, threads and process pools on
+first use, in the process that uses them.
+"""
+import os
+
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer
+
+from analytics import Analytics
+from cache import Cache
+from counters import CounterBuffer
+from database import DatabaseRouter
+from dedup import DedupStore
+from ingest import ChunkedUploads
+from jobs import JobQueue
+from leaderboard import Leaderboards
+from live import LiveCounters
+from metrics import Metrics
+from models import (
+    GameStat, GameToken, Job, MediaBlob, Upload, UploadActivity, UploadDailyStat, UploadView, User, UserActivity,
+    UserStat, VideoLike, WebSession, db,
+)
+from passwords import PasswordHasher, Throttle
+from ranking import RankingEngine
+from search import Search
+from sessions import ServerSessions
+from storage import MediaStore
+from thumbnails import ThumbnailWorker
+from transfer import DataTransfer
+
+metrics = Metrics()  # per-endpoint histograms, served at /metrics
+# Engine pools, and SELECTs spread over the read replicas, see database.py
+router = DatabaseRouter(metrics)
+passwords = PasswordHasher()  # bcrypt on a bounded process pool
+cache = Cache()  # query results and rendered fragments, see views/social.py
+# `session` lives in the web_session table; the cookie only carries its id
+sessions = ServerSessions(WebSession.__table__)
+
+# ------------------------ BACKGROUND JOBS ------------------------
+# Slow side work (thumbnails, removing media files, deleting accounts) is
+# queued in the job table and run by `python worker.py`, never by gunicorn.
+# Handlers are registered next to the code that enqueues them.
+jobs = JobQueue(Job.__table__)
+
+# ------------------------ VIEW / LIKE COUNTERS ------------------------
+# Buffered per worker and flushed as atomic `views = views + n` updates;
+# each flush pushes the new counts to the pages showing them (see live.py)
+def counts_written(upload_ids):
+    # /view and /like answer from cached counts plus this worker's pending ones
+    cache.invalidate(*[f"counts:{upload_id}" for upload_id in upload_ids])
+    live.publish(upload_ids)
+
+
+counters = CounterBuffer(Upload.__table__, ("views", "likes"), on_flush=counts_written)
+live = LiveCounters(Upload.__table__, ("views", "likes"))
+# Trending/top rankings, fed by the same counts (see ranking.py)
+ranking = RankingEngine(UploadActivity.__table__)
+# Per-user totals and hourly/daily rollups for the dashboard (see analytics.py)
+analytics = Analytics(
+    Upload.__table__, User.__table__, UploadView.__table__,
+    UserStat.__table__, UserActivity.__table__, UploadDailyStat.__table__,
+)
+
+
+def count(upload_id, column, n=1):
+    """Counts `n` views or likes: the buffered column, the rankings and the analytics."""
+    counters.incr(upload_id, column, n)
+    ranking.record(upload_id, column, n)
+    analytics.record(upload_id, column, n)
+
+
+# "Already viewed/liked?" checks, replacing the id lists in the session cookie.
+# Views are batched: one another worker recorded first gives its count back at
+# flush time. A like is inserted at once, so nobody ever sees theirs count twice.
+view_dedup = DedupStore(
+    UploadView, "upload_id", "viewer",
+    on_duplicate=lambda upload_id: count(upload_id, "views", -1),
+)
+like_dedup = DedupStore(VideoLike, "video_id", "user_id", buffered=False)
+
+# ------------------------ MEDIA ------------------------
+# Uploaded files and avatars, stored once per content in hash-sharded folders
+# (or an S3 bucket) and deleted with their last row, see storage.py.
+# AVATAR_FOLDER only keeps the default avatar and ones from before that.
+storage = MediaStore(MediaBlob.__table__)
+# Thumbnails and video posters are built by the job worker
+thumbnails = ThumbnailWorker(Upload)
+# Resumable uploads, staged next to the stored files
+chunked_uploads = ChunkedUploads()
+
+# ------------------------ GAMES & SEARCH ------------------------
+leaderboards = Leaderboards(User.__table__, GameStat.__table__, GameToken.__table__)
+# Username autocomplete plus full-text search over bios and upload names, on
+# the database's own indexes (see search.py)
+search = Search(User.__table__, Upload.__table__)
+
+# ------------------------ EXPORT / IMPORT ------------------------
+# Streamed NDJSON/CSV copies of these tables (`flask export`/`flask import`,
+# /admin/export and /admin/import, see views/admin.py), listed in the order
+# they must be imported in
+transfer = DataTransfer({
+    "users": User.__table__,
+    "uploads": Upload.__table__,
+    "likes": VideoLike.__table__,
+    "views": UploadView.__table__,
+    "game_stats": GameStat.__table__,
+})
+
+# ------------------------ THROTTLING ------------------------
+# Every login attempt counts against the client IP; only failures count
+# against the account, so a user isn't locked out by their own successful
+# logins. Limits are per worker process.
+login_ip_throttle = Throttle(
+    limit=int(os.environ.get('LOGIN_IP_LIMIT', 20)),
+    window=int(os.environ.get('LOGIN_IP_WINDOW', 60)),
+)
+login_identifier_throttle = Throttle(
+    limit=int(os.environ.get('LOGIN_IDENTIFIER_LIMIT', 5)),
+    window=int(os.environ.get('LOGIN_IDENTIFIER_WINDOW', 300)),
+)
+score_throttle = Throttle(
+    limit=int(os.environ.get('GAME_SUBMIT_LIMIT', 60)),
+    window=int(os.environ.get('GAME_SUBMIT_WINDOW', 3600)),
+)
+
+
+def serializer():
+    """Signs game sessions and password reset links with the current app's SECRET_KEY."""
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+
+
+def init_app(app):
+    """Binds every extension to `app`. UPLOAD_FOLDER must already be configured."""
+    router.init_app(app, db)
+    db.init_app(app)
+    metrics.init_app(app)
+    passwords.init_app(app)
+    cache.init_app(app)
+    sessions.init_app(app, db)
+    jobs.init_app(app, db)
+    counters.init_app(app, db)
+    live.init_app(app, db)
+    ranking.init_app(app, db)
+    analytics.init_app(app, db)
+    view_dedup.init_app(app, db)
+    like_dedup.init_app(app, db)
+    storage.init_app(app, db)
+    thumbnails.init_app(app, db)
+    chunked_uploads.init_app(app)
+    leaderboards.init_app(app, db)
+    search.init_app(app, db)
+    transfer.init_app(app, db)
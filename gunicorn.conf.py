@@ -0,0 +1,31 @@
+"""
+Gunicorn settings, read automatically when gunicorn starts from this folder
+(`gunicorn app:app`, `gunicorn asgi:application -k uvicorn.workers.UvicornWorker`).
+
+The app is imported once in the master and the workers are forked from it,
+so they share its code and module objects copy-on-write instead of each
+importing them again: workers boot faster and use less memory. Building the
+app opens no connections and starts no threads (see create_app), so there is
+nothing in the master a worker could inherit by mistake. Set
+GUNICORN_PRELOAD=0 to import the app in every worker instead, e.g. to let
+`--reload` or a HUP pick up new code without restarting the master.
+"""
+import gc
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # Everything imported so far lives as long as the master: move it out of
+    # the collector's reach so gc passes in the workers don't write to (and
+    # so copy) the pages they share with it
+    if server.cfg.preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # Rankings load on a background thread as the worker starts, not in its
+    # first ranked request (see ranking.py)
+    from app import ranking
+    ranking.start()
@@ -0,0 +1,215 @@
+import fcntl
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+
+COPY_BUFFER = 64 * 1024
+
+
+class UploadSessionError(Exception):
+    """Raised for unknown sessions, bad offsets and oversized uploads."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def stream_to_file(stream, fh, hasher, limit=None):
+    """
+    Copies `stream` into the open file `fh` in fixed-size blocks, feeding
+    every block to `hasher` on the way. Returns the number of bytes written.
+    """
+    written = 0
+    while True:
+        block = stream.read(COPY_BUFFER)
+        if not block:
+            break
+        written += len(block)
+        if limit is not None and written > limit:
+            raise UploadSessionError("Upload is larger than announced", status=413)
+        hasher.update(block)
+        fh.write(block)
+    return written
+
+
+def hash_file(path, algorithm="sha256"):
+    hasher = hashlib.new(algorithm)
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(COPY_BUFFER), b""):
+            hasher.update(block)
+    return hasher
+
+
+class ChunkedUploads:
+    """
+    Resumable uploads: `start()` a session, `append()` chunks in order, then
+    `finish()` to get the assembled file and its content hash.
+
+    Chunks go straight into `<staging>/<token>.part`, which lives next to the
+    upload folder so finishing is a rename, not a copy. Session metadata is a
+    small JSON file beside it, so any gunicorn worker can continue a session.
+    The running hash is kept in memory per worker and rebuilt from the
+    partial file when a chunk lands on a different worker.
+
+    Bound to an app, the staging folder is `UPLOAD_FOLDER/.incoming` and the
+    size limit `MAX_UPLOAD_SIZE`. The folder is created on first use, not
+    when the app is built.
+    """
+
+    def __init__(self, staging_dir=None, max_size=None, session_ttl=24 * 3600, algorithm="sha256", app=None):
+        self.staging_dir = staging_dir
+        self.max_size = max_size
+        self.session_ttl = session_ttl
+        self.algorithm = algorithm
+        self._hashers = {}  # token -> (offset, hasher)
+        self._lock = threading.Lock()
+        self._staging_ready = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("MAX_UPLOAD_SIZE", int(os.environ.get("MAX_UPLOAD_SIZE", 2 * 1024 ** 3)))
+        app.config.setdefault("UPLOAD_CHUNK_SIZE", int(os.environ.get("UPLOAD_CHUNK_SIZE", 8 * 1024 ** 2)))
+        # Inside the upload folder so finishing is a rename
+        self.staging_dir = os.path.join(app.config["UPLOAD_FOLDER"], ".incoming")
+        self.max_size = app.config["MAX_UPLOAD_SIZE"]
+        self._staging_ready = False
+        app.extensions["chunked_uploads"] = self
+
+    def _staging(self):
+        if not self._staging_ready:
+            os.makedirs(self.staging_dir, exist_ok=True)
+            self._staging_ready = True
+        return self.staging_dir
+
+    def staging_path(self, name):
+        """Path for `name` in the staging folder, creating the folder if needed."""
+        return os.path.join(self._staging(), name)
+
+    def _paths(self, token):
+        if not token.isalnum():
+            raise UploadSessionError("Unknown upload session", status=404)
+        base = self.staging_path(token)
+        return base + ".json", base + ".part"
+
+    def start(self, owner_id, original_name, size):
+        if size is None:
+            raise UploadSessionError("Missing upload size")
+        # Whatever the client's JSON held: bools are ints to Python, floats and strings aren't
+        if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            raise UploadSessionError("Upload size must be a whole number of bytes")
+        if size > self.max_size:
+            raise UploadSessionError("File is too large", status=413)
+
+        self.sweep()
+        token = secrets.token_hex(16)
+        meta_path, part_path = self._paths(token)
+        meta = {
+            "token": token,
+            "owner_id": owner_id,
+            "name": original_name,
+            "size": size,
+            "created": time.time(),
+        }
+        open(part_path, "wb").close()
+        with open(meta_path, "w") as fh:
+            json.dump(meta, fh)
+        with self._lock:
+            self._hashers[token] = (0, hashlib.new(self.algorithm))
+        return meta
+
+    def status(self, token, owner_id):
+        meta_path, part_path = self._paths(token)
+        try:
+            with open(meta_path) as fh:
+                meta = json.load(fh)
+        except FileNotFoundError:
+            raise UploadSessionError("Unknown upload session", status=404)
+        if meta["owner_id"] != owner_id:
+            raise UploadSessionError("Unknown upload session", status=404)
+        meta["offset"] = os.path.getsize(part_path)
+        return meta
+
+    def _hasher_at(self, token, part_path, offset):
+        with self._lock:
+            cached = self._hashers.get(token)
+        if cached and cached[0] == offset:
+            return cached[1]
+        return hash_file(part_path, self.algorithm)
+
+    def append(self, token, owner_id, offset, stream):
+        """
+        Appends one chunk that must start at `offset`.
+        Returns: the new offset (bytes received so far).
+        """
+        meta = self.status(token, owner_id)
+        _, part_path = self._paths(token)
+
+        with open(part_path, "ab") as fh:
+            # One writer per session, even across workers
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                current = os.fstat(fh.fileno()).st_size
+                if offset != current:
+                    raise UploadSessionError("Chunk offset mismatch", status=409, offset=current)
+                hasher = self._hasher_at(token, part_path, current)
+                try:
+                    stream_to_file(stream, fh, hasher, limit=meta["size"] - current)
+                except UploadSessionError:
+                    fh.truncate(current)
+                    self._forget_hasher(token)
+                    raise
+                except Exception:
+                    # Keep what arrived (the client resumes from there), but
+                    # the running hash no longer matches a known offset
+                    self._forget_hasher(token)
+                    raise
+                fh.flush()
+                new_offset = os.fstat(fh.fileno()).st_size
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+        with self._lock:
+            self._hashers[token] = (new_offset, hasher)
+        return new_offset
+
+    def finish(self, token, owner_id):
+        """
+        Returns: (meta, part_path, hex digest) once every byte has arrived.
+        The caller moves or deletes the part file and then calls `discard()`.
+        """
+        meta = self.status(token, owner_id)
+        if meta["offset"] != meta["size"]:
+            raise UploadSessionError("Upload is incomplete", status=409, offset=meta["offset"])
+        _, part_path = self._paths(token)
+        digest = self._hasher_at(token, part_path, meta["offset"]).hexdigest()
+        return meta, part_path, digest
+
+    def _forget_hasher(self, token):
+        with self._lock:
+            self._hashers.pop(token, None)
+
+    def discard(self, token):
+        self._forget_hasher(token)
+        for path in self._paths(token):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def sweep(self):
+        """Removes sessions older than `session_ttl`."""
+        cutoff = time.time() - self.session_ttl
+        for name in os.listdir(self._staging()):
+            if not name.endswith(".json"):
+                continue
+            token = name[:-len(".json")]
+            meta_path, part_path = self._paths(token)
+            try:
+                last_write = max(os.path.getmtime(meta_path), os.path.getmtime(part_path))
+            except OSError:
+                last_write = 0
+            if last_write < cutoff:
+                self.discard(token)
@@ -0,0 +1,315 @@
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobType:
+    """
+    A registered handler plus how its jobs are scheduled. `concurrency` is a
+    number or the name of a config key holding one, read when jobs are claimed.
+    """
+
+    def __init__(self, name, func, concurrency=1, priority=0, max_attempts=None):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+
+class JobQueue:
+    """
+    Durable queue of deferred work, stored in the app's own database (the
+    `job` table), so it needs no broker and survives restarts.
+
+    Web handlers `enqueue()` a job and return; `python worker.py` runs
+    `run_worker()`, which claims due jobs and runs their handlers on a thread
+    pool. Gunicorn never runs jobs.
+
+      - priority: higher first, then oldest `run_at` first
+      - idempotency: enqueueing a `key` that is already queued, running or
+        recently finished returns the existing job instead of a new one;
+        `cancel()` drops the keys of something deleted
+      - retries: a handler that raises is retried after
+        `JOB_BACKOFF_BASE * 2 ** (attempt - 1)` seconds (capped at
+        `JOB_BACKOFF_MAX`, +-50% jitter), up to `max_attempts`; then the job
+        is left as "failed" with its last error
+      - concurrency: at most `concurrency` jobs of one type run at once in a
+        worker process
+      - leases: a running job's `locked_at` is refreshed while it runs; one
+        not refreshed for `JOB_LEASE_SECONDS` (its worker died) is queued again
+
+    Jobs are claimed with a conditional UPDATE (`WHERE status = 'queued'`),
+    so several worker processes can share the table on any backend.
+    Handlers must be safe to run twice: a worker that dies after the work
+    but before marking the job done leaves it to be run again.
+
+    With `JOBS_EAGER` (or under TESTING) `enqueue()` runs the handler
+    inline instead, for local runs without a worker.
+    """
+
+    def __init__(self, table, app=None, db=None):
+        self.table = table
+        self.types = {}
+        self._lock = threading.Lock()
+        self._running = {}  # job id -> type name, in this worker
+        self._stop = threading.Event()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("JOBS_EAGER", os.environ.get("JOBS_EAGER") == "1")
+        app.config.setdefault("JOB_WORKER_THREADS", int(os.environ.get("JOB_WORKER_THREADS", 4)))
+        app.config.setdefault("JOB_POLL_INTERVAL", float(os.environ.get("JOB_POLL_INTERVAL", 1)))
+        app.config.setdefault("JOB_MAX_ATTEMPTS", int(os.environ.get("JOB_MAX_ATTEMPTS", 5)))
+        app.config.setdefault("JOB_BACKOFF_BASE", float(os.environ.get("JOB_BACKOFF_BASE", 10)))
+        app.config.setdefault("JOB_BACKOFF_MAX", float(os.environ.get("JOB_BACKOFF_MAX", 3600)))
+        app.config.setdefault("JOB_LEASE_SECONDS", int(os.environ.get("JOB_LEASE_SECONDS", 300)))
+        app.config.setdefault("JOB_RETENTION", int(os.environ.get("JOB_RETENTION", 24 * 3600)))
+        app.extensions["jobs"] = self
+
+    # ---------- registering and enqueueing ----------
+    def concurrency(self, job_type):
+        limit = job_type.concurrency
+        return self.app.config[limit] if isinstance(limit, str) else limit
+
+    def handler(self, name, concurrency=1, priority=0, max_attempts=None):
+        """Registers `func(**payload)` as the handler for jobs of type `name`."""
+        def decorator(func):
+            self.types[name] = JobType(name, func, concurrency, priority, max_attempts)
+            return func
+        return decorator
+
+    @property
+    def eager(self):
+        return self.app.config["JOBS_EAGER"] or self.app.testing
+
+    def enqueue(self, name, payload=None, priority=None, delay=0, key=None):
+        """
+        Queues `name(**payload)` to run in the worker, `delay` seconds from now.
+        Returns: the job id (the existing job's id when `key` is a duplicate),
+        or None when the job was run eagerly.
+        """
+        job_type = self.types[name]
+        payload = payload or {}
+        if self.eager:
+            # In a context of its own, like in the worker: own session, not part of the request
+            try:
+                with self.app.app_context():
+                    job_type.func(**payload)
+            except Exception:
+                logger.exception("Eager job %s failed", name)
+            return None
+
+        t = self.table
+        values = self._row(job_type, payload, priority, delay, key)
+        try:
+            with self.db.engine.begin() as conn:
+                return conn.execute(insert(t).values(values)).inserted_primary_key[0]
+        except IntegrityError:
+            if key is None:
+                raise
+            with self.db.engine.connect() as conn:
+                return conn.execute(select(t.c.id).where(t.c.idempotency_key == key)).scalar()
+
+    def cancel(self, keys):
+        """
+        Forgets the jobs enqueued under the idempotency `keys`, once what they
+        were for is gone: queued ones are deleted, and running or finished
+        ones give their key up, so a new row that gets the same id or file can
+        enqueue it again. Returns: the number of queued jobs deleted
+        """
+        t = self.table
+        keys = list(keys)
+        if not keys:
+            return 0
+        with self.db.engine.begin() as conn:
+            cancelled = conn.execute(delete(t).where(t.c.idempotency_key.in_(keys), t.c.status == QUEUED)).rowcount
+            conn.execute(update(t).where(t.c.idempotency_key.in_(keys)).values(idempotency_key=None))
+        return cancelled
+
+    def enqueue_many(self, name, payloads, priority=None, delay=0):
+        """Queues `name(**payload)` for each of `payloads` in one INSERT (no idempotency keys)."""
+        job_type = self.types[name]
+        payloads = list(payloads)
+        if not payloads:
+            return
+        if self.eager:
+            for payload in payloads:
+                self.enqueue(name, payload)
+            return
+        rows = [self._row(job_type, payload, priority, delay, None) for payload in payloads]
+        with self.db.engine.begin() as conn:
+            conn.execute(insert(self.table), rows)
+
+    def _row(self, job_type, payload, priority, delay, key):
+        now = datetime.utcnow()
+        return {
+            "type": job_type.name,
+            "payload": json.dumps(payload),
+            "priority": job_type.priority if priority is None else priority,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": job_type.max_attempts or self.app.config["JOB_MAX_ATTEMPTS"],
+            "run_at": now + timedelta(seconds=delay),
+            "idempotency_key": key,
+            "created_at": now,
+        }
+
+    # ---------- worker ----------
+    def run_worker(self, install_signals=True):
+        """Claims and runs jobs until SIGTERM/SIGINT; running jobs are allowed to finish."""
+        if install_signals:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: self._stop.set())
+        threads = self.app.config["JOB_WORKER_THREADS"]
+        pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job")
+        logger.info("Job worker %s started: %s", self.worker_id, ", ".join(sorted(self.types)))
+        next_sweep = 0
+        try:
+            with self.app.app_context():
+                while not self._stop.is_set():
+                    if time.monotonic() >= next_sweep:
+                        self.sweep()
+                        next_sweep = time.monotonic() + self.app.config["JOB_LEASE_SECONDS"] / 3
+                    free = threads - len(self._running)
+                    claimed = self.claim(free) if free > 0 else []
+                    for job in claimed:
+                        pool.submit(self._run_claimed, job)
+                    if not claimed:
+                        self._stop.wait(self.app.config["JOB_POLL_INTERVAL"])
+        finally:
+            pool.shutdown(wait=True)
+            logger.info("Job worker %s stopped", self.worker_id)
+
+    def _free_types(self):
+        with self._lock:
+            running = list(self._running.values())
+        return [
+            name for name, job_type in self.types.items()
+            if running.count(name) < self.concurrency(job_type)
+        ]
+
+    def claim(self, limit):
+        """Marks up to `limit` due jobs as running in this worker. Returns their rows."""
+        t = self.table
+        claimed = []
+        free_types = self._free_types()
+        if not free_types:
+            return claimed
+        now = datetime.utcnow()
+        with self.db.engine.connect() as conn:
+            candidates = conn.execute(
+                select(t.c.id, t.c.type)
+                .where(t.c.status == QUEUED, t.c.run_at <= now, t.c.type.in_(free_types))
+                .order_by(t.c.priority.desc(), t.c.run_at, t.c.id)
+                .limit(limit * 4)
+            ).all()
+        for job_id, name in candidates:
+            if len(claimed) >= limit:
+                break
+            with self._lock:
+                if list(self._running.values()).count(name) >= self.concurrency(self.types[name]):
+                    continue
+                self._running[job_id] = name
+            with self.db.engine.begin() as conn:
+                won = conn.execute(
+                    update(t)
+                    .where(t.c.id == job_id, t.c.status == QUEUED)
+                    .values(status=RUNNING, locked_by=self.worker_id, locked_at=now, attempts=t.c.attempts + 1)
+                ).rowcount == 1
+                row = conn.execute(select(t).where(t.c.id == job_id)).first() if won else None
+            if row is None:
+                # Another worker got there first
+                with self._lock:
+                    self._running.pop(job_id, None)
+                continue
+            claimed.append(row)
+        return claimed
+
+    def _run_claimed(self, job):
+        with self.app.app_context():
+            self._run(job)
+
+    def _run(self, job):
+        t = self.table
+        error = None
+        try:
+            self.types[job.type].func(**json.loads(job.payload))
+        except Exception as e:
+            logger.exception("Job %s (%s) failed, attempt %s/%s", job.id, job.type, job.attempts, job.max_attempts)
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+
+        now = datetime.utcnow()
+        if error is None:
+            values = {"status": DONE, "finished_at": now, "last_error": None}
+        elif job.attempts >= job.max_attempts:
+            values = {"status": FAILED, "finished_at": now, "last_error": error}
+        else:
+            values = {"status": QUEUED, "run_at": now + timedelta(seconds=self.backoff(job.attempts)), "last_error": error}
+        with self.db.engine.begin() as conn:
+            conn.execute(
+                update(t)
+                .where(t.c.id == job.id, t.c.locked_by == self.worker_id)
+                .values(locked_by=None, locked_at=None, **values)
+            )
+
+    def backoff(self, attempts):
+        delay = min(self.app.config["JOB_BACKOFF_BASE"] * 2 ** (attempts - 1), self.app.config["JOB_BACKOFF_MAX"])
+        return delay * random.uniform(0.5, 1.5)
+
+    def sweep(self):
+        """Renews this worker's leases, requeues jobs whose worker died and drops old finished jobs."""
+        t = self.table
+        now = datetime.utcnow()
+        with self._lock:
+            mine = list(self._running)
+        with self.db.engine.begin() as conn:
+            if mine:
+                conn.execute(update(t).where(t.c.id.in_(mine), t.c.locked_by == self.worker_id).values(locked_at=now))
+            expired = conn.execute(
+                update(t)
+                .where(t.c.status == RUNNING, t.c.locked_at < now - timedelta(seconds=self.app.config["JOB_LEASE_SECONDS"]))
+                .values(status=QUEUED, locked_by=None, locked_at=None, last_error="lease expired")
+            ).rowcount
+            # Finished jobs are kept a while so their idempotency keys still dedupe
+            conn.execute(delete(t).where(
+                t.c.status == DONE,
+                t.c.finished_at < now - timedelta(seconds=self.app.config["JOB_RETENTION"]),
+            ))
+        if expired:
+            logger.warning("Requeued %s jobs whose worker stopped renewing them", expired)
+
+    def retry_failed(self, name=None):
+        """Queues failed jobs (of type `name`, or all) again with a fresh set of attempts."""
+        t = self.table
+        stmt = update(t).where(t.c.status == FAILED)
+        if name:
+            stmt = stmt.where(t.c.type == name)
+        with self.db.engine.begin() as conn:
+            return conn.execute(
+                stmt.values(status=QUEUED, attempts=0, run_at=datetime.utcnow(), finished_at=None)
+            ).rowcount
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,525 @@
+import atexit
+import bisect
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from counters import BufferedWriter
+from dedup import insert_ignore
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_BOARD = "xp"
+
+
+class ScoreRejected(Exception):
+    """A submission failed the sanity checks; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class GameRules:
+    """
+    What a plausible finished game looks like, and what it is worth.
+
+    `board` is how the game's leaderboard ranks players: "best" (highest
+    single score) or "wins" (games won). The checks are sanity checks on
+    what the browser reports, not proof the game was played.
+    """
+
+    def __init__(self, results, board, min_seconds=0, min_seconds_per_move=0,
+                 max_moves=None, max_score=0, max_points_per_move=None, win_score=None, xp=None):
+        self.results = results
+        self.board = board
+        self.min_seconds = min_seconds
+        self.min_seconds_per_move = min_seconds_per_move
+        self.max_moves = max_moves
+        self.max_score = max_score
+        self.max_points_per_move = max_points_per_move
+        self.win_score = win_score
+        self.xp = xp or {}
+
+    def validate(self, score, result, moves, seconds):
+        if result not in self.results:
+            raise ScoreRejected(f"result must be one of: {', '.join(self.results)}")
+        if not isinstance(score, int) or isinstance(score, bool) or not 0 <= score <= self.max_score:
+            raise ScoreRejected(f"score must be an integer between 0 and {self.max_score}")
+        if self.max_moves is not None:
+            if not isinstance(moves, int) or isinstance(moves, bool) or not 1 <= moves <= self.max_moves:
+                raise ScoreRejected(f"moves must be an integer between 1 and {self.max_moves}")
+            if self.max_points_per_move and score > moves * self.max_points_per_move:
+                raise ScoreRejected("score is not possible in that many moves", 422)
+        if self.win_score is not None and (result == "win") != (score >= self.win_score):
+            raise ScoreRejected("result does not match score", 422)
+        # Moves are only checked (and known to be a number) for games that count them
+        counted_moves = moves if self.max_moves is not None else 0
+        if seconds < max(self.min_seconds, counted_moves * self.min_seconds_per_move):
+            raise ScoreRejected("game finished too quickly", 422)
+
+    def xp_for(self, score, result):
+        award = self.xp.get(result, 0)
+        return award(score) if callable(award) else award
+
+
+GAMES = {
+    # 30 moves, 60 points per candy with combo multipliers, target 2000 (static/js/candy.js)
+    "candy": GameRules(
+        results=("win", "lose"), board="best",
+        min_seconds_per_move=0.5, max_moves=30, max_score=90000, max_points_per_move=3000, win_score=2000,
+        xp={"win": lambda score: 50 + min(score // 50, 200), "lose": lambda score: min(score // 50, 200)},
+    ),
+    "pool": GameRules(results=("win", "lose"), board="wins", min_seconds=20, xp={"win": 40, "lose": 10}),
+    "tic_tac_toe": GameRules(results=("win", "lose", "draw"), board="wins", min_seconds=3,
+                             xp={"win": 15, "draw": 8, "lose": 3}),
+}
+
+
+class _Fenwick:
+    """Prefix sums over sublist lengths, for O(log n) position lookups."""
+
+    def __init__(self, sizes):
+        self.tree = [0] * (len(sizes) + 1)
+        for i, n in enumerate(sizes):
+            self.add(i, n)
+
+    def add(self, i, n):
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += n
+            i += i & -i
+
+    def prefix(self, i):
+        """Sum of sizes[:i]."""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, position):
+        """(sublist index, offset inside it) of the element at `position`."""
+        i, step = 0, 1 << (len(self.tree).bit_length() - 1)
+        while step:
+            j = i + step
+            if j < len(self.tree) and self.tree[j] <= position:
+                i = j
+                position -= self.tree[j]
+            step >>= 1
+        return i, position
+
+
+class SortedRanks:
+    """
+    Sorted multiset with positional access: add, remove, rank and slicing
+    in O(log n). Keys are kept in sublists of at most 2 * LOAD, found by
+    bisecting the sublist maxima, with a Fenwick tree over sublist sizes for
+    rank <-> position. Much smaller in memory than a skip list of node
+    objects, which matters at hundreds of thousands of players per board.
+    """
+
+    LOAD = 500
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._lists = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._reindex()
+
+    def _reindex(self):
+        self._maxes = [sub[-1] for sub in self._lists]
+        self._index = _Fenwick([len(sub) for sub in self._lists])
+        self._len = sum(len(sub) for sub in self._lists)
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._lists:
+            self._lists.append([key])
+            self._reindex()
+            return
+        pos = bisect.bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._maxes[pos] = key
+        sub = self._lists[pos]
+        bisect.insort(sub, key)
+        self._len += 1
+        if len(sub) > 2 * self.LOAD:
+            self._lists[pos:pos + 1] = [sub[:self.LOAD], sub[self.LOAD:]]
+            self._reindex()
+        else:
+            self._index.add(pos, 1)
+
+    def remove(self, key):
+        pos = bisect.bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            raise KeyError(key)
+        sub = self._lists[pos]
+        i = bisect.bisect_left(sub, key)
+        if i == len(sub) or sub[i] != key:
+            raise KeyError(key)
+        del sub[i]
+        self._len -= 1
+        if not sub:
+            del self._lists[pos]
+            self._reindex()
+        else:
+            self._maxes[pos] = sub[-1]
+            self._index.add(pos, -1)
+
+    def rank(self, key):
+        """Number of keys smaller than `key`."""
+        pos = bisect.bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return self._len
+        return self._index.prefix(pos) + bisect.bisect_left(self._lists[pos], key)
+
+    def slice(self, start, stop):
+        start, stop = max(start, 0), min(stop, self._len)
+        out = []
+        if start >= stop:
+            return out
+        pos, i = self._index.find(start)
+        while len(out) < stop - start:
+            sub = self._lists[pos]
+            out.extend(sub[i:i + stop - start - len(out)])
+            pos, i = pos + 1, 0
+        return out
+
+
+class Leaderboard:
+    """One board: a value per player, ranked highest first."""
+
+    def __init__(self, entries=()):
+        self.values = dict(entries)
+        self._ranks = SortedRanks((-v, uid) for uid, v in self.values.items())
+
+    def __len__(self):
+        return len(self._ranks)
+
+    def set(self, user_id, value):
+        old = self.values.get(user_id)
+        if old == value:
+            return
+        if old is not None:
+            self._ranks.remove((-old, user_id))
+        self.values[user_id] = value
+        self._ranks.add((-value, user_id))
+
+    def discard(self, user_id):
+        old = self.values.pop(user_id, None)
+        if old is not None:
+            self._ranks.remove((-old, user_id))
+
+    def rank(self, user_id):
+        """1-based rank, or None for players not on the board."""
+        value = self.values.get(user_id)
+        if value is None:
+            return None
+        return self._ranks.rank((-value, user_id)) + 1
+
+    def page(self, offset, limit):
+        """[(rank, user_id, value), ...]"""
+        return [
+            (offset + i + 1, uid, -neg)
+            for i, (neg, uid) in enumerate(self._ranks.slice(offset, offset + limit))
+        ]
+
+
+class Leaderboards(BufferedWriter):
+    """
+    XP and leaderboards for the browser games.
+
+    `submit()` checks a finished game against its `GameRules`, updates the
+    in-memory boards at once and queues the change; every
+    `LEADERBOARD_FLUSH_INTERVAL` seconds the queue is written in one
+    transaction (`User.xp += n`, per-game stats upserted) and stats other
+    workers wrote since the last pass are read back by their indexed
+    `updated_at`, so every worker converges on the same boards.
+
+    Each game session token counts once: `submit()` inserts its id into
+    `token_table`, whose primary key turns a replay away on any worker and
+    after restarts. Ids are deleted once their token has expired.
+
+    Boards are snapshotted to `LEADERBOARD_SNAPSHOT_PATH` every
+    `LEADERBOARD_SNAPSHOT_INTERVAL` seconds; a starting worker loads the
+    snapshot and only reads stats changed since, instead of scanning the
+    tables.
+    """
+
+    def __init__(self, user_table, stat_table, token_table, app=None, db=None):
+        self.user_table = user_table
+        self.stat_table = stat_table
+        self.token_table = token_table
+        self._lock = threading.Lock()
+        self._pending = {}  # (user_id, game) -> {"plays", "wins", "xp", "best"}
+        self._boards = None
+        self._loaded_pid = None
+        self._synced_at = None
+        self._snapshot_at = 0
+        self._tokens_pruned_at = 0
+        self._xp_statement = (
+            update(user_table)
+            .where(user_table.c.id == bindparam("_id"))
+            .values(xp=func.coalesce(user_table.c.xp, 0) + bindparam("_n"))
+        )
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("LEADERBOARD_FLUSH_INTERVAL", float(os.environ.get("LEADERBOARD_FLUSH_INTERVAL", 5)))
+        app.config.setdefault("LEADERBOARD_SNAPSHOT_INTERVAL", float(os.environ.get("LEADERBOARD_SNAPSHOT_INTERVAL", 300)))
+        # This instance's own, not a folder every app on the host can write to
+        app.config.setdefault("LEADERBOARD_SNAPSHOT_PATH", os.environ.get(
+            "LEADERBOARD_SNAPSHOT_PATH", os.path.join(app.instance_path, "leaderboards.json.gz")))
+        app.config.setdefault("GAME_MAX_SECONDS", int(os.environ.get("GAME_MAX_SECONDS", 6 * 3600)))
+        # Boards loaded for another app mean nothing to this one
+        self._boards = None
+        self._loaded_pid = None
+        self._pending = {}
+        app.extensions["leaderboards"] = self
+        atexit.register(self.flush)
+
+    @property
+    def flush_interval(self):
+        return self.app.config["LEADERBOARD_FLUSH_INTERVAL"]
+
+    # ---------- reading ----------
+    def _ready(self):
+        if self._loaded_pid != os.getpid():
+            self._ensure_flusher()
+            self.load()
+        return self._boards
+
+    def board_names(self):
+        return (GLOBAL_BOARD,) + tuple(GAMES)
+
+    def page(self, board, offset=0, limit=50):
+        boards = self._ready()
+        with self._lock:
+            return boards[board].page(offset, limit), len(boards[board])
+
+    def rank(self, board, user_id):
+        """(rank, value) for a player, or (None, None)."""
+        boards = self._ready()
+        with self._lock:
+            b = boards[board]
+            return b.rank(user_id), b.values.get(user_id)
+
+    # ---------- writing ----------
+    def submit(self, user_id, game, score, result, moves, started_at, token_id):
+        """Records a finished game. Returns the XP it earned; raises ScoreRejected."""
+        rules = GAMES.get(game)
+        if rules is None:
+            raise ScoreRejected("unknown game", 404)
+        seconds = time.time() - started_at
+        rules.validate(score, result, moves, seconds)
+        xp = rules.xp_for(score, result)
+
+        boards = self._ready()
+        self._use_token(token_id)
+        with self._lock:
+            entry = self._pending.setdefault((user_id, game), {"plays": 0, "wins": 0, "xp": 0, "best": 0})
+            entry["plays"] += 1
+            entry["wins"] += result == "win"
+            entry["xp"] += xp
+            entry["best"] = max(entry["best"], score)
+
+            boards[GLOBAL_BOARD].set(user_id, boards[GLOBAL_BOARD].values.get(user_id, 0) + xp)
+            board = boards[game]
+            current = board.values.get(user_id, 0)
+            if rules.board == "best":
+                board.set(user_id, max(current, score))
+            elif result == "win":
+                board.set(user_id, current + 1)
+        return xp
+
+    def _use_token(self, token_id):
+        """Raises ScoreRejected if a score was already submitted with this game session token."""
+        stmt = insert_ignore(self.token_table, self.db.engine.dialect.name)
+        result = self.db.session.execute(stmt, {"id": token_id, "used_at": datetime.utcnow()})
+        self.db.session.commit()
+        if result.rowcount != 1:
+            raise ScoreRejected("game already submitted", 409)
+
+    def pending_xp(self, user_id):
+        with self._lock:
+            return sum(v["xp"] for (uid, _), v in self._pending.items() if uid == user_id)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            if self._boards:
+                for board in self._boards.values():
+                    board.discard(user_id)
+            for key in [k for k in self._pending if k[0] == user_id]:
+                del self._pending[key]
+
+    def _upsert(self, dialect_name):
+        t = self.stat_table
+        if dialect_name in ("postgresql", "sqlite"):
+            stmt = (postgresql if dialect_name == "postgresql" else sqlite).insert(t)
+            new = stmt.excluded
+            return stmt.on_conflict_do_update(index_elements=["user_id", "game"], set_={
+                "plays": t.c.plays + new.plays,
+                "wins": t.c.wins + new.wins,
+                "xp": t.c.xp + new.xp,
+                "best_score": case((new.best_score > t.c.best_score, new.best_score), else_=t.c.best_score),
+                "updated_at": new.updated_at,
+            })
+        stmt = mysql.insert(t)
+        new = stmt.inserted
+        return stmt.on_duplicate_key_update(
+            plays=t.c.plays + new.plays,
+            wins=t.c.wins + new.wins,
+            xp=t.c.xp + new.xp,
+            best_score=case((new.best_score > t.c.best_score, new.best_score), else_=t.c.best_score),
+            updated_at=new.updated_at,
+        )
+
+    def flush(self):
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+        if self._loaded_pid != os.getpid() and not batch:
+            return
+
+        now = datetime.utcnow()
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    if batch:
+                        conn.execute(self._upsert(conn.dialect.name), [
+                            {"user_id": uid, "game": game, "plays": v["plays"], "wins": v["wins"],
+                             "xp": v["xp"], "best_score": v["best"], "updated_at": now}
+                            for (uid, game), v in batch.items()
+                        ])
+                        xp = defaultdict(int)
+                        for (uid, _), v in batch.items():
+                            xp[uid] += v["xp"]
+                        conn.execute(self._xp_statement, [{"_id": uid, "_n": n} for uid, n in xp.items() if n])
+                    if time.time() - self._tokens_pruned_at > 3600:
+                        # An expired token is refused before its id is looked at
+                        expired = now - timedelta(seconds=self.app.config["GAME_MAX_SECONDS"])
+                        conn.execute(delete(self.token_table).where(self.token_table.c.used_at < expired))
+                        self._tokens_pruned_at = time.time()
+                    if self._loaded_pid == os.getpid():
+                        # Overlap the window so slow concurrent commits are not missed; re-reading is harmless
+                        since = self._synced_at - timedelta(seconds=30)
+                        rows = self._changed_since(conn, since)
+        except Exception:
+            logger.exception("Leaderboard flush failed; will retry")
+            with self._lock:
+                for key, v in batch.items():
+                    self._merge_pending(key, v)
+            return
+
+        if self._loaded_pid == os.getpid():
+            with self._lock:
+                self._apply_rows(rows)
+                self._synced_at = now
+            if time.time() - self._snapshot_at > self.app.config["LEADERBOARD_SNAPSHOT_INTERVAL"]:
+                self.snapshot()
+
+    def _merge_pending(self, key, v):
+        entry = self._pending.setdefault(key, {"plays": 0, "wins": 0, "xp": 0, "best": 0})
+        entry["plays"] += v["plays"]
+        entry["wins"] += v["wins"]
+        entry["xp"] += v["xp"]
+        entry["best"] = max(entry["best"], v["best"])
+
+    # ---------- loading ----------
+    def _changed_since(self, conn, since):
+        s, u = self.stat_table, self.user_table
+        query = (
+            select(s.c.user_id, s.c.game, s.c.wins, s.c.best_score, u.c.xp)
+            .join(u, u.c.id == s.c.user_id)
+        )
+        if since is not None:
+            query = query.where(s.c.updated_at >= since)
+        return conn.execute(query).all()
+
+    def _apply_rows(self, rows):
+        """Sets absolute values from the database, then re-adds what is still pending here."""
+        for user_id, game, wins, best_score, xp in rows:
+            rules = GAMES.get(game)
+            if rules is None:
+                continue
+            pending = self._pending.get((user_id, game))
+            if rules.board == "best":
+                value = max(best_score or 0, pending["best"] if pending else 0)
+            else:
+                value = (wins or 0) + (pending["wins"] if pending else 0)
+            if value:
+                self._boards[game].set(user_id, value)
+            total = (xp or 0) + sum(v["xp"] for (uid, _), v in self._pending.items() if uid == user_id)
+            self._boards[GLOBAL_BOARD].set(user_id, total)
+
+    def load(self):
+        """Builds the boards from the snapshot plus newer stats, or from the tables if there is none."""
+        with self._lock:
+            if self._loaded_pid == os.getpid():
+                return
+            boards, since = self._read_snapshot()
+            started = datetime.utcnow()
+            with self.app.app_context():
+                with self.db.engine.connect() as conn:
+                    if boards is None:
+                        boards = {name: Leaderboard() for name in self.board_names()}
+                        since = None
+                    rows = self._changed_since(conn, since)
+            self._boards = boards
+            self._apply_rows(rows)
+            self._synced_at = started
+            self._loaded_pid = os.getpid()
+        if since is None:
+            self.snapshot()
+
+    def _read_snapshot(self):
+        path = self.app.config["LEADERBOARD_SNAPSHOT_PATH"]
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return None, None
+        if sorted(data.get("boards", {})) != sorted(self.board_names()):
+            return None, None
+        boards = {name: Leaderboard((uid, value) for uid, value in entries)
+                  for name, entries in data["boards"].items()}
+        # Stats written up to the snapshot are in it; re-read a margin before it
+        saved_at = datetime.fromtimestamp(data["saved_at"], timezone.utc).replace(tzinfo=None)
+        since = saved_at - timedelta(seconds=30)
+        return boards, since
+
+    def snapshot(self):
+        """Writes every board to LEADERBOARD_SNAPSHOT_PATH atomically."""
+        with self._lock:
+            if not self._boards:
+                return
+            data = {
+                "saved_at": (self._synced_at or datetime.utcnow()).replace(tzinfo=timezone.utc).timestamp(),
+                "boards": {name: list(board.values.items()) for name, board in self._boards.items()},
+            }
+        path = self.app.config["LEADERBOARD_SNAPSHOT_PATH"]
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as fh:
+                json.dump(data, fh, separators=(",", ":"))
+            os.replace(tmp, path)
+            self._snapshot_at = time.time()
+        except OSError:
+            logger.exception("Leaderboard snapshot failed")
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+from collections import defaultdict
+
+from sqlalchemy import select
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBus:
+    """
+    Host-local pub/sub, standing in for Redis pub/sub while every worker
+    runs on the same host: a subscribed process binds a Unix datagram socket
+    in `directory` and `publish()` sends each message to every socket there.
+
+    Delivery is best effort: a message for a subscriber whose queue is full
+    is dropped, and sockets left by dead processes are removed by the next
+    publisher that finds them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._sender = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def subscribers(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith(".sock")]
+
+    def publish(self, data, subscribers=None):
+        sender = self._socket()
+        for path in self.subscribers() if subscribers is None else subscribers:
+            try:
+                sender.sendto(data, path)
+            except ConnectionRefusedError:
+                # Nobody bound to it any more: the process died without cleaning up
+                self._unlink(path)
+            except FileNotFoundError:
+                pass
+            except BlockingIOError:
+                logger.debug("Subscriber %s is not keeping up, message dropped", path)
+
+    def subscribe(self):
+        """Binds this process's socket; read it with `receive()` when it is readable."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        self._unlink(path)  # left by an earlier process with the same pid
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        sock.setblocking(False)
+        return sock
+
+    def unsubscribe(self, sock):
+        path = sock.getsockname()
+        sock.close()
+        self._unlink(path)
+
+    @staticmethod
+    def receive(sock):
+        """Every message waiting on a subscribed socket."""
+        messages = []
+        while True:
+            try:
+                messages.append(sock.recv(65536))
+            except (BlockingIOError, InterruptedError):
+                return messages
+
+    def _socket(self):
+        # Forked workers each open their own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._sender.setblocking(False)
+                self._pid = os.getpid()
+            return self._sender
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class Subscription:
+    """One client's stream: the uploads it watches and their changes not sent yet."""
+
+    __slots__ = ("ids", "changes", "wake")
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.changes = {}  # upload_id -> {"views": n, "likes": n}
+        self.wake = asyncio.Event()
+
+    def take(self):
+        changes, self.changes = self.changes, {}
+        self.wake.clear()
+        return changes
+
+
+class LiveCounters:
+    """
+    Pushes view and like counts to the pages showing them, as Server-Sent
+    Events from /api/live?ids=1,2,3.
+
+    Counts reach the database in batches (see counters.py). After writing
+    one, a worker reads the new values of those uploads back in one query
+    and publishes them on the host's `LocalBus`, unless no worker has a
+    client to send them to. Every worker holding streams keeps the latest
+    value per upload and, every `LIVE_INTERVAL` seconds, sends each client
+    one message with the watched uploads that changed: at most one update
+    per upload and interval, however many views come in and however many
+    workers count them.
+
+    The streams are held by the ASGI server (asgi.py) on its event loop, so
+    an idle client costs a socket and a few small objects, not a thread.
+    Served by a sync server, /api/live sends the current counts and has the
+    browser reconnect after `LIVE_POLL_INTERVAL` seconds instead: polling,
+    one query per page and interval.
+    """
+
+    # Uploads per bus message, well within a datagram
+    CHUNK = 500
+
+    def __init__(self, table, columns, app=None, db=None):
+        self.table = table
+        self.columns = tuple(columns)
+        self._pid = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("LIVE_DIR", os.environ.get(
+            "LIVE_DIR", os.path.join(tempfile.gettempdir(), "gamerhub-live")))
+        app.config.setdefault("LIVE_INTERVAL", float(os.environ.get("LIVE_INTERVAL", 1)))
+        app.config.setdefault("LIVE_HEARTBEAT", float(os.environ.get("LIVE_HEARTBEAT", 15)))
+        app.config.setdefault("LIVE_POLL_INTERVAL", float(os.environ.get("LIVE_POLL_INTERVAL", 10)))
+        app.config.setdefault("LIVE_MAX_IDS", int(os.environ.get("LIVE_MAX_IDS", 100)))
+        self.bus = LocalBus(app.config["LIVE_DIR"])
+        app.extensions["live"] = self
+
+    def parse_ids(self, value):
+        """The upload ids of an `ids=1,2,3` argument. Raises: ValueError"""
+        try:
+            ids = sorted({int(part) for part in value.split(",") if part.strip()})
+        except ValueError:
+            raise ValueError("ids must be comma-separated upload ids") from None
+        if not ids:
+            raise ValueError("ids is required")
+        if len(ids) > self.app.config["LIVE_MAX_IDS"]:
+            raise ValueError(f"at most {self.app.config['LIVE_MAX_IDS']} ids")
+        return ids
+
+    def values(self, ids):
+        """{upload_id: {"views": n, "likes": n}} as stored, for the uploads that exist."""
+        t = self.table
+        with self.app.app_context():
+            with self.db.engine.connect() as conn:
+                rows = conn.execute(select(t.c.id, *[t.c[c] for c in self.columns]).where(t.c.id.in_(ids))).all()
+        return {row[0]: {c: v or 0 for c, v in zip(self.columns, row[1:])} for row in rows}
+
+    @staticmethod
+    def message(values, retry=None):
+        """One event of the stream; `retry` (seconds) is how long a browser waits to reconnect."""
+        head = f"retry: {int(retry * 1000)}\n" if retry is not None else ""
+        return f"{head}data: {json.dumps(values, separators=(',', ':'))}\n\n".encode()
+
+    # ---------- publishing (any worker) ----------
+    def publish(self, ids):
+        """Sends the current counts of `ids` to every worker with clients; called after counts are written."""
+        subscribers = self.bus.subscribers()
+        if not subscribers or not ids:
+            return
+        try:
+            values = list(self.values(list(ids)).items())
+            for start in range(0, len(values), self.CHUNK):
+                data = json.dumps(dict(values[start:start + self.CHUNK]), separators=(",", ":")).encode()
+                self.bus.publish(data, subscribers)
+        except Exception:
+            logger.exception("Publishing live counts failed")
+
+    # ---------- streaming (on the ASGI event loop) ----------
+    def subscribe(self, ids):
+        if self._pid != os.getpid():
+            self._start()
+        subscription = Subscription(ids)
+        for upload_id in ids:
+            self._watchers[upload_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for upload_id in subscription.ids:
+            watchers = self._watchers.get(upload_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._watchers[upload_id]
+
+    def close(self):
+        """Leaves the bus, at server shutdown: this worker's clients are gone."""
+        if self._pid != os.getpid():
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._dispatcher.cancel()
+        self.bus.unsubscribe(self._sock)
+        self._pid = None
+
+    def _start(self):
+        # First client of this worker: join the bus and start the dispatcher on this loop
+        loop = asyncio.get_running_loop()
+        self._pid = os.getpid()
+        self._watchers = defaultdict(set)  # upload_id -> subscriptions
+        self._changed = {}                 # upload_id -> latest counts since the last dispatch
+        self._sock = self.bus.subscribe()
+        loop.add_reader(self._sock.fileno(), self._receive)
+        self._dispatcher = loop.create_task(self._dispatch_forever())
+
+    def _receive(self):
+        for data in self.bus.receive(self._sock):
+            try:
+                values = json.loads(data)
+            except ValueError:
+                continue
+            for key, counts in values.items():
+                upload_id = int(key)
+                if upload_id in self._watchers:
+                    self._changed[upload_id] = counts
+
+    async def _dispatch_forever(self):
+        while True:
+            await asyncio.sleep(self.app.config["LIVE_INTERVAL"])
+            changed, self._changed = self._changed, {}
+            for upload_id, counts in changed.items():
+                for subscription in self._watchers.get(upload_id, ()):
+                    subscription.changes[upload_id] = counts
+                    subscription.wake.set()
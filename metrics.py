@@ -0,0 +1,252 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import Response, abort, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+HISTOGRAMS = {
+    # name: (help, buckets, extra label)
+    "http_request_duration_seconds": ("Request latency per endpoint", LATENCY_BUCKETS, None),
+    "http_response_size_bytes": ("Response body size per endpoint", BYTES_BUCKETS, None),
+    "db_queries_per_request": ("SQL statements per request", COUNT_BUCKETS, None),
+    "request_phase_seconds": ("Time per request spent in db/template/bcrypt", LATENCY_BUCKETS, "phase"),
+    # Connection pools, see database.py; waits past DB_POOL_TIMEOUT time out
+    "db_pool_wait_seconds": ("Time to get a connection from the pool", LATENCY_BUCKETS, "engine"),
+    "db_pool_hold_seconds": ("Time a connection stays checked out", LATENCY_BUCKETS, "engine"),
+}
+
+GAUGES = {
+    # name: help; workers are merged by taking the largest value
+    "process_peak_rss_bytes": "Largest worker resident memory seen at the end of a request, per endpoint",
+    "db_pool_in_use_peak": "Most connections one worker had checked out at once, per engine",
+}
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def current_rss():
+    """This process's resident memory in bytes (its peak so far where there is no /proc)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bucket_index(buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets)
+
+
+class Metrics:
+    """
+    Per-endpoint histograms for latency, response size, query count and the
+    time spent in SQL, template rendering and password hashing, and the
+    largest worker RSS seen after each endpoint's requests.
+
+    Each gunicorn worker keeps its own histograms and writes them to
+    `METRICS_DIR/<pid>.json` at most every `METRICS_DUMP_INTERVAL` seconds;
+    `/metrics` sums every worker's file, so the totals are the same
+    whichever worker answers the scrape.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._series = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._gauges = {}  # (name, labels) -> value
+        self._last_dump = 0.0
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault("METRICS_DIR", os.environ.get(
+            "METRICS_DIR", os.path.join(tempfile.gettempdir(), "gamerhub-metrics")))
+        app.config.setdefault("METRICS_DUMP_INTERVAL", float(os.environ.get("METRICS_DUMP_INTERVAL", 1)))
+        app.config.setdefault("METRICS_TOKEN", os.environ.get("METRICS_TOKEN"))
+        app.config.setdefault("METRICS_SERVER_TIMING", os.environ.get("METRICS_SERVER_TIMING") == "1")
+        os.makedirs(app.config["METRICS_DIR"], exist_ok=True)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.add_url_rule("/metrics", "metrics", self.export)
+        app.extensions["metrics"] = self
+        # Process-wide: listening again for another app would count every statement twice
+        if not self._listening:
+            self._listening = True
+            event.listen(Engine, "before_cursor_execute", self._query_started)
+            event.listen(Engine, "after_cursor_execute", self._query_finished)
+            atexit.register(self.dump)
+
+    # ---------- collection ----------
+    def observe(self, name, labels, value):
+        _, buckets, _ = HISTOGRAMS[name]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(buckets) + 2)
+            series[_bucket_index(buckets, value)] += 1
+            series[-1] += value
+
+    def observe_max(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if value > self._gauges.get(key, -1):
+                self._gauges[key] = value
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the wrapped block's duration to the current request's `name` phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if has_request_context():
+                phases = g.setdefault("phase_times", defaultdict(float))
+                phases[name] += time.perf_counter() - start
+
+    def _start_request(self):
+        g.request_start = time.perf_counter()
+        g.setdefault("phase_times", defaultdict(float))
+
+    def _query_started(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            # Statements run with count_query=False (session loads, see
+            # sessions.py) are timed but don't count against the route
+            if context.execution_options.get("count_query", True):
+                g.query_count = g.get("query_count", 0) + 1
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _query_finished(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and conn.info.get("query_start"):
+            elapsed = time.perf_counter() - conn.info["query_start"].pop()
+            g.setdefault("phase_times", defaultdict(float))["db"] += elapsed
+
+    def _template_started(self, sender, template, context, **extra):
+        g.template_start = time.perf_counter()
+
+    def _template_finished(self, sender, template, context, **extra):
+        start = g.pop("template_start", None)
+        if start is not None:
+            g.setdefault("phase_times", defaultdict(float))["template"] += time.perf_counter() - start
+
+    def _finish_request(self, response):
+        start = g.get("request_start")
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        labels = {"endpoint": request.endpoint or "unmatched", "method": request.method}
+        phases = g.get("phase_times", {})
+
+        self.observe("http_request_duration_seconds", labels, elapsed)
+        self.observe("http_response_size_bytes", labels, response.content_length or 0)
+        self.observe("db_queries_per_request", labels, g.get("query_count", 0))
+        for phase in ("db", "template", "bcrypt"):
+            self.observe("request_phase_seconds", dict(labels, phase=phase), phases.get(phase, 0.0))
+        self.observe_max("process_peak_rss_bytes", labels, current_rss())
+
+        if self.app.config["METRICS_SERVER_TIMING"]:
+            parts = [
+                f'db;dur={phases.get("db", 0) * 1000:.1f};desc="{g.get("query_count", 0)} queries"',
+                f'tpl;dur={phases.get("template", 0) * 1000:.1f}',
+            ]
+            if phases.get("bcrypt"):
+                parts.append(f'bcrypt;dur={phases["bcrypt"] * 1000:.1f}')
+            parts.append(f"total;dur={elapsed * 1000:.1f}")
+            response.headers["Server-Timing"] = ", ".join(parts)
+
+        if time.time() - self._last_dump >= self.app.config["METRICS_DUMP_INTERVAL"]:
+            self.dump()
+        return response
+
+    # ---------- cross-worker aggregation ----------
+    def _path(self, pid=None):
+        return os.path.join(self.app.config["METRICS_DIR"], f"{pid or os.getpid()}.json")
+
+    def dump(self):
+        with self._lock:
+            payload = [[name, list(labels), series] for (name, labels), series in self._series.items()]
+            payload += [[name, list(labels), [value]] for (name, labels), value in self._gauges.items()]
+            self._last_dump = time.time()
+        tmp = self._path() + ".tmp"
+        try:
+            with open(tmp, "w") as fh:
+                json.dump(payload, fh)
+            os.replace(tmp, self._path())
+        except OSError:
+            logger.exception("Could not write metrics snapshot")
+
+    def collect(self):
+        """Sums (gauges: maxes) the snapshots of every worker, including ones that have exited."""
+        self.dump()
+        merged = {}
+        for path in glob.glob(os.path.join(self.app.config["METRICS_DIR"], "*.json")):
+            try:
+                with open(path) as fh:
+                    payload = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for name, labels, series in payload:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                if name in GAUGES:
+                    merged[key] = [max(merged.get(key, series)[0], series[0])]
+                    continue
+                if name not in HISTOGRAMS:
+                    continue
+                total = merged.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    total[i] += value
+        return merged
+
+    def export(self):
+        token = self.app.config["METRICS_TOKEN"]
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(403)
+
+        lines = []
+        merged = self.collect()
+        for name, (help_text, buckets, _) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (series_name, labels), series in sorted(merged.items()):
+                if series_name != name:
+                    continue
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], series[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{label_str}}} {series[-1]}")
+                lines.append(f"{name}_count{{{label_str}}} {cumulative}")
+        for name, help_text in GAUGES.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for (series_name, labels), series in sorted(merged.items()):
+                if series_name == name:
+                    label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_str}}} {series[0]}")
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
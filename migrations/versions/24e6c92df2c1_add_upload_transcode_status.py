@@ -0,0 +1,28 @@
+"""add upload transcode_status and hls_playlist
+
+Revision ID: 24e6c92df2c1
+Revises: 34be61f50204
+Create Date: 2026-10-18 21:48:30.127554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '24e6c92df2c1'
+down_revision = '34be61f50204'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('transcode_status', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('hls_playlist', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.drop_column('hls_playlist')
+        batch_op.drop_column('transcode_status')
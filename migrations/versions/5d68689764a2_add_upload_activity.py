@@ -0,0 +1,35 @@
+"""add upload_activity for trending/top rankings
+
+Revision ID: 5d68689764a2
+Revises: cd5ef4955998
+Create Date: 2026-10-18 18:02:51.630218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d68689764a2'
+down_revision = 'cd5ef4955998'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_activity',
+    sa.Column('upload_id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('points', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['upload_id'], ['upload.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('upload_id', 'hour')
+    )
+    with op.batch_alter_table('upload_activity', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_activity_hour'), ['hour'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('upload_activity', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_activity_hour'))
+
+    op.drop_table('upload_activity')
@@ -0,0 +1,28 @@
+"""add upload thumbnail and poster
+
+Revision ID: 7beeb0bd6684
+Revises: c1a01856158f
+Create Date: 2026-10-18 10:12:41.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7beeb0bd6684'
+down_revision = 'c1a01856158f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('thumbnail', sa.String(length=220), nullable=True))
+        batch_op.add_column(sa.Column('poster', sa.String(length=220), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.drop_column('poster')
+        batch_op.drop_column('thumbnail')
@@ -0,0 +1,60 @@
+"""add search indexes (username prefix, FTS5 tables / tsvector GIN indexes)
+
+Revision ID: 9376edade69c
+Revises: c00e5941677a
+Create Date: 2026-10-18 20:24:41.518303
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9376edade69c'
+down_revision = 'c00e5941677a'
+branch_labels = None
+depends_on = None
+
+USER_VECTOR = (
+    "setweight(to_tsvector('simple', username), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(bio, '')), 'B')"
+)
+UPLOAD_VECTOR = "to_tsvector('simple', regexp_replace(filename, '^[0-9a-f]{32}_|[^[:alnum:]]+', ' ', 'g'))"
+STORED_PREFIX_GLOB = "[0-9a-f]" * 32 + "_*"
+
+
+def upgrade():
+    # IF NOT EXISTS: the app also creates these on databases built with create_all()
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE INDEX IF NOT EXISTS ix_user_username_lower ON "user" ((lower(username) COLLATE "C"))')
+        op.execute(f'CREATE INDEX IF NOT EXISTS ix_user_search ON "user" USING gin (({USER_VECTOR}))')
+        op.execute(f'CREATE INDEX IF NOT EXISTS ix_upload_search ON upload USING gin (({UPLOAD_VECTOR}))')
+    elif dialect == 'sqlite':
+        op.execute('CREATE INDEX IF NOT EXISTS ix_user_username_lower ON "user" (lower(username))')
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(username, bio, prefix='2 3')")
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS upload_search USING fts5(name, prefix='2 3')")
+        op.execute('DELETE FROM user_search')
+        op.execute('DELETE FROM upload_search')
+        op.execute(
+            'INSERT INTO user_search (rowid, username, bio) '
+            'SELECT id, username, coalesce(bio, \'\') FROM "user"'
+        )
+        op.execute(
+            'INSERT INTO upload_search (rowid, name) '
+            f"SELECT id, CASE WHEN filename GLOB '{STORED_PREFIX_GLOB}' THEN substr(filename, 34) "
+            'ELSE filename END FROM upload'
+        )
+    else:
+        op.create_index('ix_user_username_lower', 'user', [sa.text('lower(username)')], unique=False)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_upload_search')
+        op.execute('DROP INDEX IF EXISTS ix_user_search')
+    elif dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS upload_search')
+        op.execute('DROP TABLE IF EXISTS user_search')
+    op.drop_index('ix_user_username_lower', table_name='user')
@@ -0,0 +1,28 @@
+"""add upload content hash
+
+Revision ID: 9c495438e42b
+Revises: 7beeb0bd6684
+Create Date: 2026-10-18 11:03:17.402915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c495438e42b'
+down_revision = '7beeb0bd6684'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_upload_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_content_hash'))
+        batch_op.drop_column('content_hash')
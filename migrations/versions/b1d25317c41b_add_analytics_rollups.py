@@ -0,0 +1,103 @@
+"""add user_stat, user_activity and upload_daily_stat for dashboard analytics
+
+Revision ID: b1d25317c41b
+Revises: cff430bc40e4
+Create Date: 2026-10-18 19:01:57.658583
+
+"""
+import time
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1d25317c41b'
+down_revision = 'cff430bc40e4'
+branch_labels = None
+depends_on = None
+
+# Hour since the Unix epoch of a timestamp column, as analytics.epoch_hours()
+EPOCH_HOURS = {
+    "sqlite": "CAST(strftime('%s', {0}) AS INTEGER) / 3600",
+    "postgresql": "CAST(floor(extract(epoch FROM {0}) / 3600) AS INTEGER)",
+}
+HOURLY_RETENTION = 7 * 24  # ANALYTICS_HOURLY_RETENTION's default
+
+
+def upgrade():
+    op.create_table('user_activity',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('grain', sa.String(length=4), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.Column('uploads', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'grain', 'bucket')
+    )
+    with op.batch_alter_table('user_activity', schema=None) as batch_op:
+        batch_op.create_index('ix_user_activity_grain_bucket', ['grain', 'bucket'], unique=False)
+
+    op.create_table('user_stat',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('uploads', sa.Integer(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('upload_daily_stat',
+    sa.Column('upload_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Integer(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['upload_id'], ['upload.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('upload_id', 'day')
+    )
+    backfill()
+
+
+def backfill():
+    """
+    Fills the new tables from the existing uploads and recorded views, as
+    `flask rebuild-analytics` does, so totals start right and removing an
+    upload has something to subtract from. Likes keep no time: their
+    history starts empty.
+    """
+    op.execute(
+        "INSERT INTO user_stat (user_id, uploads, views, likes) "
+        "SELECT user_id, count(*), coalesce(sum(views), 0), coalesce(sum(likes), 0) FROM upload GROUP BY user_id"
+    )
+    hours = EPOCH_HOURS.get(op.get_bind().dialect.name)
+    if hours is None:
+        return  # run `flask rebuild-analytics` for the history
+    upload_hour, view_hour = hours.format("u.created_at"), hours.format("v.created_at")
+    oldest = int(time.time() // 3600) - HOURLY_RETENTION
+    op.execute(
+        "INSERT INTO upload_daily_stat (upload_id, day, views, likes) "
+        f"SELECT v.upload_id, {view_hour} / 24, count(*), 0 FROM upload_view v "
+        f"WHERE v.created_at IS NOT NULL GROUP BY v.upload_id, {view_hour} / 24"
+    )
+    op.execute(
+        "INSERT INTO user_activity (user_id, grain, bucket, views, likes, uploads) "
+        "SELECT user_id, grain, bucket, sum(views), 0, sum(uploads) FROM ("
+        f"  SELECT u.user_id, 'hour' AS grain, {upload_hour} AS bucket, 0 AS views, 1 AS uploads FROM upload u"
+        "   WHERE u.created_at IS NOT NULL"
+        f"  UNION ALL SELECT u.user_id, 'day', {upload_hour} / 24, 0, 1 FROM upload u"
+        "   WHERE u.created_at IS NOT NULL"
+        f"  UNION ALL SELECT u.user_id, 'hour', {view_hour}, 1, 0 FROM upload_view v JOIN upload u ON u.id = v.upload_id"
+        "   WHERE v.created_at IS NOT NULL"
+        f"  UNION ALL SELECT u.user_id, 'day', {view_hour} / 24, 1, 0 FROM upload_view v JOIN upload u ON u.id = v.upload_id"
+        "   WHERE v.created_at IS NOT NULL"
+        f") AS activity WHERE grain = 'day' OR bucket > {oldest} GROUP BY user_id, grain, bucket"
+    )
+
+
+def downgrade():
+    op.drop_table('upload_daily_stat')
+    op.drop_table('user_stat')
+    with op.batch_alter_table('user_activity', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_activity_grain_bucket')
+
+    op.drop_table('user_activity')
@@ -0,0 +1,72 @@
+"""add media_blob reference counts and upload.original_name
+
+Revision ID: b3f1c9a27d44
+Revises: 24e6c92df2c1
+Create Date: 2026-10-18 22:41:07.318202
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1c9a27d44'
+down_revision = '24e6c92df2c1'
+branch_labels = None
+depends_on = None
+
+UPLOAD_VECTOR = "to_tsvector('simple', regexp_replace(coalesce(original_name, ''), '[^[:alnum:]]+', ' ', 'g'))"
+OLD_UPLOAD_VECTOR = "to_tsvector('simple', regexp_replace(filename, '^[0-9a-f]{32}_|[^[:alnum:]]+', ' ', 'g'))"
+STORED_PREFIX_GLOB = "[0-9a-f]" * 32 + "_*"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('original_name', sa.String(length=255), nullable=True))
+
+    # Stored names were "<uuid4 hex>_<original name>"
+    if dialect == 'postgresql':
+        op.execute("UPDATE upload SET original_name = regexp_replace(filename, '^[0-9a-f]{32}_', '')")
+    elif dialect == 'sqlite':
+        op.execute(
+            f"UPDATE upload SET original_name = CASE WHEN filename GLOB '{STORED_PREFIX_GLOB}' "
+            "THEN substr(filename, 34) ELSE filename END"
+        )
+    else:
+        op.execute("UPDATE upload SET original_name = filename")
+
+    op.create_table('media_blob',
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('refs', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Count the files already in use, so deleting their last upload removes them
+    op.execute("INSERT INTO media_blob (name, refs) SELECT filename, count(*) FROM upload GROUP BY filename")
+
+    # Search upload names from the new column
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_upload_search')
+        op.execute(f'CREATE INDEX ix_upload_search ON upload USING gin (({UPLOAD_VECTOR}))')
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS upload_search USING fts5(name, prefix='2 3')")
+        op.execute('DELETE FROM upload_search')
+        op.execute("INSERT INTO upload_search (rowid, name) SELECT id, coalesce(original_name, '') FROM upload")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_upload_search')
+        op.execute(f'CREATE INDEX ix_upload_search ON upload USING gin (({OLD_UPLOAD_VECTOR}))')
+    elif dialect == 'sqlite':
+        op.execute('DELETE FROM upload_search')
+        op.execute(
+            'INSERT INTO upload_search (rowid, name) '
+            f"SELECT id, CASE WHEN filename GLOB '{STORED_PREFIX_GLOB}' THEN substr(filename, 34) "
+            'ELSE filename END FROM upload'
+        )
+
+    op.drop_table('media_blob')
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.drop_column('original_name')
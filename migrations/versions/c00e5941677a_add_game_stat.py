@@ -0,0 +1,39 @@
+"""add game_stat for XP and game leaderboards
+
+Revision ID: c00e5941677a
+Revises: 5d68689764a2
+Create Date: 2026-10-18 19:11:07.228417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c00e5941677a'
+down_revision = '5d68689764a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('game_stat',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('game', sa.String(length=32), nullable=False),
+    sa.Column('plays', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('best_score', sa.Integer(), nullable=False),
+    sa.Column('xp', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'game')
+    )
+    with op.batch_alter_table('game_stat', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_game_stat_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('game_stat', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_game_stat_updated_at'))
+
+    op.drop_table('game_stat')
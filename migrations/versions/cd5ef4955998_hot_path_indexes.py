@@ -0,0 +1,80 @@
+"""indexes for hot access paths, video_like and upload_view tables
+
+Revision ID: cd5ef4955998
+Revises: 9c495438e42b
+Create Date: 2026-10-18 12:26:40.117384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd5ef4955998'
+down_revision = '9c495438e42b'
+branch_labels = None
+depends_on = None
+
+
+def create_video_like():
+    op.create_table('video_like',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(length=200), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('filetype', sa.String(length=20), nullable=False),
+    sa.Column('video_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['video_id'], ['upload.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('video_id', 'user_id', name='unique_like')
+    )
+
+
+def create_upload_view():
+    op.create_table('upload_view',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('upload_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('viewer', sa.String(length=200), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['upload_id'], ['upload.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('upload_id', 'viewer', name='unique_view')
+    )
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    # Both tables may already exist because the app used to run db.create_all()
+    # at import time; bring them to the current shape either way.
+    if 'video_like' not in tables:
+        create_video_like()
+    elif 'unique_like' not in {c['name'] for c in inspector.get_unique_constraints('video_like')}:
+        with op.batch_alter_table('video_like', schema=None) as batch_op:
+            batch_op.create_unique_constraint('unique_like', ['video_id', 'user_id'])
+
+    if 'upload_view' in tables and 'viewer' not in {c['name'] for c in inspector.get_columns('upload_view')}:
+        # The old (upload_id, user_id NOT NULL) table was never written to
+        op.drop_table('upload_view')
+        tables.remove('upload_view')
+    if 'upload_view' not in tables:
+        create_upload_view()
+
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.create_index('ix_upload_user_id_id', ['user_id', sa.text('id DESC')], unique=False)
+        batch_op.create_index(batch_op.f('ix_upload_created_at'), ['created_at'], unique=False)
+
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_email_lower', table_name='user')
+
+    with op.batch_alter_table('upload', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_created_at'))
+        batch_op.drop_index('ix_upload_user_id_id')
+
+    op.drop_table('upload_view')
+    op.drop_table('video_like')
@@ -0,0 +1,34 @@
+"""add web_session table for server-side sessions
+
+Revision ID: cff430bc40e4
+Revises: b3f1c9a27d44
+Create Date: 2026-10-18 18:46:06.494657
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cff430bc40e4'
+down_revision = 'b3f1c9a27d44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('web_session',
+    sa.Column('id', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('web_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_web_session_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('web_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_web_session_expires_at'))
+
+    op.drop_table('web_session')
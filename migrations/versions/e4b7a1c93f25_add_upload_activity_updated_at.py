@@ -0,0 +1,32 @@
+"""add upload_activity.updated_at so rankings read only the rows that changed
+
+Revision ID: e4b7a1c93f25
+Revises: b1d25317c41b
+Create Date: 2026-10-18 20:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7a1c93f25'
+down_revision = 'b1d25317c41b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload_activity', schema=None) as batch_op:
+        # Existing rows count as changed now: every worker re-reads them once
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                      server_default=sa.func.current_timestamp()))
+    with op.batch_alter_table('upload_activity', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', server_default=None)
+        batch_op.create_index(batch_op.f('ix_upload_activity_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('upload_activity', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_activity_updated_at'))
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,33 @@
+"""add game_token so each game session token scores once across workers
+
+Revision ID: f2a8d6c41e07
+Revises: e4b7a1c93f25
+Create Date: 2026-10-18 20:31:09.118264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8d6c41e07'
+down_revision = 'e4b7a1c93f25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('game_token',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('used_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('game_token', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_game_token_used_at'), ['used_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('game_token', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_game_token_used_at'))
+
+    op.drop_table('game_token')
@@ -0,0 +1,194 @@
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, load_only
+
+from database import RoutingSession
+
+# Bound to the app by create_app() (app.py); models and queries can be
+# imported without one. Reads may go to a replica, see database.py
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+# ------------------------ MODELS ------------------------
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(100), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password = db.Column(db.String(200), nullable=False)
+    bio = db.Column(db.String(300), default="I'm a gamer!")
+    avatar = db.Column(db.String(200), default="default-avatar.png")
+    xp = db.Column(db.Integer, default=0)
+
+    # Login and password reset look emails up case-insensitively
+    __table_args__ = (db.Index('ix_user_email_lower', db.func.lower(email)),)
+
+class Upload(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False)  # name in the media store, see storage.py
+    original_name = db.Column(db.String(255), nullable=True)  # as uploaded; shown and searched
+    filetype = db.Column(db.String(20), nullable=False)  # "image" or "video"
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User', backref=db.backref('uploads', lazy=True))
+    created_at = db.Column(db.DateTime, default=db.func.now(), index=True)
+    views = db.Column(db.Integer, default=0)
+    likes = db.Column(db.Integer, default=0)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # sha256 of the file
+    thumbnail = db.Column(db.String(220), nullable=True)  # card-sized JPEG (+ .webp twin)
+    poster = db.Column(db.String(220), nullable=True)     # full-size video frame
+    transcode_status = db.Column(db.String(16), nullable=True)  # videos: pending/processing/ready/failed
+    hls_playlist = db.Column(db.String(255), nullable=True)     # HLS master playlist, once ready
+
+    # Dashboard: one user's uploads, newest first
+    __table_args__ = (db.Index('ix_upload_user_id_id', user_id, id.desc()),)
+
+class VideoLike(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(200), nullable=False)  # username or anonymous session
+    filename = db.Column(db.String(255), nullable=False)
+    filetype = db.Column(db.String(20), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('upload.id'), nullable=False)
+    # Deleting an upload deletes its likes first (see delete_upload): the ORM doesn't load them to null video_id
+    video = db.relationship('Upload', backref=db.backref('video_likes', lazy=True, passive_deletes=True))
+
+    __table_args__ = (db.UniqueConstraint('video_id', 'user_id', name='unique_like'),)
+
+class UploadView(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # NULL for anonymous viewers
+    viewer = db.Column(db.String(200), nullable=False)  # see viewer_key()
+    created_at = db.Column(db.DateTime, default=db.func.now())
+
+    # One counted view per viewer
+    __table_args__ = (db.UniqueConstraint('upload_id', 'viewer', name='unique_view'),)
+
+class UploadActivity(db.Model):
+    # Ranking points per upload per hour, checkpointed by RankingEngine
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload.id', ondelete='CASCADE'), primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True, index=True)  # hours since the Unix epoch
+    points = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)  # lets workers read only what changed
+
+class GameStat(db.Model):
+    # Per-player totals for one browser game, written in batches by Leaderboards
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    game = db.Column(db.String(32), primary_key=True)
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    xp = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)  # lets workers read only what changed
+
+class GameToken(db.Model):
+    # Game session tokens a score was submitted with: each counts once (see Leaderboards.submit)
+    id = db.Column(db.String(32), primary_key=True)
+    used_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class UserStat(db.Model):
+    # Running totals over a user's current uploads, kept by Analytics (see analytics.py)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    uploads = db.Column(db.Integer, nullable=False, default=0)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+
+class UserActivity(db.Model):
+    # Views, likes and new uploads per user per hour or per day, see analytics.py
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    grain = db.Column(db.String(4), primary_key=True)  # "hour" or "day"
+    bucket = db.Column(db.Integer, primary_key=True)   # hours or days since the Unix epoch
+    views = db.Column(db.Integer, nullable=False, default=0)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    uploads = db.Column(db.Integer, nullable=False, default=0)
+
+    # Old hourly rows are pruned by bucket
+    __table_args__ = (db.Index('ix_user_activity_grain_bucket', grain, bucket),)
+
+class UploadDailyStat(db.Model):
+    # Views and likes per upload per day, see analytics.py
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Integer, primary_key=True)  # days since the Unix epoch
+    views = db.Column(db.Integer, nullable=False, default=0)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    # Deferred work run by `python worker.py`, see jobs.py
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON keyword arguments for the handler
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)  # not before; pushed back on retry
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers poll for the next due job by status, priority and run_at
+    __table_args__ = (db.Index('ix_job_status_priority_run_at', status, priority, run_at),)
+
+class MediaBlob(db.Model):
+    # Rows using each stored media file, see storage.MediaStore
+    name = db.Column(db.String(255), primary_key=True)
+    refs = db.Column(db.Integer, nullable=False, default=0)
+
+class WebSession(db.Model):
+    # Server-side session data, see sessions.py; the cookie holds only the id
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # tagged JSON, as in Flask's cookie sessions
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # swept in batches once past
+
+
+# ------------------------ QUERY PROFILES ------------------------
+class QueryProfile:
+    """
+    Named set of loader options for one kind of page: which columns to load
+    and which relationships to fetch eagerly, so templates never trigger
+    a lazy load per row.
+    """
+
+    def __init__(self, name, *options):
+        self.name = name
+        self.options = options
+
+    def apply(self, query):
+        return query.options(*self.options)
+
+    def __repr__(self):
+        return f"<QueryProfile {self.name}>"
+
+
+UPLOAD_CARD_COLUMNS = (
+    Upload.id, Upload.filename, Upload.original_name, Upload.filetype, Upload.user_id, Upload.created_at,
+    Upload.views, Upload.likes, Upload.thumbnail, Upload.poster, Upload.hls_playlist,
+)
+
+# Cards on someone's own dashboard: the owner is already known
+UploadCards = QueryProfile("UploadCards", load_only(*UPLOAD_CARD_COLUMNS))
+
+# Public feeds (gallery, index, /api/uploads): cards plus the author in the same SELECT
+UploadFeed = QueryProfile(
+    "UploadFeed",
+    load_only(*UPLOAD_CARD_COLUMNS),
+    joinedload(Upload.user).load_only(User.id, User.username, User.avatar),
+)
+
+# Single upload page
+UploadDetail = QueryProfile(
+    "UploadDetail",
+    joinedload(Upload.user).load_only(User.id, User.username, User.avatar),
+)
+
+# /users table
+UserDirectory = QueryProfile(
+    "UserDirectory",
+    load_only(User.id, User.username, User.email, User.password),
+)
+
+# User search results
+UserResults = QueryProfile(
+    "UserResults",
+    load_only(User.id, User.username, User.avatar, User.bio),
+)
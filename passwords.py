@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import nullcontext
+
+import bcrypt
+
+# bcrypt only looks at the first 72 bytes; bcrypt>=5 raises instead of
+# truncating, so truncate explicitly to keep old hashes verifying.
+MAX_PASSWORD_BYTES = 72
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated; callers should answer 503/429."""
+
+
+def _encode(password):
+    return password.encode("utf-8")[:MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _verify(hashed, password):
+    try:
+        return bcrypt.checkpw(_encode(password), hashed.encode("utf-8"))
+    except ValueError:
+        # Not a bcrypt hash (e.g. a corrupted row)
+        return False
+
+
+def _exit_with_parent(parent_pid):
+    """
+    Pool initializer. A worker killed by a signal (uvicorn workers on
+    shutdown) never shuts its pool down, and the idle children would wait
+    on their queue forever; this makes them exit once it is gone.
+    """
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def hash_rounds(hashed):
+    """Work factor stored in a `$2b$12$...` hash, or None if it can't be read."""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing on a small per-worker process pool.
+
+    Hashing is CPU bound, so at most `PASSWORD_HASH_WORKERS` run at once and
+    at most `PASSWORD_HASH_QUEUE` more may wait; past that `HashingBusy` is
+    raised immediately, so a login burst cannot queue every request in the
+    worker behind bcrypt. `PASSWORD_HASH_WORKERS = 0` hashes inline.
+
+    `PASSWORD_HASH_ROUNDS` is the work factor for new hashes;
+    `needs_rehash()` tells login to upgrade hashes made with another one.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault("PASSWORD_HASH_ROUNDS", int(os.environ.get("PASSWORD_HASH_ROUNDS", 12)))
+        app.config.setdefault("PASSWORD_HASH_WORKERS", int(os.environ.get("PASSWORD_HASH_WORKERS", 2)))
+        app.config.setdefault("PASSWORD_HASH_QUEUE", int(os.environ.get("PASSWORD_HASH_QUEUE", 8)))
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10)))
+        app.extensions["passwords"] = self
+
+    def _pool(self):
+        # One pool per gunicorn worker, created after the fork
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                workers = self.app.config["PASSWORD_HASH_WORKERS"]
+                # Spawned, not forked, so the children hold no copy of the worker's
+                # listening socket; and they exit along with it (see _exit_with_parent)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_exit_with_parent, initargs=(os.getpid(),),
+                )
+                self._slots = threading.BoundedSemaphore(workers + self.app.config["PASSWORD_HASH_QUEUE"])
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        metrics = self.app.extensions.get("metrics")
+        with metrics.phase("bcrypt") if metrics else nullcontext():
+            if self.app.config["PASSWORD_HASH_WORKERS"] <= 0:
+                return fn(*args)
+
+            pool = self._pool()
+            slots = self._slots
+            if not slots.acquire(blocking=False):
+                raise HashingBusy()
+            try:
+                future = pool.submit(fn, *args)
+            except BaseException:
+                slots.release()
+                raise
+            # The slot is free once the hash is, not when this request gives up
+            # waiting: a timed-out task still holds its place in the pool
+            future.add_done_callback(lambda _: slots.release())
+            try:
+                return future.result(timeout=self.app.config["PASSWORD_HASH_TIMEOUT"])
+            except FutureTimeout:
+                raise HashingBusy()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.app.config["PASSWORD_HASH_ROUNDS"])
+
+    def verify(self, hashed, password):
+        return self._run(_verify, hashed, password)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.app.config["PASSWORD_HASH_ROUNDS"]
+
+
+class Throttle:
+    """
+    Sliding-window attempt counter per key (an IP address, an identifier).
+    Limits apply per worker process. Keeps at most `max_keys` keys, dropping
+    the least recently used.
+    """
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = OrderedDict()  # key -> list of timestamps
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        hits = [t for t in self._hits.get(key, ()) if t > now - self.window]
+        if hits:
+            self._hits[key] = hits
+            self._hits.move_to_end(key)
+        else:
+            self._hits.pop(key, None)
+        return hits
+
+    def blocked(self, key):
+        with self._lock:
+            return len(self._recent(key, time.monotonic())) >= self.limit
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._recent(key, now)
+            self._hits.setdefault(key, []).append(now)
+            self._hits.move_to_end(key)
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
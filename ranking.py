@@ -0,0 +1,365 @@
+import atexit
+import bisect
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from counters import BufferedWriter
+
+logger = logging.getLogger(__name__)
+
+# Ranking name -> window in hours (None: all retained activity, decayed)
+RANKINGS = {"trending": None, "top_day": 24, "top_week": 168}
+
+
+def current_hour(now=None):
+    return int((now or time.time()) // 3600)
+
+
+def upsert_add(table, dialect_name, key_columns, *value_columns):
+    """INSERT that adds to the `value_columns` when the key already exists."""
+    if dialect_name in ("postgresql", "sqlite"):
+        dialect = postgresql if dialect_name == "postgresql" else sqlite
+        stmt = dialect.insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={c: table.c[c] + stmt.excluded[c] for c in value_columns},
+        )
+    stmt = mysql.insert(table)
+    return stmt.on_duplicate_key_update({c: table.c[c] + stmt.inserted[c] for c in value_columns})
+
+
+class TopK:
+    """
+    Scores for every ranked id, plus the best `k` kept sorted so reading a
+    page is a slice and never scans all ids.
+
+    Up to `2 * k` are kept sorted: when ids in the top lose points (hours
+    leaving a window, deleted uploads) the next best are already there, and
+    the sorted part is only refilled from every score once it drops below
+    `k`. Every id left out scores no higher than the last one kept.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.scores = {}
+        self._ranked = []  # (-score, id), best first
+
+    def __len__(self):
+        return min(len(self._ranked), self.k)
+
+    def _remove(self, item_id, score):
+        entry = (-score, item_id)
+        i = bisect.bisect_left(self._ranked, entry)
+        if i < len(self._ranked) and self._ranked[i] == entry:
+            del self._ranked[i]
+
+    def _refill(self):
+        if len(self._ranked) < min(self.k, len(self.scores)):
+            self.rebuild(self.scores)
+
+    def add(self, item_id, delta):
+        old = self.scores.get(item_id)
+        new = (old or 0.0) + delta
+        if old is not None:
+            self._remove(item_id, old)
+        if new <= 0:
+            self.scores.pop(item_id, None)
+        else:
+            self.scores[item_id] = new
+            entry = (-new, item_id)
+            # Kept if nothing else was left out, or if it beats the last one kept
+            if len(self._ranked) == len(self.scores) - 1 or (self._ranked and entry < self._ranked[-1]):
+                bisect.insort(self._ranked, entry)
+                del self._ranked[2 * self.k:]
+        self._refill()
+
+    def discard(self, item_id):
+        score = self.scores.pop(item_id, None)
+        if score is not None:
+            self._remove(item_id, score)
+            self._refill()
+
+    def rebuild(self, scores):
+        self.scores = {i: s for i, s in scores.items() if s > 0}
+        self._ranked = heapq.nsmallest(2 * self.k, ((-s, i) for i, s in self.scores.items()))
+
+    def page(self, offset, limit):
+        return [(item_id, -neg) for neg, item_id in self._ranked[offset:min(offset + limit, self.k)]]
+
+    def ids(self):
+        """The ids in the top `k`, best first."""
+        return [item_id for _, item_id in self._ranked[:self.k]]
+
+
+class RankingEngine(BufferedWriter):
+    """
+    Popularity rankings ("trending", "top_day", "top_week") over uploads.
+
+    Every counted view or like adds points (`RANKING_VIEW_WEIGHT`,
+    `RANKING_LIKE_WEIGHT`) to the upload's score in each ranking, in memory,
+    so the worker's own traffic shows up immediately. Each ranking keeps its
+    best `RANKING_TOP_K` sorted, so serving a page costs the same however
+    many uploads exist.
+
+    Points are also summed into one row per (upload, hour) in `table`. Every
+    `RANKING_CHECKPOINT_INTERVAL` seconds each worker adds its pending points
+    to those rows and reads back the rows changed since its last pass, by
+    their indexed `updated_at`, adding only what the other workers counted
+    to its scores. Once an hour the scores are recomputed from the hours held
+    in memory, which drops hours that left a window, and ranked uploads
+    whose rows were deleted (by another worker) are dropped.
+    "trending" weighs every hour by 0.5 ** (age / RANKING_HALF_LIFE_HOURS).
+
+    A worker reads the retained hours once, on its background thread:
+    `start()` is called as a gunicorn worker boots (gunicorn.conf.py), or
+    by the first `record()` or `page()`. Until it has loaded, the rankings
+    only hold what the worker counted itself.
+    """
+
+    def __init__(self, table, app=None, db=None):
+        self.table = table
+        self._lock = threading.Lock()
+        self._pending = defaultdict(float)  # (upload_id, hour) -> points not yet written
+        self._hours = {}                    # (upload_id, hour) -> points written, as last read
+        self._tops = {}
+        self._base = time.time()  # trending points are scaled relative to this instant
+        self._loaded_pid = None
+        self._synced_at = None
+        self._scored_hour = None
+        self._last_prune = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("RANKING_HALF_LIFE_HOURS", float(os.environ.get("RANKING_HALF_LIFE_HOURS", 6)))
+        app.config.setdefault("RANKING_TOP_K", int(os.environ.get("RANKING_TOP_K", 1000)))
+        app.config.setdefault("RANKING_CHECKPOINT_INTERVAL", float(os.environ.get("RANKING_CHECKPOINT_INTERVAL", 30)))
+        app.config.setdefault("RANKING_VIEW_WEIGHT", float(os.environ.get("RANKING_VIEW_WEIGHT", 1)))
+        app.config.setdefault("RANKING_LIKE_WEIGHT", float(os.environ.get("RANKING_LIKE_WEIGHT", 3)))
+        # Scores loaded for another app mean nothing to this one
+        self._tops = {name: TopK(app.config["RANKING_TOP_K"]) for name in RANKINGS}
+        self._pending.clear()
+        self._hours = {}
+        self._loaded_pid = None
+        app.extensions["ranking"] = self
+        atexit.register(self._flush_at_exit)
+
+    @property
+    def flush_interval(self):
+        return self.app.config["RANKING_CHECKPOINT_INTERVAL"]
+
+    @property
+    def retention_hours(self):
+        # Older hours weigh under 1% in trending and are outside every window
+        return max(max(w for w in RANKINGS.values() if w), int(self.app.config["RANKING_HALF_LIFE_HOURS"] * 7))
+
+    def _oldest_hour(self, now):
+        return current_hour(now) - self.retention_hours
+
+    def _trending_factor(self, when):
+        return 0.5 ** ((self._base - when) / (self.app.config["RANKING_HALF_LIFE_HOURS"] * 3600))
+
+    def _apply(self, upload_id, points, when):
+        for name, top in self._tops.items():
+            top.add(upload_id, points * self._trending_factor(when) if name == "trending" else points)
+
+    def _apply_hour(self, upload_id, hour, points, now):
+        now_hour = current_hour(now)
+        for name, window in RANKINGS.items():
+            if window is None:
+                # Score an hour from its midpoint
+                self._tops[name].add(upload_id, points * self._trending_factor((hour + 0.5) * 3600))
+            elif now_hour - hour < window:
+                self._tops[name].add(upload_id, points)
+
+    def start(self):
+        """Starts this worker's background thread, which loads the rankings first."""
+        self._ensure_flusher()
+
+    def record(self, upload_id, column, n=1):
+        """Adds points for `n` counted views or likes (n may be negative)."""
+        weight = self.app.config["RANKING_LIKE_WEIGHT" if column == "likes" else "RANKING_VIEW_WEIGHT"]
+        points = weight * n
+        now = time.time()
+        self.start()
+        with self._lock:
+            self._pending[(upload_id, current_hour(now))] += points
+            self._apply(upload_id, points, now)
+
+    def discard(self, upload_id):
+        """Forgets a deleted upload, in memory and in the checkpoint table."""
+        self.discard_many([upload_id])
+
+    def discard_many(self, upload_ids):
+        ids = set(upload_ids)
+        if not ids:
+            return
+        with self._lock:
+            self._forget(ids)
+            for key in [k for k in self._pending if k[0] in ids]:
+                del self._pending[key]
+        with self.app.app_context():
+            with self.db.engine.begin() as conn:
+                conn.execute(delete(self.table).where(self.table.c.upload_id.in_(ids)))
+
+    def _forget(self, ids):
+        for top in self._tops.values():
+            for upload_id in ids:
+                top.discard(upload_id)
+        for key in [k for k in self._hours if k[0] in ids]:
+            del self._hours[key]
+
+    def page(self, ranking, offset=0, limit=24):
+        """[(upload_id, score), ...] for one page of a ranking, and whether more follow."""
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking: {ranking}")
+        if self._loaded_pid != os.getpid():
+            # Loaded on the background thread, never in a request
+            self.start()
+        with self._lock:
+            top = self._tops[ranking]
+            return top.page(offset, limit), offset + limit < len(top)
+
+    # ---------- background thread ----------
+    def _run(self):
+        self.load()
+        while True:
+            time.sleep(self.flush_interval)
+            if self._loaded_pid != os.getpid():
+                self.load()
+            self.flush()
+
+    def load(self):
+        """Reads every retained hour from the table and scores it, once per worker."""
+        now = time.time()
+        started = datetime.utcnow()
+        t = self.table
+        try:
+            with self.app.app_context():
+                with self.db.engine.connect() as conn:
+                    rows = conn.execute(
+                        select(t.c.upload_id, t.c.hour, t.c.points).where(t.c.hour >= self._oldest_hour(now))
+                    ).all()
+        except Exception:
+            logger.exception("Loading the rankings failed; will retry")
+            return
+        with self._lock:
+            self._hours = {(upload_id, hour): points for upload_id, hour, points in rows}
+            self._synced_at = started
+            self._rebuild(now)
+            self._loaded_pid = os.getpid()
+
+    def flush(self):
+        loaded = self._loaded_pid == os.getpid()
+        with self._lock:
+            batch = self._pending
+            self._pending = defaultdict(float)
+
+        now = time.time()
+        synced_at = datetime.utcnow()
+        t = self.table
+        rows = []
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    params = [
+                        {"upload_id": upload_id, "hour": hour, "points": points, "updated_at": synced_at}
+                        for (upload_id, hour), points in batch.items() if points
+                    ]
+                    if params:
+                        stmt = upsert_add(t, conn.dialect.name, ["upload_id", "hour"], "points")
+                        conn.execute(stmt, params)
+                    if now - self._last_prune > 3600:
+                        conn.execute(delete(t).where(t.c.hour < self._oldest_hour(now)))
+                        self._last_prune = now
+                    if loaded:
+                        # Overlap the window so slow concurrent commits are not missed; re-reading is harmless
+                        rows = conn.execute(
+                            select(t.c.upload_id, t.c.hour, t.c.points).where(
+                                t.c.updated_at >= self._synced_at - timedelta(seconds=30),
+                                t.c.hour >= self._oldest_hour(now),
+                            )
+                        ).all()
+        except Exception:
+            logger.exception("Ranking checkpoint failed; will retry")
+            with self._lock:
+                for key, points in batch.items():
+                    self._pending[key] += points
+            return
+        if not loaded:
+            # What was written is read by load()
+            return
+
+        with self._lock:
+            # This worker's own points are in its scores since record()
+            for key, points in batch.items():
+                self._hours[key] = self._hours.get(key, 0.0) + points
+            for upload_id, hour, points in rows:
+                delta = points - self._hours.get((upload_id, hour), 0.0)
+                if abs(delta) > 1e-9:
+                    self._hours[(upload_id, hour)] = points
+                    self._apply_hour(upload_id, hour, delta, now)
+            self._synced_at = synced_at
+            rescore = current_hour(now) != self._scored_hour
+            if rescore:
+                self._rebuild(now)
+        if rescore:
+            self._drop_deleted()
+
+    def _flush_at_exit(self):
+        # A process that never ranked anything (a CLI command, the --preload master) has nothing to write
+        if self._pending or self._loaded_pid == os.getpid():
+            self.flush()
+
+    def _rebuild(self, now):
+        # Hourly: hours leave the windows, and trending is rescaled to a new base
+        self._base = now
+        now_hour = current_hour(now)
+        oldest = self._oldest_hour(now)
+        self._hours = {key: points for key, points in self._hours.items() if key[1] >= oldest}
+        scores = {name: defaultdict(float) for name in RANKINGS}
+        # Points not written yet are in the scores but not in `_hours`
+        for (upload_id, hour), points in list(self._hours.items()) + list(self._pending.items()):
+            age = now_hour - hour
+            for name, window in RANKINGS.items():
+                if window is None:
+                    scores[name][upload_id] += points * self._trending_factor((hour + 0.5) * 3600)
+                elif age < window:
+                    scores[name][upload_id] += points
+        for name, top in self._tops.items():
+            top.rebuild(scores[name])
+        self._scored_hour = now_hour
+
+    def _drop_deleted(self):
+        """Drops ranked uploads whose rows are gone: deleted through another worker."""
+        t = self.table
+        with self._lock:
+            ranked = set().union(*(top.ids() for top in self._tops.values()))
+            ranked -= {upload_id for upload_id, _ in self._pending}
+        ranked = sorted(ranked)
+        present = set()
+        try:
+            with self.app.app_context():
+                with self.db.engine.connect() as conn:
+                    for start in range(0, len(ranked), 500):
+                        chunk = ranked[start:start + 500]
+                        present.update(conn.execute(
+                            select(t.c.upload_id).where(t.c.upload_id.in_(chunk)).distinct()
+                        ).scalars())
+        except Exception:
+            logger.exception("Checking ranked uploads failed")
+            return
+        gone = set(ranked) - present
+        if gone:
+            with self._lock:
+                self._forget(gone - {upload_id for upload_id, _ in self._pending})
@@ -0,0 +1,263 @@
+import logging
+import os
+import re
+import threading
+
+from sqlalchemy import and_, column, delete, desc, func, insert, inspect, literal, literal_column, or_, select, table, text
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TYPES = ("users", "uploads")
+
+# Matches what both FTS5's unicode61 tokenizer and PostgreSQL's parser treat as one word
+_WORD = re.compile(r"[^\W_]+")
+
+# Ranked document for each backend. PostgreSQL only uses its GIN indexes when a
+# query repeats the indexed expression, so these strings are shared by the
+# DDL below and the queries in Search.
+USER_VECTOR = (
+    "setweight(to_tsvector('simple', username), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(bio, '')), 'B')"
+)
+UPLOAD_VECTOR = "to_tsvector('simple', regexp_replace(coalesce(original_name, ''), '[^[:alnum:]]+', ' ', 'g'))"
+
+SCHEMA = {
+    "sqlite": (
+        'CREATE INDEX IF NOT EXISTS ix_user_username_lower ON "user" (lower(username))',
+        "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(username, bio, prefix='2 3')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS upload_search USING fts5(name, prefix='2 3')",
+    ),
+    "postgresql": (
+        # Byte order, so a prefix is one contiguous range whatever the database collation
+        'CREATE INDEX IF NOT EXISTS ix_user_username_lower ON "user" ((lower(username) COLLATE "C"))',
+        f'CREATE INDEX IF NOT EXISTS ix_user_search ON "user" USING gin (({USER_VECTOR}))',
+        f"CREATE INDEX IF NOT EXISTS ix_upload_search ON upload USING gin (({UPLOAD_VECTOR}))",
+    ),
+}
+
+# Created by SCHEMA rather than the models, so autogenerate leaves them alone
+# (migrations/env.py); FTS5 keeps each table's data in shadow tables.
+SEARCH_TABLES = ("user_search", "upload_search")
+FTS5_SHADOW_SUFFIXES = ("_data", "_idx", "_content", "_docsize", "_config")
+SEARCH_INDEXES = ("ix_user_username_lower", "ix_user_search", "ix_upload_search")
+
+
+def is_search_object(name, type_):
+    """Whether a table or index `name` belongs to the search schema."""
+    if type_ == "table":
+        return any(name == t or name in (t + suffix for suffix in FTS5_SHADOW_SUFFIXES) for t in SEARCH_TABLES)
+    return type_ == "index" and name in SEARCH_INDEXES
+
+
+user_search = table("user_search", column("rowid"), column("username"), column("bio"))
+upload_search = table("upload_search", column("rowid"), column("name"))
+
+
+def query_words(q, max_words=8):
+    return _WORD.findall((q or "").lower())[:max_words]
+
+
+class Search:
+    """
+    Username autocomplete and ranked full-text search over users (username,
+    bio) and uploads (original file name), using what the database offers.
+
+    Autocomplete is a range scan over an index on lower(username) on every
+    backend: the first `limit` names in alphabetical order that start with the
+    prefix, so an exact match comes first. It reads O(log n) index pages plus
+    the rows returned, however many users there are.
+
+    Full-text search matches every word of the query, the last one as a
+    prefix (search-as-you-type), and ranks username hits above bio hits:
+      - SQLite: FTS5 tables `user_search` / `upload_search` keyed by the row
+        id, ranked by bm25. They are written from the domain events
+        (`index_user()`, `remove_upload()`, ...); `rebuild()` refills them.
+      - PostgreSQL: GIN indexes over `to_tsvector('simple', ...)` of the rows
+        themselves, ranked by ts_rank. PostgreSQL keeps them current, so the
+        event hooks have nothing to do.
+      - anything else: unranked LIKE scans.
+
+    The indexes are created by a migration; `_ready()` also creates any that
+    are missing (databases built with `db.create_all()`) and fills new FTS5
+    tables.
+    """
+
+    def __init__(self, user_table, upload_table, app=None, db=None):
+        self.user_table = user_table
+        self.upload_table = upload_table
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("SEARCH_AUTOCOMPLETE_LIMIT", int(os.environ.get("SEARCH_AUTOCOMPLETE_LIMIT", 10)))
+        app.config.setdefault("SEARCH_RESULT_LIMIT", int(os.environ.get("SEARCH_RESULT_LIMIT", 20)))
+        app.extensions["search"] = self
+
+    @property
+    def dialect(self):
+        return self.db.engine.dialect.name
+
+    def _ready(self):
+        if self._schema_ready:
+            return
+        with self._lock:
+            if not self._schema_ready:
+                self.ensure_schema()
+
+    def ensure_schema(self):
+        statements = SCHEMA.get(self.dialect, ())
+        with self.db.engine.begin() as conn:
+            # Runs once per process, so it doesn't count against the first search's query budget
+            conn = conn.execution_options(count_query=False)
+            # Tables not created yet (fresh database before `flask db upgrade`): retry on first use
+            if not inspect(conn).has_table(self.upload_table.name):
+                return
+            new_tables = self.dialect == "sqlite" and not conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'user_search'")
+            ).first()
+            for statement in statements:
+                conn.execute(text(statement))
+        self._schema_ready = True
+        if new_tables:
+            self.rebuild()
+
+    # ---------- reading ----------
+    def autocomplete(self, prefix, limit=None):
+        """Users whose name starts with `prefix` (case-insensitive): [{"id", "username", "avatar"}]."""
+        prefix = (prefix or "").strip().lower()[:100]
+        if not prefix:
+            return []
+        self._ready()
+        limit = limit or self.app.config["SEARCH_AUTOCOMPLETE_LIMIT"]
+        users = self.user_table
+        name = func.lower(users.c.username)
+        if self.dialect == "postgresql":
+            name = name.collate("C")
+        # Everything starting with "ab" sorts in ["ab", "ac")
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        stmt = (
+            select(users.c.id, users.c.username, users.c.avatar)
+            .where(name >= prefix, name < upper)
+            .order_by(name)
+            .limit(limit)
+        )
+        with self.db.engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(stmt)]
+
+    def search(self, kind, q, limit=None, offset=0):
+        """
+        Best matches of `kind` ("users" or "uploads") for the query `q`.
+        Returns: [(id, score)], best first. Scores only compare within one result list.
+        """
+        words = query_words(q)
+        if not words:
+            return []
+        self._ready()
+        limit = limit or self.app.config["SEARCH_RESULT_LIMIT"]
+        if self.dialect == "sqlite":
+            stmt = self._fts5_query(kind, words)
+        elif self.dialect == "postgresql":
+            stmt = self._tsquery(kind, words)
+        else:
+            stmt = self._like_query(kind, words)
+        stmt = stmt.limit(limit).offset(offset)
+        with self.db.engine.connect() as conn:
+            return [(row[0], float(row[1])) for row in conn.execute(stmt)]
+
+    def _fts5_query(self, kind, words):
+        # "dark" "kni"* -> rows containing "dark" and a word starting with "kni"
+        match = " ".join(f'"{w}"' for w in words) + "*"
+        if kind == "users":
+            fts, weights = "user_search", "4.0, 1.0"
+        else:
+            fts, weights = "upload_search", "1.0"
+        score = literal_column(f"bm25({fts}, {weights})")
+        return (
+            select(literal_column(f"{fts}.rowid"), -score)
+            .select_from(table(fts))
+            .where(literal_column(fts).op("MATCH")(match))
+            .order_by(score)
+        )
+
+    def _tsquery(self, kind, words):
+        # dark & kni:* -> same semantics as the FTS5 query above
+        query = func.to_tsquery(literal_column("'simple'"), " & ".join(words[:-1] + [words[-1] + ":*"]))
+        if kind == "users":
+            source, vector = self.user_table, literal_column(f"({USER_VECTOR})")
+        else:
+            source, vector = self.upload_table, literal_column(f"({UPLOAD_VECTOR})")
+        score = func.ts_rank(vector, query)
+        return (
+            select(source.c.id, score)
+            .where(vector.op("@@")(query))
+            .order_by(desc(score), desc(source.c.id))
+        )
+
+    def _like_query(self, kind, words):
+        if kind == "users":
+            source, fields = self.user_table, ("username", "bio")
+        else:
+            source, fields = self.upload_table, ("original_name",)
+        # Words are letters and digits only, so they never contain LIKE wildcards
+        matches = [
+            or_(*[func.lower(source.c[f]).like(f"%{w}%") for f in fields])
+            for w in words
+        ]
+        return select(source.c.id, literal(0.0)).where(and_(*matches)).order_by(desc(source.c.id))
+
+    # ---------- keeping the FTS5 tables current ----------
+    def _write(self, *statements):
+        if self.dialect != "sqlite":
+            return
+        self._ready()
+        with self.db.engine.begin() as conn:
+            for stmt in statements:
+                conn.execute(stmt)
+
+    def index_user(self, user_id, username, bio):
+        self._write(
+            delete(user_search).where(user_search.c.rowid == user_id),
+            insert(user_search).values(rowid=user_id, username=username, bio=bio or ""),
+        )
+
+    def remove_user(self, user_id):
+        self._write(delete(user_search).where(user_search.c.rowid == user_id))
+
+    def index_upload(self, upload_id, name):
+        self._write(
+            delete(upload_search).where(upload_search.c.rowid == upload_id),
+            insert(upload_search).values(rowid=upload_id, name=name or ""),
+        )
+
+    def remove_upload(self, upload_id):
+        self.remove_uploads([upload_id])
+
+    def remove_uploads(self, upload_ids):
+        if upload_ids:
+            self._write(delete(upload_search).where(upload_search.c.rowid.in_(upload_ids)))
+
+    def rebuild(self):
+        """Refills the FTS5 tables from the users and uploads tables (SQLite only)."""
+        if self.dialect != "sqlite":
+            return
+        users, uploads = self.user_table, self.upload_table
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(user_search))
+            conn.execute(delete(upload_search))
+            conn.execute(
+                insert(user_search).from_select(
+                    ["rowid", "username", "bio"],
+                    select(users.c.id, users.c.username, func.coalesce(users.c.bio, "")),
+                )
+            )
+            conn.execute(
+                insert(upload_search).from_select(
+                    ["rowid", "name"],
+                    select(uploads.c.id, func.coalesce(uploads.c.original_name, "")),
+                )
+            )
+        logger.info("search index rebuilt")
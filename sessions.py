@@ -0,0 +1,291 @@
+import logging
+import os
+import re
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin, session_json_serializer
+from sqlalchemy import delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# token_urlsafe(16): 128 random bits in 22 characters
+SESSION_ID = re.compile(r"[A-Za-z0-9_-]{22}")
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    Session data kept on the server under `sid`. Remembers the serialized
+    form it was loaded from, so an unchanged session is never written back.
+    """
+
+    def __init__(self, initial=None, sid=None, raw=None, expires_at=None, readonly=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.raw = raw
+        self.expires_at = expires_at
+        self.readonly = readonly
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def clear(self):
+        # Cleared to start over (e.g. at login): the data goes under a new id,
+        # so an id planted or seen before then is worth nothing
+        self.rotate = self.sid is not None
+        super().clear()
+
+
+class MemoryStore:
+    """Sessions in this process only, LRU-bounded: one worker or development."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # sid -> (raw, expires_at)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is not None:
+                self._data.move_to_end(sid)
+        return item
+
+    def save(self, sid, raw, expires_at, new):
+        with self._lock:
+            self._data[sid] = (raw, expires_at)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is not None:
+                self._data[sid] = (item[0], expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self, batch_size, now):
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._data.items() if expires_at < now][:batch_size]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class DatabaseStore:
+    """
+    Sessions in a table of the app's database, shared by every worker and
+    host. Each statement runs on its own short connection, outside the
+    request's transaction, and is left out of the request's query count
+    (see metrics.py): it is one keyed lookup whatever the route.
+    """
+
+    def __init__(self, table, db):
+        self.table = table
+        self.db = db
+
+    def _read(self, stmt):
+        with self.db.engine.connect() as conn:
+            return conn.execution_options(count_query=False).execute(stmt).first()
+
+    def _write(self, stmt):
+        """Runs `stmt` in its own transaction; returns the number of rows it touched."""
+        with self.db.engine.begin() as conn:
+            return conn.execution_options(count_query=False).execute(stmt).rowcount
+
+    def load(self, sid):
+        t = self.table
+        row = self._read(select(t.c.data, t.c.expires_at).where(t.c.id == sid))
+        return None if row is None else (row.data, row.expires_at)
+
+    def save(self, sid, raw, expires_at, new):
+        t = self.table
+        if not new:
+            stmt = update(t).where(t.c.id == sid).values(data=raw, expires_at=expires_at)
+            if self._write(stmt):
+                return
+        # A new id, or one swept since it was loaded
+        self._write(insert(t).values(id=sid, data=raw, expires_at=expires_at))
+
+    def touch(self, sid, expires_at):
+        t = self.table
+        self._write(update(t).where(t.c.id == sid).values(expires_at=expires_at))
+
+    def delete(self, sid):
+        self._write(delete(self.table).where(self.table.c.id == sid))
+
+    def sweep(self, batch_size, now):
+        t = self.table
+        with self.db.engine.begin() as conn:
+            conn = conn.execution_options(count_query=False)
+            ids = conn.execute(select(t.c.id).where(t.c.expires_at < now).limit(batch_size)).scalars().all()
+            if ids:
+                conn.execute(delete(t).where(t.c.id.in_(ids), t.c.expires_at < now))
+        return len(ids)
+
+
+class ServerSessions(SessionInterface):
+    """
+    Keeps `session` on the server; the cookie carries only a random id.
+
+    `SESSION_BACKEND` is "database" (the `table` given here, shared by every
+    worker), "memory" (per worker: development or a single process) or
+    "cookie" (Flask's signed cookie holding the data itself).
+
+    A request that doesn't change the session writes nothing: the data is
+    only saved when it serializes differently from what was loaded, and
+    the expiry, `SESSION_LIFETIME` seconds after the last use, is only
+    pushed back once less than half of it is left. The cookie is only sent
+    with a new id (and, for permanent sessions, when the expiry moves).
+    An emptied session is deleted along with its cookie.
+
+    Paths under `SESSION_SKIP_PREFIXES` (static files, media) never load
+    or save a session. Expired entries are deleted `SESSION_SWEEP_BATCH` at
+    a time by a background thread, every `SESSION_SWEEP_EVERY` writes.
+    """
+
+    serializer = session_json_serializer
+
+    def __init__(self, table, app=None, db=None):
+        self.table = table
+        self.store = None
+        self._writes = 0
+        self._sweeping = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        app.config.setdefault("SESSION_BACKEND", os.environ.get("SESSION_BACKEND", "database"))
+        app.config.setdefault("SESSION_LIFETIME", int(os.environ.get(
+            "SESSION_LIFETIME", app.permanent_session_lifetime.total_seconds())))
+        app.config.setdefault("SESSION_MAX_ENTRIES", int(os.environ.get("SESSION_MAX_ENTRIES", 100000)))
+        app.config.setdefault("SESSION_SWEEP_EVERY", int(os.environ.get("SESSION_SWEEP_EVERY", 1000)))
+        app.config.setdefault("SESSION_SWEEP_BATCH", int(os.environ.get("SESSION_SWEEP_BATCH", 500)))
+        app.config.setdefault("SESSION_SKIP_PREFIXES", (f"{app.static_url_path}/", "/media/"))
+
+        kind = app.config["SESSION_BACKEND"]
+        if kind == "database":
+            self.store = DatabaseStore(self.table, db)
+        elif kind == "memory":
+            self.store = MemoryStore(app.config["SESSION_MAX_ENTRIES"])
+        elif kind == "cookie":
+            app.session_interface = SecureCookieSessionInterface()
+            return
+        else:
+            raise ValueError(f"Unknown SESSION_BACKEND: {kind}")
+        app.session_interface = self
+        app.extensions["sessions"] = self
+
+    @property
+    def lifetime(self):
+        return timedelta(seconds=self.app.config["SESSION_LIFETIME"])
+
+    # ---------- Flask's SessionInterface ----------
+    def open_session(self, app, request):
+        if request.path.startswith(app.config["SESSION_SKIP_PREFIXES"]):
+            return ServerSession(readonly=True)
+
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SESSION_ID.fullmatch(sid):
+            return ServerSession()
+        stored = self.store.load(sid)
+        if stored is None or stored[1] < datetime.utcnow():
+            return ServerSession()
+        raw, expires_at = stored
+        try:
+            data = self.serializer.loads(raw)
+        except ValueError:
+            logger.warning("Dropping unreadable session %s", sid)
+            return ServerSession()
+        return ServerSession(data, sid=sid, raw=raw, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        if session.readonly:
+            return
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app),
+                )
+            return
+
+        now = datetime.utcnow()
+        expires_at = now + self.lifetime
+        if session.new or session.rotate:
+            if session.rotate:
+                self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(16)
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), expires_at, new=True)
+            self._wrote()
+        elif session.modified and (raw := self.serializer.dumps(dict(session))) != session.raw:
+            self.store.save(session.sid, raw, expires_at, new=False)
+            self._wrote()
+        elif session.expires_at - now < self.lifetime / 2:
+            self.store.touch(session.sid, expires_at)
+        else:
+            return  # unchanged and not close to expiring: no write, no cookie
+
+        if session.new or session.rotate or session.permanent:
+            response.set_cookie(
+                name, session.sid, expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+            )
+
+    # ---------- expired sessions ----------
+    def _wrote(self):
+        self._writes += 1
+        if self._writes % self.app.config["SESSION_SWEEP_EVERY"] == 0 and not self._sweeping.locked():
+            threading.Thread(target=self.sweep, name="ServerSessions-sweep", daemon=True).start()
+
+    def sweep(self):
+        """Deletes every expired session, one batch per transaction. Returns how many."""
+        if not self._sweeping.acquire(blocking=False):
+            return 0
+        removed = 0
+        try:
+            with self.app.app_context():
+                batch = self.app.config["SESSION_SWEEP_BATCH"]
+                while True:
+                    n = self.store.sweep(batch, datetime.utcnow())
+                    removed += n
+                    if n < batch:
+                        break
+        except Exception:
+            logger.exception("Session sweep failed")
+        finally:
+            self._sweeping.release()
+        return removed
@@ -73,6 +73,7 @@
     score = 0; moves = START_MOVES;
     updateHUD();
     status('Match 3 or more to score!');
+    if (window.GameScores) GameScores.start('candy');
     scheduleHint();
   }
 
@@ -277,6 +278,13 @@
     movesEl.textContent = moves;
   }
 
+  function reportScore(result){
+    if(!window.GameScores) return;
+    GameScores.submit('candy', { score, result, moves: START_MOVES - moves }).then(data => {
+      if(data) hintText.textContent = `+${data.xp_awarded} XP · rank #${data.game_rank}`;
+    });
+  }
+
   function status(txt){
     statusLabel.textContent = txt;
   }
@@ -286,12 +294,14 @@
     if(score >= TARGET_SCORE){
       status('You Win! 🎉');
       animating = true;
+      reportScore('win');
       return;
     }
     // lose
     if(moves <= 0){
       status('No moves left — Game Over');
       animating = true;
+      reportScore('lose');
       return;
     }
     status('Ready');
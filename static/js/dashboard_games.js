@@ -47,6 +47,13 @@ mediaModal.addEventListener("show.bs.modal", function (event) {
             }
         }).catch(()=>{ document.getElementById("modal-likes").textContent = 0; });
 
+    // ---------------------- Live Counts ----------------------
+    // Other viewers' views and likes, pushed while the modal is open (needs live_counts.js)
+    LiveCounts.watch([videoId], (id, counts) => {
+        document.getElementById("modal-views").textContent = counts.views;
+        document.getElementById("modal-likes").textContent = counts.likes;
+    });
+
     // Update the form action for liking
     const likeForm = document.getElementById("modal-like-form");
     likeForm.action = `/like/${videoId}`;
@@ -67,6 +74,8 @@ mediaModal.addEventListener("show.bs.modal", function (event) {
     };
 });
 
+mediaModal.addEventListener("hidden.bs.modal", () => LiveCounts.stop());
+
 // ---------------------- Pool Game ----------------------
 (function () {
     const canvas = document.getElementById("poolCanvas");
@@ -0,0 +1,41 @@
+// game_scores.js — reports finished games to the server for XP and leaderboards
+window.GameScores = (function () {
+  const tokens = {};
+
+  // Call when a game starts; the server times the game from here
+  async function start(game) {
+    try {
+      const resp = await fetch(`/api/games/${game}/sessions`, { method: "POST" });
+      if (resp.ok) tokens[game] = (await resp.json()).token;
+    } catch (err) {
+      console.error("Could not start scored game", err);
+    }
+  }
+
+  // Call once when a game ends: { score, result: "win" | "lose" | "draw", moves }
+  async function submit(game, payload) {
+    const token = tokens[game];
+    if (!token) return null;
+    delete tokens[game];
+    try {
+      const resp = await fetch(`/api/games/${game}/scores`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(Object.assign({ token }, payload)),
+      });
+      const data = await resp.json();
+      if (!resp.ok) {
+        console.warn("Score not recorded:", data.error);
+        return null;
+      }
+      const badge = document.getElementById("xpBadge");
+      if (badge) badge.textContent = `⭐ XP: ${data.xp}`;
+      return data;
+    } catch (err) {
+      console.error("Score submission failed", err);
+      return null;
+    }
+  }
+
+  return { start, submit };
+})();
@@ -0,0 +1,28 @@
+// live_counts.js
+// Keeps the view/like counts on a page current: /api/live pushes the new
+// counts of the uploads it watches, at most once a second per upload.
+
+const LiveCounts = (function () {
+    // LIVE_MAX_IDS on the server
+    const MAX_IDS = 100;
+    let source = null;
+
+    // Watches `ids`, replacing what was watched before; onCounts(id, {views, likes}) per change
+    function watch(ids, onCounts) {
+        stop();
+        // The most recently added uploads, e.g. the cards loaded last
+        const unique = [...new Set(ids.map(String))].slice(-MAX_IDS);
+        if (!unique.length || !window.EventSource) return;
+        source = new EventSource(`/api/live?ids=${unique.join(",")}`);
+        source.onmessage = (event) => {
+            Object.entries(JSON.parse(event.data)).forEach(([id, counts]) => onCounts(id, counts));
+        };
+    }
+
+    function stop() {
+        if (source) source.close();
+        source = null;
+    }
+
+    return { watch, stop };
+})();
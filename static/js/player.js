@@ -0,0 +1,68 @@
+// player.js — adaptive (HLS) playback for uploaded videos
+// Safari/iOS play HLS natively; other browsers get hls.js (loaded on first
+// use) over Media Source Extensions. Videos without renditions yet, or
+// browsers that support neither, keep the original file.
+window.GamerPlayer = (function () {
+  const HLS_JS = "https://cdn.jsdelivr.net/npm/hls.js@1.5.15/dist/hls.min.js";
+  let hlsLoader = null;
+
+  function loadHlsJs() {
+    if (!hlsLoader) {
+      hlsLoader = new Promise((resolve, reject) => {
+        const script = document.createElement("script");
+        script.src = HLS_JS;
+        script.onload = () => resolve(window.Hls);
+        script.onerror = reject;
+        document.head.appendChild(script);
+      });
+    }
+    return hlsLoader;
+  }
+
+  // Plays `hlsUrl` in `video` if possible, else `fallbackUrl`
+  async function attach(video, hlsUrl, fallbackUrl) {
+    detach(video);
+    if (hlsUrl && video.canPlayType("application/vnd.apple.mpegurl")) {
+      video.src = hlsUrl;
+      return;
+    }
+    if (hlsUrl && window.MediaSource) {
+      try {
+        const Hls = await loadHlsJs();
+        if (Hls.isSupported()) {
+          const hls = new Hls({ capLevelToPlayerSize: true });
+          hls.loadSource(hlsUrl);
+          hls.attachMedia(video);
+          hls.on(Hls.Events.ERROR, (_, data) => {
+            if (data.fatal) {
+              console.warn("HLS playback failed, using the original file", data);
+              detach(video);
+              if (fallbackUrl) video.src = fallbackUrl;
+            }
+          });
+          video._hls = hls;
+          return;
+        }
+      } catch (err) {
+        console.warn("Could not load hls.js", err);
+      }
+    }
+    if (fallbackUrl) video.src = fallbackUrl;
+  }
+
+  function detach(video) {
+    if (video._hls) {
+      video._hls.destroy();
+      video._hls = null;
+    }
+  }
+
+  // Every <video data-hls="..."> on the page
+  function attachAll(root) {
+    (root || document).querySelectorAll("video[data-hls]").forEach(video => {
+      attach(video, video.dataset.hls, video.dataset.src || null);
+    });
+  }
+
+  return { attach, detach, attachAll };
+})();
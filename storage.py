@@ -0,0 +1,320 @@
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+logger = logging.getLogger(__name__)
+
+# "<sha256 hex>.<ext>", and the files derived from it ("<sha256>.thumb.jpg",
+# "<sha256>.hls/360p/index.m3u8"). Anything else is a legacy flat name.
+CONTENT_KEY = re.compile(r"^[0-9a-f]{64}\.")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def content_key(digest, original_name):
+    """Storage name for a file: its sha256 plus the original extension, e.g. `9f86…08.png`."""
+    ext = re.sub(r"[^a-z0-9]", "", original_name.rsplit(".", 1)[-1].lower()) if "." in original_name else ""
+    return f"{digest}.{ext or 'bin'}"
+
+
+def shard_path(name):
+    """
+    `9f86d0….png` -> `9f/86/9f86d0….png`: two levels of 256 folders, so no
+    folder holds more than a few thousand files even with a billion stored.
+    Derived files land next to their original; legacy names stay flat.
+    """
+    if CONTENT_KEY.match(name):
+        return f"{name[:2]}/{name[2:4]}/{name}"
+    return name
+
+
+class LocalStorage:
+    """Files on this machine's disk, under `root` (created by the first save)."""
+
+    remote = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def relpath(self, name):
+        return shard_path(name)
+
+    def path(self, name):
+        return os.path.join(self.root, shard_path(name))
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def open(self, name):
+        return open(self.path(name), "rb")
+
+    def save(self, src_path, name):
+        """Moves a file or folder into place: a rename when it is on the same disk."""
+        dst = self.path(name)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.isdir(src_path):
+            shutil.rmtree(dst, ignore_errors=True)
+            shutil.move(src_path, dst)
+            return
+        try:
+            os.replace(src_path, dst)
+        except OSError:
+            # Another disk: copy beside the destination, then rename over it
+            tmp = f"{dst}.{os.getpid()}.tmp"
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, dst)
+            os.remove(src_path)
+
+    def delete(self, name):
+        """Removes a file or a whole folder (an HLS ladder); missing is fine."""
+        path = self.path(name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    @contextmanager
+    def workspace(self, name):
+        """The folder holding `name`; files written there are stored as-is."""
+        yield os.path.dirname(self.path(name))
+
+
+class S3Storage:
+    """
+    Objects in an S3-compatible bucket (AWS S3, MinIO, ...) laid out like
+    LocalStorage, under `prefix`. Clients are sent to the bucket itself:
+    `public_url` for a public bucket, else presigned URLs that expire after
+    `url_expires` seconds. Needs boto3; credentials come from the usual
+    AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY environment variables.
+    """
+
+    remote = True
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region=None, public_url=None, url_expires=3600, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("MEDIA_STORAGE=s3 needs boto3 (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.url_expires = url_expires
+
+    def key(self, name):
+        return self.prefix + shard_path(name)
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except self.client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def open(self, name):
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(name))["Body"]
+
+    def url(self, name):
+        if self.public_url:
+            return f"{self.public_url}/{self.key(name)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(name)}, ExpiresIn=self.url_expires
+        )
+
+    def _upload(self, path, name):
+        extra = {"ContentType": mimetypes.guess_type(name)[0] or "application/octet-stream"}
+        if CONTENT_KEY.match(name):
+            extra["CacheControl"] = IMMUTABLE
+        self.client.upload_file(path, self.bucket, self.key(name), ExtraArgs=extra)
+
+    def save(self, src_path, name):
+        """Uploads a file or folder (multipart for big files), then removes the local copy."""
+        if os.path.isdir(src_path):
+            for dirpath, _, files in os.walk(src_path):
+                for f in files:
+                    path = os.path.join(dirpath, f)
+                    self._upload(path, f"{name}/{os.path.relpath(path, src_path)}")
+            shutil.rmtree(src_path)
+        else:
+            self._upload(src_path, name)
+            os.remove(src_path)
+
+    def delete(self, name):
+        """Removes an object and everything under `name/` (an HLS ladder)."""
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+        pages = self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.key(name) + "/")
+        for page in pages:
+            objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+
+    @contextmanager
+    def workspace(self, name):
+        """
+        A temporary folder holding a download of `name`. New files and
+        folders written there are uploaded when the block exits cleanly.
+        """
+        tmp = tempfile.mkdtemp(prefix="media-")
+        try:
+            self.client.download_file(self.bucket, self.key(name), os.path.join(tmp, name))
+            yield tmp
+            for entry in os.listdir(tmp):
+                if entry != name and not entry.startswith("."):
+                    self.save(os.path.join(tmp, entry), entry)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+class MediaStore:
+    """
+    Upload and avatar files, stored once per distinct content and deleted
+    after the last row using them goes.
+
+    Files are named after their content (`content_key()`) and kept by a
+    backend: `LocalStorage` in sharded folders under UPLOAD_FOLDER
+    (MEDIA_STORAGE=local, the default) or `S3Storage` (MEDIA_STORAGE=s3).
+    Files derived from one (thumbnails, its HLS folder) share its shard.
+
+    `table` (name, refs) counts the rows using each stored name:
+    `put()`/`retain()` before a row starts using a name, `release()` after it
+    stops. `purge()` deletes a name whose count is 0, checking the count in
+    the same transaction that deletes the row, so a file reused in the
+    meantime is kept. Counts only ever err high: a crash in between leaks a
+    file rather than deleting one in use. Names without a row (files written
+    before the counts existed) are never deleted.
+    """
+
+    def __init__(self, table, app=None, db=None):
+        self.table = table
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("MEDIA_STORAGE", os.environ.get("MEDIA_STORAGE", "local"))
+        app.config.setdefault("S3_BUCKET", os.environ.get("S3_BUCKET"))
+        app.config.setdefault("S3_PREFIX", os.environ.get("S3_PREFIX", ""))
+        app.config.setdefault("S3_ENDPOINT_URL", os.environ.get("S3_ENDPOINT_URL"))  # e.g. MinIO's http://localhost:9000
+        app.config.setdefault("S3_REGION", os.environ.get("S3_REGION"))
+        app.config.setdefault("S3_PUBLIC_URL", os.environ.get("S3_PUBLIC_URL"))
+        app.config.setdefault("S3_URL_EXPIRES", int(os.environ.get("S3_URL_EXPIRES", 3600)))
+        self.backend = self.make_backend(app.config)
+        app.extensions["media"] = self
+
+    @staticmethod
+    def make_backend(config):
+        if config["MEDIA_STORAGE"] == "s3":
+            return S3Storage(
+                config["S3_BUCKET"],
+                prefix=config["S3_PREFIX"],
+                endpoint_url=config["S3_ENDPOINT_URL"],
+                region=config["S3_REGION"],
+                public_url=config["S3_PUBLIC_URL"],
+                url_expires=config["S3_URL_EXPIRES"],
+            )
+        if config["MEDIA_STORAGE"] != "local":
+            raise RuntimeError(f"Unknown MEDIA_STORAGE {config['MEDIA_STORAGE']!r}")
+        return LocalStorage(config["UPLOAD_FOLDER"])
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def workspace(self, name):
+        return self.backend.workspace(name)
+
+    # ---------- reference counts ----------
+    def retain(self, name, n=1):
+        self.retain_many({name: n})
+
+    def retain_many(self, counts):
+        """Adds `counts[name]` references to each name, in one transaction."""
+        if not counts:
+            return
+        t = self.table
+        dialect = self.db.engine.dialect.name
+        with self.db.engine.begin() as conn:
+            if dialect in ("postgresql", "sqlite"):
+                stmt = (postgresql if dialect == "postgresql" else sqlite).insert(t)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[t.c.name], set_={"refs": t.c.refs + stmt.excluded.refs},
+                )
+                conn.execute(stmt, [{"name": name, "refs": n} for name, n in counts.items()])
+                return
+            for name, n in counts.items():
+                if not conn.execute(update(t).where(t.c.name == name).values(refs=t.c.refs + n)).rowcount:
+                    conn.execute(insert(t).values(name=name, refs=n))
+
+    def release(self, name):
+        """Drops one reference. Returns: the references left, or None for a name never counted."""
+        t = self.table
+        with self.db.engine.begin() as conn:
+            conn.execute(update(t).where(t.c.name == name).values(refs=t.c.refs - 1))
+            return conn.execute(select(t.c.refs).where(t.c.name == name)).scalar()
+
+    def release_many(self, counts):
+        """
+        Drops `counts[name]` references to each name, in one transaction.
+        Returns: the names that now have none left.
+        """
+        counts = {name: n for name, n in counts.items() if name}
+        if not counts:
+            return []
+        t = self.table
+        with self.db.engine.begin() as conn:
+            conn.execute(
+                update(t).where(t.c.name == bindparam("b_name")).values(refs=t.c.refs - bindparam("b_n")),
+                [{"b_name": name, "b_n": n} for name, n in counts.items()],
+            )
+            return conn.execute(select(t.c.name).where(t.c.name.in_(counts), t.c.refs == 0)).scalars().all()
+
+    def forget(self, name):
+        """Stops counting `name` without touching its files (it was moved)."""
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.name == name))
+
+    # ---------- files ----------
+    def put(self, src_path, name):
+        """
+        Stores the file at `src_path` as `name` and counts one reference to it.
+        When the content is already stored, `src_path` is just deleted.
+        Returns: `name`
+        """
+        # Counted first: once committed, purge() can no longer remove the stored copy
+        self.retain(name)
+        try:
+            if self.backend.exists(name):
+                os.remove(src_path)
+            else:
+                self.backend.save(src_path, name)
+        except BaseException:
+            self.release(name)
+            raise
+        return name
+
+    def purge(self, name, names=None):
+        """
+        Deletes `names` (default: just `name`) if nothing references `name`.
+        Returns: whether they were deleted.
+        """
+        t = self.table
+        # The row stays locked until the files are gone, so a concurrent put()
+        # of the same content waits and then stores a fresh copy
+        with self.db.engine.begin() as conn:
+            if not conn.execute(delete(t).where(t.c.name == name, t.c.refs <= 0)).rowcount:
+                return False
+            for n in names or [name]:
+                self.backend.delete(n)
+        logger.info("deleted %s", name)
+        return True
@@ -0,0 +1,128 @@
+import asyncio
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.py builds the default app when imported; it needs a URL but never connects
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import create_app  # noqa: E402
+from extensions import counters, login_ip_throttle, search, view_dedup  # noqa: E402
+from models import Upload, db  # noqa: E402
+
+PASSWORD = "Passw0rd!"
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    """Settings of the `app` fixture; override it in a module to add some."""
+    return {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+        "CACHE_DIR": str(tmp_path / "cache"),
+        "METRICS_DIR": str(tmp_path / "metrics"),
+        "LIVE_DIR": str(tmp_path / "live"),
+        "LEADERBOARD_SNAPSHOT_PATH": str(tmp_path / "leaderboards.json.gz"),
+        "PASSWORD_HASH_ROUNDS": 4,
+        "JOBS_EAGER": True,
+        # Counts and dedup rows written at once, so tests can read them back
+        "COUNTER_STRICT": True,
+    }
+
+
+@pytest.fixture
+def app(app_config):
+    """A fresh app from the factory, on its own SQLite file and folders."""
+    app = create_app(app_config)
+    with app.app_context():
+        # Only the primary: `db` keeps the bind keys of earlier apps (replicas)
+        db.create_all(bind_key=None)
+        search.ensure_schema()
+    # Limits are per process, and every test client logs in from here
+    login_ip_throttle.reset("127.0.0.1")
+    yield app
+
+
+@pytest.fixture
+def buffered(app):
+    """Counts and dedup rows buffered as in production; flushed before the test's database goes."""
+    app.config["COUNTER_STRICT"] = False
+    yield
+    counters.flush()
+    view_dedup.flush()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Registers `username` (if needed) and logs the client in as them."""
+    def login(username):
+        client.post("/register", data={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+        client.post("/login", data={"identifier": username, "password": PASSWORD})
+    return login
+
+
+@pytest.fixture
+def upload(app, client):
+    """Uploads a small image as the logged-in user. Returns: its id"""
+    def upload(name="pic.png", color=(200, 0, 0)):
+        buf = io.BytesIO()
+        Image.new("RGB", (16, 16), color).save(buf, "PNG")
+        buf.seek(0)
+        client.post("/upload", data={"file": (buf, name)}, content_type="multipart/form-data")
+        with app.app_context():
+            return db.session.query(db.func.max(Upload.id)).scalar()
+    return upload
+
+
+@pytest.fixture
+def asgi(app, tmp_path):
+    """
+    The app behind asgi.py's bridge. `asgi.request(...)` runs one request
+    on a new event loop. Returns: (status, headers, [body chunks])
+    """
+    from asgi import WSGIBridge
+    from extensions import live
+
+    config = dict(
+        app.config, ASGI_THREADS=2, ASGI_COUNTER_THREADS=1, ASGI_STREAM_BLOCK=256 * 1024,
+        ASGI_SPOOL_MEMORY=1024, ASGI_SPOOL_DIR=str(tmp_path / "spool"), ASGI_MAX_BODY=1024 * 1024,
+    )
+    bridge = WSGIBridge(app, config, live)
+
+    async def call(method, path, body=b"", headers=(), query=b"", receive=None):
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def default_receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.Event().wait()  # never disconnects
+
+        sent = []
+        scope = {
+            "type": "http", "method": method, "path": path, "query_string": query, "http_version": "1.1",
+            "headers": [(k.encode(), v.encode()) for k, v in headers],
+            "client": ("127.0.0.1", 50000), "server": ("localhost", 80),
+        }
+
+        async def send(message):
+            sent.append(message)
+
+        await bridge(scope, receive or default_receive, send)
+        start = sent[0]
+        return start["status"], dict(start["headers"]), [m.get("body", b"") for m in sent[1:]]
+
+    bridge.call = call
+    bridge.request = lambda *args, **kwargs: asyncio.run(call(*args, **kwargs))
+    yield bridge
+    for pool in bridge._pools.values():
+        pool.shutdown(wait=True)
@@ -0,0 +1,38 @@
+from extensions import analytics
+from models import User, UserStat, db
+
+
+def test_removing_an_upload_never_takes_totals_below_zero(app, client, login, upload):
+    login("alice")
+    upload_id = upload()
+    client.post(f"/view/{upload_id}")
+    client.post(f"/like/{upload_id}")
+    analytics.flush()
+    with app.app_context():
+        # Totals that never saw these counts, like a database from before the rollups
+        db.session.execute(db.update(UserStat).values(uploads=0, views=0, likes=0))
+        db.session.commit()
+
+    client.post(f"/delete/{upload_id}")
+    analytics.flush()
+
+    with app.app_context():
+        user = User.query.filter_by(username="alice").one()
+        assert analytics.totals(user.id) == {"uploads": 0, "views": 0, "likes": 0}
+
+
+def test_removing_an_upload_takes_off_what_it_counted(app, client, login, upload, buffered):
+    login("alice")
+    kept, removed = upload(), upload(color=(0, 200, 0))
+    for upload_id in (kept, removed):
+        client.post(f"/view/{upload_id}")
+    client.post(f"/like/{removed}")
+    # The rollups are written, the upload's own counters still buffered
+    analytics.flush()
+
+    client.post(f"/delete/{removed}")
+    analytics.flush()
+
+    with app.app_context():
+        user = User.query.filter_by(username="alice").one()
+        assert analytics.totals(user.id) == {"uploads": 1, "views": 1, "likes": 0}
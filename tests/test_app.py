@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+
+from app import database_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(cwd, *args, **env):
+    """Runs python `args` in a fresh interpreter, in `cwd`, with the repo importable."""
+    env = {"PATH": os.environ["PATH"], "PYTHONPATH": ROOT, "FLASK_APP": "app", **env}
+    return subprocess.run([sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True, timeout=60)
+
+
+def test_database_url():
+    assert database_url("postgres://u@db/app") == "postgresql://u@db/app?sslmode=require"
+    assert database_url("postgresql://u@db/app?sslmode=disable") == "postgresql://u@db/app?sslmode=disable"
+    assert database_url("sqlite:///app.db?timeout=5") == "sqlite:///app.db?timeout=5&sslmode=require"
+    assert database_url(None) is None
+
+
+def test_import_has_no_side_effects(tmp_path):
+    database = tmp_path / "app.db"
+
+    result = run(tmp_path, "-c", "import app; print(sorted(app.app.blueprints))", DATABASE_URL=f"sqlite:///{database}")
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["['admin',", "'auth',", "'media',", "'profile',", "'social']"]
+    # No database opened, no upload folders made
+    assert os.listdir(tmp_path) == []
+
+
+def test_init_db(tmp_path):
+    database = tmp_path / "app.db"
+
+    # Next to migrations/, which it stamps the database with
+    result = run(ROOT, "-m", "flask", "init-db", DATABASE_URL=f"sqlite:///{database}")
+
+    assert result.returncode == 0, result.stderr
+    tables = set(inspect(create_engine(f"sqlite:///{database}")).get_table_names())
+    assert {"user", "upload", "job", "alembic_version", "user_search"} <= tables
+
+
+def test_migrations_match_the_models(tmp_path):
+    database = f"sqlite:///{tmp_path / 'app.db'}"
+
+    result = run(ROOT, "-m", "flask", "db", "upgrade", DATABASE_URL=database)
+    assert result.returncode == 0, result.stderr
+    result = run(ROOT, "-m", "flask", "db", "check", DATABASE_URL=database)
+    assert result.returncode == 0, result.stderr
+
+    # Read from sqlite_master: reflection skips lower(email)
+    with create_engine(database).connect() as conn:
+        indexes = set(conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index'")))
+    assert {"ix_upload_user_id_id", "ix_upload_created_at", "ix_user_email_lower"} <= indexes
+
+
+def test_migrations_fix_tables_from_create_all(tmp_path):
+    database = f"sqlite:///{tmp_path / 'app.db'}"
+    result = run(ROOT, "-m", "flask", "db", "upgrade", "9c495438e42b", DATABASE_URL=database)
+    assert result.returncode == 0, result.stderr
+    # As an old `db.create_all()` at import time left them
+    with create_engine(database).begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE video_like (id INTEGER PRIMARY KEY, user_id VARCHAR(200) NOT NULL,"
+            " filename VARCHAR(255) NOT NULL, filetype VARCHAR(20) NOT NULL,"
+            " video_id INTEGER NOT NULL REFERENCES upload (id))"
+        ))
+        conn.execute(text(
+            "CREATE TABLE upload_view (id INTEGER PRIMARY KEY, upload_id INTEGER NOT NULL REFERENCES upload (id),"
+            " user_id INTEGER NOT NULL REFERENCES user (id))"
+        ))
+
+    result = run(ROOT, "-m", "flask", "db", "upgrade", DATABASE_URL=database)
+
+    assert result.returncode == 0, result.stderr
+    schema = inspect(create_engine(database))
+    assert [c["name"] for c in schema.get_unique_constraints("video_like")] == ["unique_like"]
+    assert "viewer" in {c["name"] for c in schema.get_columns("upload_view")}
+
+
+def test_database_url_required(tmp_path):
+    result = run(tmp_path, "-c", "import app")
+
+    assert result.returncode != 0
+    assert "SQLALCHEMY_DATABASE_URI" in result.stderr
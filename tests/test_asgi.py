@@ -0,0 +1,73 @@
+import asyncio
+import io
+import os
+
+from PIL import Image
+
+from models import Upload
+
+
+def test_pages(asgi, login):
+    status, headers, body = asgi.request("GET", "/users")
+
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/html")
+    assert b"</html>" in b"".join(body)
+
+
+def test_counters(asgi, login, upload):
+    login("alice")
+    upload_id = upload()
+
+    status, _, body = asgi.request("POST", f"/view/{upload_id}")
+
+    assert status == 200
+    assert b"".join(body) == b'{"views":1}\n'
+    assert set(asgi._pools) == {"counters"}
+
+
+def test_media_streamed_in_blocks(app, asgi, client, login):
+    login("alice")
+    # Noise doesn't compress: several 8 KiB blocks
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (100, 100), os.urandom(30000)).save(buf, "PNG")
+    buf.seek(0)
+    client.post("/upload", data={"file": (buf, "noise.png")}, content_type="multipart/form-data")
+    with app.app_context():
+        filename = Upload.query.one().filename
+    asgi.config["ASGI_STREAM_BLOCK"] = 8192
+
+    status, headers, body = asgi.request("GET", f"/media/{filename}")
+
+    assert status == 200
+    assert len([chunk for chunk in body if chunk]) > 1
+    assert b"".join(body) == client.get(f"/media/{filename}").data
+
+
+def test_form_post_spooled(asgi):
+    body = b"username=a&email=a%40example.com&password=" + b"x" * 4096
+
+    status, _, _ = asgi.request(
+        "POST", "/register", body, headers=[("content-type", "application/x-www-form-urlencoded")],
+    )
+
+    assert status == 302
+
+
+def test_body_too_large(asgi):
+    asgi.config["ASGI_MAX_BODY"] = 10
+    declared = asgi.request("POST", "/register", b"x" * 11, headers=[("content-length", "11")])
+    streamed = asgi.request("POST", "/register", b"x" * 11)
+
+    assert declared[0] == streamed[0] == 413
+
+
+def test_client_gone_before_the_body(asgi):
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise AssertionError("nothing to send to a client that left")
+
+    scope = {"type": "http", "method": "POST", "path": "/register", "query_string": b"", "headers": []}
+    asyncio.run(asgi(scope, receive, send))
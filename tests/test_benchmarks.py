@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def saved_run(path, p95_ms, rps=100.0):
+    """A bench_load.py --output file with one route."""
+    route = {"requests": 500, "errors": 0, "p95_ms": p95_ms, "rps": rps, "peak_rss_mb": 80.0}
+    path.write_text(json.dumps({
+        "meta": {"commit": "abc123"},
+        "scenarios": {"browse": {"routes": {"GET social.gallery": route}, "server_peak_rss_mb": 300.0}},
+    }))
+    return str(path)
+
+
+def compare(*files):
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "bench_load.py"), "--compare", *files],
+        capture_output=True, text=True, timeout=60,
+    )
+
+
+def test_compare_same_speed(tmp_path):
+    result = compare(saved_run(tmp_path / "old.json", 40.0), saved_run(tmp_path / "new.json", 44.0))
+
+    assert result.returncode == 0, result.stderr
+    assert "0 regression(s)" in result.stdout
+
+
+def test_compare_flags_a_slower_route(tmp_path):
+    result = compare(saved_run(tmp_path / "old.json", 40.0), saved_run(tmp_path / "new.json", 60.0, rps=70.0))
+
+    assert result.returncode == 1, result.stderr
+    assert "slower, less throughput" in result.stdout
+    assert "1 regression(s)" in result.stdout
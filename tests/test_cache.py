@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from cache import Cache, FileBackend, MemoryBackend
+
+
+def test_generations_survive_eviction(app):
+    cache = Cache(app)
+    cache.backend = MemoryBackend(max_entries=2)
+    cache.invalidate("feed")
+    key = cache.key("page", 1, depends=("feed",))
+    for i in range(5):
+        cache.set(f"filler:{i}", i)
+    # Were the generation evicted, keys would go back to the ones before the invalidation
+    assert cache.generation("feed") == 1
+    assert cache.key("page", 1, depends=("feed",)) == key
+
+
+def test_file_generations_survive_sweep(tmp_path):
+    backend = FileBackend(str(tmp_path / "cache"))
+    backend.incr("gen:feed")
+    backend.set("page", "old", ttl=-1)
+    backend.sweep()
+    assert backend.get("page") != "old"
+    assert backend.counter("gen:feed") == 1
+
+
+def test_file_backend_is_private(tmp_path):
+    backend = FileBackend(str(tmp_path / "cache"))
+    assert os.stat(backend.directory).st_mode & 0o777 == 0o700
+
+
+def test_file_backend_refuses_a_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(RuntimeError, match="chmod 700"):
+        FileBackend(str(shared))
+
+
+def test_invalidation_reaches_every_worker(app):
+    # Two workers: each binds its own Cache to the same app config
+    first, second = Cache(app), Cache(app)
+    assert isinstance(first.backend, FileBackend)
+    key = second.key("page", 1, depends=("feed",))
+    second.set(key, "old")
+
+    first.invalidate("feed")
+
+    assert second.get(second.key("page", 1, depends=("feed",))) is None
@@ -0,0 +1,83 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+from extensions import counters
+from models import Upload, db
+
+
+def upload_selects(app):
+    """SELECTs on the upload table run from now on."""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith("SELECT") and re.search(r"FROM upload\b", statement):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    return statements
+
+
+def test_views_count_once_per_viewer(app, client, login, upload):
+    login("alice")
+    upload_id = upload()
+
+    assert client.post(f"/view/{upload_id}").get_json() == {"views": 1}
+    assert client.post(f"/view/{upload_id}").get_json() == {"views": 1}
+    assert app.test_client().post(f"/view/{upload_id}").get_json() == {"views": 2}
+    with app.app_context():
+        assert db.session.get(Upload, upload_id).views == 2
+
+
+def test_like_twice(app, client, login, upload):
+    login("alice")
+    upload_id = upload()
+
+    assert client.post(f"/like/{upload_id}").get_json() == {"likes": 1}
+    response = client.post(f"/like/{upload_id}")
+
+    assert response.status_code == 400
+    with app.app_context():
+        assert db.session.get(Upload, upload_id).likes == 1
+
+
+def test_missing_upload(client):
+    assert client.post("/view/999").status_code == 404
+    assert client.post("/like/999").status_code == 404
+
+
+def test_buffered_views_skip_the_upload_row(app, client, login, upload, buffered):
+    login("alice")
+    upload_id = upload()
+    client.post(f"/view/{upload_id}")
+    selects = upload_selects(app)
+
+    for _ in range(3):
+        response = app.test_client().post(f"/view/{upload_id}")
+
+    assert response.get_json() == {"views": 4}
+    assert selects == []
+
+
+def test_buffered_counts_are_written_relative(app, upload, login, buffered):
+    login("alice")
+    upload_id = upload()
+    with app.app_context():
+        db.session.execute(db.update(Upload).where(Upload.id == upload_id).values(views=10))
+        db.session.commit()
+
+    counters.incr(upload_id, "views", 3)
+    assert counters.pending(upload_id, "views") == 3
+    counters.flush()
+
+    assert counters.pending(upload_id, "views") == 0
+    with app.app_context():
+        assert db.session.get(Upload, upload_id).views == 13
+
+
+def test_unknown_counter_column(app):
+    with pytest.raises(ValueError, match="Unknown counter column"):
+        counters.incr(1, "shares")
@@ -0,0 +1,71 @@
+import shutil
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from extensions import router
+from models import User, db
+
+
+@pytest.fixture
+def app_config(app_config, tmp_path):
+    # In a folder of its own, so a test can take it away
+    (tmp_path / "replica").mkdir()
+    return dict(app_config, SQLALCHEMY_REPLICA_URIS=[f"sqlite:///{tmp_path / 'replica' / 'replica.db'}"])
+
+
+@pytest.fixture
+def replica(app):
+    """Creates the replica's tables, with a user only it has."""
+    with app.app_context():
+        engine = db.engines["replica1"]
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert().values(username="on-replica", email="r@example.com", password="x"))
+
+
+def usernames():
+    return db.session.execute(select(User.username).order_by(User.username)).scalars().all()
+
+
+def test_reads_go_to_the_replica(app, replica, login):
+    login("alice")
+    with app.test_request_context():
+        assert usernames() == ["on-replica"]
+
+
+def test_reads_after_a_write_go_to_the_primary(app, replica, login):
+    login("alice")
+    with app.test_request_context():
+        db.session.add(User(username="bob", email="bob@example.com", password="x"))
+        db.session.commit()
+        assert usernames() == ["alice", "bob"]
+    with app.test_request_context():
+        router.use_primary()
+        assert usernames() == ["alice", "bob"]
+
+
+def test_client_that_wrote_sticks_to_the_primary(app, replica, client, login):
+    login("alice")
+    cookie = client.get_cookie(app.config["DB_REPLICA_COOKIE"])
+    assert cookie is not None
+
+    with app.test_request_context(headers={"Cookie": f"{cookie.key}={cookie.value}"}):
+        assert usernames() == ["alice"]
+    with app.test_request_context():
+        assert usernames() == ["on-replica"]
+
+
+def test_failed_replica_is_skipped(app, replica, login, tmp_path):
+    login("alice")
+    shutil.rmtree(tmp_path / "replica")
+    with app.app_context():
+        db.engines["replica1"].dispose()
+
+    with app.test_request_context():
+        with pytest.raises(OperationalError):
+            usernames()
+
+    with app.test_request_context():
+        assert usernames() == ["alice"]
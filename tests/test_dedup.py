@@ -0,0 +1,87 @@
+from sqlalchemy import event
+
+from dedup import BloomFilter, DedupStore
+from extensions import counters, like_dedup
+from models import Upload, UploadView, VideoLike, db
+
+
+def view_store(app, duplicates):
+    return DedupStore(UploadView, "upload_id", "viewer", on_duplicate=duplicates.append, app=app, db=db)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(100)
+    for i in range(100):
+        bloom.add(f"user:{i}")
+    assert all(f"user:{i}" in bloom for i in range(100))
+
+
+def test_like_is_refused_by_a_fresh_worker(app, client, login, upload, buffered):
+    login("alice")
+    upload_id = upload()
+    assert client.post(f"/like/{upload_id}").status_code == 200
+
+    # Another worker, or this one after a restart: nothing in its filters
+    like_dedup._filters.clear()
+    response = client.post(f"/like/{upload_id}")
+
+    assert response.status_code == 400
+    counters.flush()
+    with app.app_context():
+        assert VideoLike.query.filter_by(video_id=upload_id).count() == 1
+        assert db.session.get(Upload, upload_id).likes == 1
+
+
+def test_flush_reports_views_recorded_elsewhere(app, login, upload, buffered):
+    login("alice")
+    upload_id = upload()
+    duplicates = []
+    store = view_store(app, duplicates)
+    with app.app_context():
+        db.session.add(UploadView(upload_id=upload_id, viewer="anon:other-worker"))
+        db.session.commit()
+
+        # A filter miss is trusted until the flush
+        assert store.add(upload_id, "anon:other-worker")
+        assert store.add(upload_id, "anon:new")
+        assert not store.add(upload_id, "anon:new")
+    store.flush()
+
+    assert duplicates == [upload_id]
+    with app.app_context():
+        assert UploadView.query.filter_by(upload_id=upload_id).count() == 2
+
+
+def test_flush_is_one_insert(app, login, upload, buffered):
+    login("alice")
+    upload_id = upload()
+    store = view_store(app, [])
+    inserts = []
+    with app.app_context():
+        for i in range(50):
+            store.add(upload_id, f"anon:{i}")
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: inserts.append(statement) if statement.startswith("INSERT") else None)
+    store.flush()
+
+    assert len(inserts) == 1
+    with app.app_context():
+        assert UploadView.query.filter_by(upload_id=upload_id).count() == 50
+
+
+def test_flush_without_returning(app, login, upload, buffered, monkeypatch):
+    login("alice")
+    upload_id = upload()
+    duplicates = []
+    store = view_store(app, duplicates)
+    with app.app_context():
+        db.session.add(UploadView(upload_id=upload_id, viewer="anon:a"))
+        db.session.commit()
+        monkeypatch.setattr(db.engine.dialect, "insert_executemany_returning", False)
+        store.add(upload_id, "anon:a")
+        store.add(upload_id, "anon:b")
+    store.flush()
+
+    assert duplicates == [upload_id]
+    with app.app_context():
+        assert UploadView.query.filter_by(upload_id=upload_id).count() == 2
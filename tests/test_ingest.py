@@ -0,0 +1,91 @@
+import io
+
+import pytest
+from PIL import Image
+
+from models import Upload, db
+
+
+def png(color=(0, 120, 200)):
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def start(client, size, filename="big.png"):
+    return client.post("/api/upload-sessions", json={"filename": filename, "size": size})
+
+
+def put(client, token, offset, chunk):
+    return client.put(f"/api/upload-sessions/{token}", data=chunk, headers={"Upload-Offset": str(offset)})
+
+
+def test_chunked_upload(app, client, login):
+    login("alice")
+    data = png()
+    token = start(client, len(data)).get_json()["token"]
+
+    assert put(client, token, 0, data[:40]).get_json()["offset"] == 40
+    assert client.get(f"/api/upload-sessions/{token}").get_json() == {"token": token, "offset": 40, "size": len(data)}
+    assert put(client, token, 40, data[40:]).get_json()["offset"] == len(data)
+    response = client.post(f"/api/upload-sessions/{token}/finalize")
+
+    assert response.status_code == 201
+    assert response.get_json()["deduplicated"] is False
+    with app.app_context():
+        assert db.session.get(Upload, response.get_json()["id"]).original_name == "big.png"
+
+
+def test_same_content_is_stored_once(client, login):
+    login("alice")
+    data = png()
+    for expected in (False, True):
+        token = start(client, len(data)).get_json()["token"]
+        put(client, token, 0, data)
+        assert client.post(f"/api/upload-sessions/{token}/finalize").get_json()["deduplicated"] is expected
+
+
+@pytest.mark.parametrize("size", [None, "10", 10.0, True, -1, [10]])
+def test_size_must_be_a_whole_number(client, login, size):
+    login("alice")
+    response = start(client, size)
+    assert response.status_code == 400
+    assert "size" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("body", [{"filename": 5, "size": 10}, {"filename": "a.exe", "size": 10}, ["a.png", 10]])
+def test_bad_filename(client, login, body):
+    login("alice")
+    assert client.post("/api/upload-sessions", json=body).status_code == 400
+
+
+def test_too_large(app, client, login):
+    login("alice")
+    assert start(client, app.config["MAX_UPLOAD_SIZE"] + 1).status_code == 413
+
+
+def test_chunk_past_the_announced_size(client, login):
+    login("alice")
+    token = start(client, 10).get_json()["token"]
+    response = put(client, token, 0, b"x" * 11)
+    assert response.status_code == 413
+    assert client.get(f"/api/upload-sessions/{token}").get_json()["offset"] == 0
+
+
+def test_chunk_at_the_wrong_offset(client, login):
+    login("alice")
+    token = start(client, 10).get_json()["token"]
+    put(client, token, 0, b"x" * 4)
+    response = put(client, token, 2, b"x" * 6)
+    assert response.status_code == 409
+    assert response.get_json()["offset"] == 4
+    assert client.post(f"/api/upload-sessions/{token}/finalize").status_code == 409
+
+
+def test_someone_elses_session(client, login):
+    login("alice")
+    token = start(client, 10).get_json()["token"]
+    login("bob")
+    assert client.get(f"/api/upload-sessions/{token}").status_code == 404
+    assert put(client, token, 0, b"x").status_code == 404
+    assert client.get("/api/upload-sessions/not-a-token").status_code == 404
@@ -0,0 +1,115 @@
+import io
+
+import pytest
+from PIL import Image
+
+from extensions import jobs
+from jobs import DONE, FAILED, QUEUED
+from models import Job, Upload, User, db
+
+
+@pytest.fixture
+def queued(app):
+    """Jobs go to the table instead of running inline. Returns: a function that runs the due ones"""
+    app.config.update(TESTING=False, JOBS_EAGER=False)
+    calls = []
+
+    @jobs.handler("test_job")
+    def test_job(fail=False):
+        calls.append(fail)
+        if fail:
+            raise ValueError("boom")
+
+    def run_due():
+        with app.app_context():
+            for job in jobs.claim(10):
+                jobs._run(job)
+    run_due.calls = calls
+    yield run_due
+    app.config.update(TESTING=True, JOBS_EAGER=True)
+    jobs.types.pop("test_job")
+
+
+def job_rows(app, **filters):
+    with app.app_context():
+        return [(job.type, job.status) for job in Job.query.filter_by(**filters).order_by(Job.id)]
+
+
+def test_job_runs_once_per_key(app, queued):
+    with app.app_context():
+        first = jobs.enqueue("test_job", key="a")
+        assert jobs.enqueue("test_job", key="a") == first
+
+    queued()
+
+    assert queued.calls == [False]
+    assert job_rows(app) == [("test_job", DONE)]
+    with app.app_context():
+        assert jobs.enqueue("test_job", key="a") == first
+
+
+def test_failing_job_retries_then_fails(app, queued):
+    app.config["JOB_BACKOFF_BASE"] = 0
+    with app.app_context():
+        jobs.enqueue("test_job", {"fail": True}, key="a")
+
+    for _ in range(app.config["JOB_MAX_ATTEMPTS"] + 1):
+        queued()
+
+    assert len(queued.calls) == app.config["JOB_MAX_ATTEMPTS"]
+    with app.app_context():
+        job = Job.query.one()
+        assert (job.status, job.last_error) == (FAILED, "ValueError: boom")
+        assert jobs.retry_failed() == 1
+
+
+def test_cancel(app, queued):
+    with app.app_context():
+        done = jobs.enqueue("test_job", key="done")
+    queued()
+    with app.app_context():
+        jobs.enqueue("test_job", key="queued")
+
+        assert jobs.cancel(["done", "queued"]) == 1
+        assert job_rows(app) == [("test_job", DONE)]
+        assert jobs.enqueue("test_job", key="done") != done
+
+
+def post_image(client, name="pic.png"):
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), (0, 0, 200)).save(buf, "PNG")
+    buf.seek(0)
+    client.post("/upload", data={"file": (buf, name)}, content_type="multipart/form-data")
+
+
+def test_upload_again_after_delete(app, client, login, queued):
+    login("alice")
+    post_image(client)
+    with app.app_context():
+        upload_id = db.session.query(db.func.max(Upload.id)).scalar()
+    assert job_rows(app, status=QUEUED) == [("thumbnail", QUEUED)]
+
+    client.post(f"/delete/{upload_id}")
+    assert ("thumbnail", QUEUED) not in job_rows(app)
+
+    # Same bytes, and SQLite gives the new row the same id
+    post_image(client)
+    with app.app_context():
+        assert db.session.query(db.func.max(Upload.id)).scalar() == upload_id
+    assert ("thumbnail", QUEUED) in job_rows(app)
+
+
+def test_delete_reused_user_id(app, client, login, queued):
+    login("alice")
+    with app.app_context():
+        user_id = User.query.filter_by(username="alice").one().id
+    client.post(f"/delete_user/{user_id}")
+    queued()
+    assert job_rows(app, type="delete_user") == [("delete_user", DONE)]
+
+    login("bob")
+    with app.app_context():
+        assert User.query.filter_by(username="bob").one().id == user_id
+    client.post(f"/delete_user/{user_id}")
+
+    assert job_rows(app, type="delete_user", status=QUEUED) == [("delete_user", QUEUED)]
@@ -0,0 +1,96 @@
+import os
+import time
+
+import pytest
+from flask import Flask
+from itsdangerous.timed import TimestampSigner
+
+import views.social
+from extensions import leaderboards, score_throttle
+from leaderboard import Leaderboards
+from models import GameStat, GameToken, User, db
+
+
+@pytest.fixture
+def start(client, monkeypatch):
+    """Starts `game` as the logged-in user, a minute ago. Returns: its session token"""
+    def start(game):
+        started = int(time.time()) - 60
+        with monkeypatch.context() as m:
+            m.setattr(TimestampSigner, "get_timestamp", lambda self: started)
+            return client.post(f"/api/games/{game}/sessions").get_json()["token"]
+    yield start
+    # Limits are per process, and every test app numbers its users from 1
+    for user_id in ("1", "2"):
+        score_throttle.reset(user_id)
+
+
+def submit(client, game, token, **body):
+    return client.post(f"/api/games/{game}/scores", json={"token": token, **body})
+
+
+def test_score_counts_on_the_boards(client, login, start):
+    login("alice")
+    response = submit(client, "tic_tac_toe", start("tic_tac_toe"), score=0, result="win")
+
+    assert response.status_code == 200
+    assert response.get_json() == {"xp_awarded": 15, "xp": 15, "rank": 1, "game_rank": 1}
+    leaderboards.flush()
+    entries = client.get("/api/leaderboard/xp").get_json()["entries"]
+    assert [(e["username"], e["value"]) for e in entries] == [("alice", 15)]
+
+
+def test_token_scores_once(app, client, login, start, monkeypatch):
+    login("alice")
+    token = start("pool")
+    assert submit(client, "pool", token, score=0, result="win").status_code == 200
+    assert submit(client, "pool", token, score=0, result="win").status_code == 409
+
+    # Another worker only has the database to tell it the token was used
+    leaderboards.flush()
+    other = Leaderboards(User.__table__, GameStat.__table__, GameToken.__table__, app, db)
+    monkeypatch.setattr(views.social, "leaderboards", other)
+    assert submit(client, "pool", token, score=0, result="lose").status_code == 409
+
+
+@pytest.mark.parametrize("body, status", [
+    ({"score": 0, "result": "tie"}, 400),
+    ({"score": "0", "result": "win"}, 400),
+    ({"score": 2500, "result": "win", "moves": "30"}, 400),
+    ({"score": 2500, "result": "lose", "moves": 30}, 422),
+])
+def test_implausible_scores(client, login, start, body, status):
+    login("alice")
+    assert submit(client, "candy", start("candy"), **body).status_code == status
+
+
+def test_moves_ignored_where_not_counted(client, login, start):
+    login("alice")
+    assert submit(client, "pool", start("pool"), score=0, result="win", moves="x").status_code == 200
+
+
+@pytest.mark.parametrize("body", [None, ["token"], {"token": 5}, {"token": "forged"}])
+def test_bad_token(client, login, body):
+    login("alice")
+    assert client.post("/api/games/pool/scores", json=body).status_code == 400
+
+
+def test_someone_elses_token(client, login, start):
+    login("alice")
+    token = start("pool")
+    client.get("/logout")
+    login("bob")
+    assert submit(client, "pool", token, score=0, result="win").status_code == 400
+
+
+def test_unknown_game_and_board(client, login):
+    login("alice")
+    assert client.post("/api/games/chess/sessions").status_code == 404
+    assert client.get("/api/leaderboard/chess").status_code == 404
+
+
+def test_snapshot_in_the_instance_folder(monkeypatch):
+    monkeypatch.delenv("LEADERBOARD_SNAPSHOT_PATH", raising=False)
+    app = Flask(__name__)
+    Leaderboards(User.__table__, GameStat.__table__, GameToken.__table__, app, db)
+    assert app.config["LEADERBOARD_SNAPSHOT_PATH"] == os.path.join(app.instance_path, "leaderboards.json.gz")
@@ -0,0 +1,67 @@
+import asyncio
+
+from extensions import live
+
+
+def test_polling_sends_the_current_counts(client, login, upload):
+    login("alice")
+    upload_id = upload()
+    client.post(f"/view/{upload_id}")
+
+    response = client.get(f"/api/live?ids={upload_id},999")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.data == b'retry: 10000\ndata: {"%d":{"views":1,"likes":0}}\n\n' % upload_id
+
+
+def test_bad_ids(app, client):
+    app.config["LIVE_MAX_IDS"] = 3
+
+    assert client.get("/api/live").get_json() == {"error": "ids is required"}
+    assert client.get("/api/live?ids=1,x").status_code == 400
+    response = client.get("/api/live?ids=1,2,3,4")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "at most 3 ids"}
+
+
+def test_stream_sends_changes(app, asgi, client, login, upload):
+    login("alice")
+    upload_id = upload()
+    app.config["LIVE_INTERVAL"] = 0.05
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        requests = iter([{"type": "http.request", "body": b"", "more_body": False}])
+
+        async def receive():
+            message = next(requests, None)
+            if message is not None:
+                return message
+            # Counted by another request while this one streams
+            await asyncio.sleep(0.2)
+            await loop.run_in_executor(None, client.post, f"/view/{upload_id}")
+            await asyncio.sleep(0.3)
+            return {"type": "http.disconnect"}
+
+        try:
+            return await asgi.call("GET", "/api/live", query=f"ids={upload_id}".encode(), receive=receive)
+        finally:
+            live.close()
+
+    status, headers, body = asyncio.run(stream())
+
+    assert status == 200
+    assert headers[b"content-type"] == b"text/event-stream"
+    assert body == [
+        live.message({upload_id: {"views": 0, "likes": 0}}),
+        live.message({upload_id: {"views": 1, "likes": 0}}),
+        b"",
+    ]
+
+
+def test_stream_refuses_bad_ids(asgi):
+    status, _, body = asgi.request("GET", "/api/live", query=b"ids=")
+
+    assert status == 400
+    assert b"".join(body) == b"ids is required"
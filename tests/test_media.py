@@ -0,0 +1,79 @@
+import pytest
+
+from models import Upload, UploadView, VideoLike, db
+
+
+def test_delete_liked_and_viewed_upload(app, client, login, upload):
+    login("alice")
+    upload_id = upload()
+    client.post(f"/view/{upload_id}")
+    assert client.post(f"/like/{upload_id}").status_code == 200
+    with app.app_context():
+        assert VideoLike.query.filter_by(video_id=upload_id).count() == 1
+        assert UploadView.query.filter_by(upload_id=upload_id).count() == 1
+
+    response = client.post(f"/delete/{upload_id}")
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Upload, upload_id) is None
+        assert VideoLike.query.filter_by(video_id=upload_id).count() == 0
+        assert UploadView.query.filter_by(upload_id=upload_id).count() == 0
+
+
+def test_delete_someone_elses_upload(app, client, login, upload):
+    login("alice")
+    upload_id = upload()
+    login("bob")
+
+    client.post(f"/delete/{upload_id}")
+
+    with app.app_context():
+        assert db.session.get(Upload, upload_id) is not None
+
+
+def stored_name(app, upload_id):
+    with app.app_context():
+        return db.session.get(Upload, upload_id).filename
+
+
+def test_media_is_served_cacheable(app, client, login, upload):
+    login("alice")
+    filename = stored_name(app, upload())
+
+    response = client.get(f"/media/{filename}")
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.headers["Cache-Control"] == f"public, max-age={app.config['MEDIA_MAX_AGE']}, immutable"
+    etag = response.headers["ETag"]
+    assert client.get(f"/media/{filename}", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_media_range(app, client, login, upload):
+    login("alice")
+    filename = stored_name(app, upload())
+    whole = client.get(f"/media/{filename}").data
+
+    response = client.get(f"/media/{filename}", headers={"Range": "bytes=0-9"})
+
+    assert response.status_code == 206
+    assert response.data == whole[:10]
+    assert response.headers["Content-Range"] == f"bytes 0-9/{len(whole)}"
+
+
+def test_media_offloaded_to_nginx(app, client, login, upload):
+    login("alice")
+    filename = stored_name(app, upload())
+    app.config["MEDIA_OFFLOAD"] = "x-accel"
+
+    response = client.get(f"/media/{filename}")
+
+    assert response.data == b""
+    assert response.headers["X-Accel-Redirect"].startswith(app.config["MEDIA_ACCEL_PREFIX"])
+    assert response.headers["X-Accel-Redirect"].endswith(filename)
+
+
+@pytest.mark.parametrize("path", ["missing.png", ".incoming/upload.part", "a/../.hidden"])
+def test_media_not_found(client, path):
+    assert client.get(f"/media/{path}").status_code == 404
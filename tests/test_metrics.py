@@ -0,0 +1,48 @@
+import json
+import os
+import re
+
+from extensions import metrics
+
+
+def series(text, name, endpoint):
+    """Value of the `name` line for `endpoint` in an exposition, or None."""
+    match = re.search(rf'^{name}{{endpoint="{endpoint}",method="GET"(?:,le="\+Inf")?}} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_requests_are_measured(client):
+    before = series(client.get("/metrics").get_data(as_text=True), "http_request_duration_seconds_count", "social.users")
+
+    client.get("/users")
+    text = client.get("/metrics").get_data(as_text=True)
+
+    assert series(text, "http_request_duration_seconds_count", "social.users") == (before or 0) + 1
+    assert series(text, "db_queries_per_request_bucket", "social.users") >= 1
+    assert "# TYPE process_peak_rss_bytes gauge" in text
+
+
+def test_workers_are_summed(app, client):
+    client.get("/users")
+    own = metrics.collect()
+    key = ("http_request_duration_seconds", (("endpoint", "social.users"), ("method", "GET")))
+    other = [[key[0], [list(pair) for pair in key[1]], [0] * (len(own[key]) - 2) + [3, 1.5]]]
+    with open(os.path.join(app.config["METRICS_DIR"], "1.json"), "w") as fh:
+        json.dump(other, fh)
+
+    merged = metrics.collect()
+
+    assert merged[key][-2] == own[key][-2] + 3
+    assert merged[key][-1] == own[key][-1] + 1.5
+
+
+def test_server_timing(app, client):
+    assert "Server-Timing" not in client.get("/users").headers
+    app.config["METRICS_SERVER_TIMING"] = True
+    assert re.match(r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=', client.get("/users").headers["Server-Timing"])
+
+
+def test_metrics_token(app, client):
+    app.config["METRICS_TOKEN"] = "s3cret"
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
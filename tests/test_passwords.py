@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import PASSWORD
+from extensions import login_identifier_throttle
+from models import User
+from passwords import HashingBusy, PasswordHasher, hash_rounds
+
+
+def test_timed_out_hash_keeps_its_slot(app, monkeypatch):
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0, PASSWORD_HASH_TIMEOUT=0.05)
+    hasher = PasswordHasher(app)
+    hasher._slots = threading.BoundedSemaphore(1)
+    # A spare thread: only the slot can turn the second request away
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(hasher, "_pool", lambda: pool)
+    done = threading.Event()
+    try:
+        with pytest.raises(HashingBusy):
+            hasher._run(done.wait)
+        # Still hashing: a second request must not be let in behind it
+        with pytest.raises(HashingBusy):
+            hasher._run(lambda: "ok")
+    finally:
+        done.set()
+        pool.shutdown(wait=True)
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    assert hasher._run(lambda: "ok") == "ok"
+    pool.shutdown()
+
+
+@pytest.fixture
+def throttled():
+    yield
+    login_identifier_throttle.reset("alice")
+
+
+def test_login_throttled_per_account(client, login, throttled):
+    login("alice")
+    login("bob")
+    client.get("/logout")
+    for _ in range(login_identifier_throttle.limit):
+        response = client.post("/login", data={"identifier": "alice", "password": "wrong"})
+        assert response.status_code == 302
+
+    response = client.post("/login", data={"identifier": "ALICE", "password": PASSWORD})
+    assert response.status_code == 429
+    response = client.post("/login", data={"identifier": "bob", "password": PASSWORD})
+    assert response.headers["Location"].endswith("/dashboard")
+
+
+def test_login_by_email_ignores_case(client, login):
+    login("alice")
+    client.get("/logout")
+
+    response = client.post("/login", data={"identifier": "Alice@Example.COM", "password": PASSWORD})
+    assert response.headers["Location"].endswith("/dashboard")
+    response = client.post("/login", data={"identifier": "nobody@example.com", "password": PASSWORD})
+    assert response.headers["Location"].endswith("/login")
+
+
+def test_login_upgrades_the_work_factor(app, client, login):
+    login("alice")
+    app.config["PASSWORD_HASH_ROUNDS"] = 5
+
+    login("alice")
+
+    with app.app_context():
+        assert hash_rounds(User.query.filter_by(username="alice").one().password) == 5
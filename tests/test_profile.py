@@ -0,0 +1,40 @@
+from models import Upload, User
+
+
+def user_id(app, username):
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        return user.id if user else None
+
+
+def test_delete_account_requires_login(app, client, login):
+    login("alice")
+    alice = user_id(app, "alice")
+    client.get("/logout")
+
+    response = client.post(f"/delete_user/{alice}")
+
+    assert response.status_code == 302
+    assert user_id(app, "alice") == alice
+
+
+def test_cannot_delete_someone_elses_account(app, client, login):
+    login("alice")
+    alice = user_id(app, "alice")
+    login("bob")
+
+    assert client.post(f"/delete_user/{alice}").status_code == 403
+    assert user_id(app, "alice") == alice
+
+
+def test_delete_own_account(app, client, login, upload):
+    login("alice")
+    upload()
+    alice = user_id(app, "alice")
+
+    response = client.post(f"/delete_user/{alice}")
+
+    assert response.status_code == 302
+    assert user_id(app, "alice") is None
+    with app.app_context():
+        assert Upload.query.count() == 0
@@ -0,0 +1,54 @@
+import pytest
+from flask import g
+
+from models import User, db
+from views import QueryBudgetExceeded, query_budget
+
+
+def add_view(app, rule, queries, budget=None):
+    """A view running `queries` statements, under `budget` if given."""
+    def view():
+        for _ in range(queries):
+            db.session.execute(db.select(User.id)).all()
+        return "ok"
+    view.__name__ = f"view_{rule.strip('/')}"
+    app.add_url_rule(rule, view_func=query_budget(budget)(view) if budget is not None else view)
+
+
+def test_budgeted_routes_pass(client, login, upload):
+    login("alice")
+    upload()
+    for path in ("/", "/gallery", "/api/uploads", "/users"):
+        with client:
+            assert client.get(path).status_code == 200, path
+            assert g.get("query_count", 0) <= 2, path
+
+
+def test_each_statement_counts_once(app, client):
+    # Every app built in the process shares the listeners; another one must not count twice
+    add_view(app, "/two", queries=2, budget=2)
+    with client:
+        assert client.get("/two").status_code == 200
+        assert g.query_count == 2
+
+
+def test_over_budget_raises(app, client):
+    add_view(app, "/three", queries=3, budget=2)
+    with pytest.raises(QueryBudgetExceeded, match=r"ran 3 queries \(budget 2\)"):
+        client.get("/three")
+
+
+def test_default_budget(app, client):
+    app.config["QUERY_BUDGET_DEFAULT"] = 1
+    add_view(app, "/one", queries=1)
+    add_view(app, "/two", queries=2)
+    assert client.get("/one").status_code == 200
+    with pytest.raises(QueryBudgetExceeded):
+        client.get("/two")
+
+
+def test_not_enforced_outside_tests(app, client):
+    app.testing = False
+    app.config["QUERY_BUDGET_ENFORCE"] = False
+    add_view(app, "/three", queries=3, budget=1)
+    assert client.get("/three").status_code == 200
@@ -0,0 +1,131 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from extensions import ranking
+from models import UploadActivity, db
+from ranking import RankingEngine, TopK, current_hour
+
+
+@pytest.fixture
+def worker(app, monkeypatch):
+    """A RankingEngine as one more worker would hold it, flushed by hand instead of by its thread."""
+    def worker():
+        engine = RankingEngine(UploadActivity.__table__, app=app, db=db)
+        monkeypatch.setattr(engine, "start", lambda: None)
+        return engine
+    return worker
+
+
+@pytest.fixture
+def uploads(login, upload):
+    login("alice")
+    return [upload(f"{i}.png", (i * 40, 0, 0)) for i in range(3)]
+
+
+def test_top_k_keeps_the_best_sorted():
+    top = TopK(2)
+    for item_id, score in ((1, 5), (2, 1), (3, 3)):
+        top.add(item_id, score)
+    assert top.page(0, 10) == [(1, 5), (3, 3)]
+    top.add(1, -5)
+    top.discard(3)
+    assert top.page(0, 10) == [(2, 1)]
+
+
+def test_top_k_matches_a_full_sort_through_decrements():
+    rng = random.Random(7)
+    top = TopK(5)
+    for _ in range(2000):
+        item_id = rng.randrange(40)
+        if rng.random() < 0.05:
+            top.discard(item_id)
+        else:
+            top.add(item_id, rng.choice((-3, -1, 1, 2, 5)))
+        best = sorted(((-s, i) for i, s in top.scores.items()))[:5]
+        assert top.page(0, 5) == [(i, -neg) for neg, i in best]
+
+
+def test_workers_merge_each_others_points(worker, uploads):
+    first, second = worker(), worker()
+    first.load()
+    second.load()
+    first.record(uploads[0], "views", 5)
+    second.record(uploads[1], "likes")
+
+    first.flush()
+    second.flush()
+    first.flush()
+
+    for engine in (first, second):
+        assert engine.page("top_day") == ([(uploads[0], 5.0), (uploads[1], 3.0)], False)
+
+
+def test_flush_reads_only_changed_rows(app, worker, uploads):
+    engine = worker()
+    engine.record(uploads[0], "views", 2)
+    engine.flush()
+    engine.load()
+    # Changed behind the engine's back, but not marked as changed
+    with app.app_context():
+        db.session.execute(db.update(UploadActivity).values(
+            points=50, updated_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+
+    engine.flush()
+
+    assert engine.page("top_day")[0] == [(uploads[0], 2.0)]
+
+
+def test_page_never_loads_in_the_request(app, monkeypatch, uploads):
+    engine = RankingEngine(UploadActivity.__table__, app=app, db=db)
+    started, statements = [], []
+    monkeypatch.setattr(engine, "start", lambda: started.append(True))
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    assert engine.page("trending") == ([], False)
+    assert started and statements == []
+
+
+def test_windows(app, worker, uploads):
+    with app.app_context():
+        db.session.add(UploadActivity(upload_id=uploads[0], hour=current_hour() - 30, points=4,
+                                      updated_at=datetime.utcnow()))
+        db.session.commit()
+    engine = worker()
+    engine.load()
+
+    assert engine.page("top_day")[0] == []
+    assert engine.page("top_week")[0] == [(uploads[0], 4.0)]
+    assert engine.page("trending")[0][0][0] == uploads[0]
+
+
+def test_upload_deleted_by_another_worker(worker, uploads):
+    first, second = worker(), worker()
+    first.record(uploads[0], "views", 3)
+    first.record(uploads[1], "views", 1)
+    first.flush()
+    first.load()
+
+    second.discard(uploads[0])
+    # The hourly pass
+    first._scored_hour = None
+    first.flush()
+
+    assert first.page("top_day")[0] == [(uploads[1], 1.0)]
+
+
+def test_unknown_ranking(client):
+    with pytest.raises(ValueError):
+        ranking.page("hot")
+    assert client.get("/api/uploads?sort=hot").status_code == 400
+
+
+def test_trending_feed(app, client, uploads):
+    client.post(f"/like/{uploads[2]}")
+    response = client.get("/api/uploads?sort=trending")
+    assert response.status_code == 200
+    assert [item["id"] for item in response.get_json()["uploads"]][:1] == [uploads[2]]
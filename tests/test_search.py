@@ -0,0 +1,53 @@
+import pytest
+from flask import Flask
+
+from models import Upload, User, db
+from search import Search, is_search_object
+
+
+def test_autocomplete(client, login):
+    for name in ("alice", "alfred", "bob"):
+        login(name)
+
+    users = client.get("/api/search/autocomplete?q=AL").get_json()["users"]
+
+    assert [u["username"] for u in users] == ["alfred", "alice"]
+    assert client.get("/api/search/autocomplete?q=").get_json() == {"users": []}
+
+
+def test_search_users_and_uploads(client, login, upload):
+    login("alice")
+    upload_id = upload("sunset beach.png")
+    login("sunny")
+
+    results = client.get("/api/search?q=sun").get_json()
+
+    assert [u["username"] for u in results["users"]] == ["sunny"]
+    assert [u["id"] for u in results["uploads"]] == [upload_id]
+    assert client.get("/api/search?q=sun&type=users").get_json().get("uploads") is None
+
+
+def test_search_unknown_type(client):
+    response = client.get("/api/search?q=sun&type=groups")
+    assert response.status_code == 400
+
+
+def test_limits_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SEARCH_AUTOCOMPLETE_LIMIT", "5")
+    monkeypatch.setenv("SEARCH_RESULT_LIMIT", "50")
+    app = Flask(__name__)
+    Search(User.__table__, Upload.__table__, app, db)
+    assert app.config["SEARCH_AUTOCOMPLETE_LIMIT"] == 5
+    assert app.config["SEARCH_RESULT_LIMIT"] == 50
+
+
+@pytest.mark.parametrize("name, type_, expected", [
+    ("user_search", "table", True),
+    ("upload_search_docsize", "table", True),
+    ("ix_upload_search", "index", True),
+    ("upload", "table", False),
+    ("user_search_history", "table", False),
+    ("ix_upload_search", "table", False),
+])
+def test_search_objects_left_to_search(name, type_, expected):
+    assert is_search_object(name, type_) is expected
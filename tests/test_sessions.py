@@ -0,0 +1,107 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from extensions import sessions
+from models import WebSession, db
+from sessions import SESSION_ID, ServerSessions
+
+
+def session_statements(app):
+    """Statements on the session table run from now on."""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, statement, *args):
+        if "web_session" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    return statements
+
+
+def test_cookie_holds_only_an_id(app, client, login):
+    login("alice")
+
+    sid = client.get_cookie("session").value
+    assert SESSION_ID.fullmatch(sid)
+    with app.app_context():
+        stored = db.session.get(WebSession, sid)
+        assert json.loads(stored.data)["username"] == "alice"
+
+
+def test_unchanged_session_is_not_written(app, client, login):
+    login("alice")
+    statements = session_statements(app)
+
+    response = client.get("/users")
+
+    assert response.status_code == 200
+    assert [s.split()[0] for s in statements] == ["SELECT"]
+    assert "Set-Cookie" not in response.headers
+
+
+def test_expiry_pushed_back_when_half_gone(app, client, login):
+    login("alice")
+    sid = client.get_cookie("session").value
+    soon = datetime.utcnow() + timedelta(seconds=60)
+    with app.app_context():
+        db.session.get(WebSession, sid).expires_at = soon
+        db.session.commit()
+
+    client.get("/users")
+
+    with app.app_context():
+        assert db.session.get(WebSession, sid).expires_at > soon + timedelta(days=1)
+
+
+def test_login_gets_a_new_id(app, client, login):
+    login("alice")
+    before = client.get_cookie("session").value
+    login("alice")
+    after = client.get_cookie("session").value
+
+    assert after != before
+    with app.app_context():
+        assert db.session.get(WebSession, before) is None
+
+
+@pytest.mark.parametrize("sid", ["not a session id", "A" * 22])
+def test_unknown_or_forged_id(client, sid):
+    client.set_cookie("session", sid)
+    assert client.get("/dashboard").status_code == 302  # to the login page
+
+
+def test_expired_session(app, client, login):
+    login("alice")
+    sid = client.get_cookie("session").value
+    with app.app_context():
+        db.session.get(WebSession, sid).expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    assert client.get("/dashboard").status_code == 302
+    assert sessions.sweep() == 1
+    with app.app_context():
+        assert db.session.get(WebSession, sid) is None
+
+
+def test_static_files_skip_the_session(app, client, login):
+    login("alice")
+    statements = session_statements(app)
+
+    response = client.get("/static/css/dashboard.css")
+
+    assert response.status_code == 200
+    assert statements == []
+    assert "Cookie" not in response.vary
+
+
+def test_unknown_backend():
+    app = Flask(__name__)
+    app.config["SESSION_BACKEND"] = "redis"
+    with pytest.raises(ValueError, match="SESSION_BACKEND"):
+        ServerSessions(WebSession.__table__, app, db)
@@ -0,0 +1,130 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from extensions import storage
+from models import MediaBlob, Upload, db
+from storage import IMMUTABLE, MediaStore, S3Storage, content_key, shard_path
+
+DIGEST = "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+
+
+def test_names():
+    assert content_key(DIGEST, "Holiday.JPG") == f"{DIGEST}.jpg"
+    assert content_key(DIGEST, "README") == f"{DIGEST}.bin"
+    assert shard_path(f"{DIGEST}.thumb.jpg") == f"9f/86/{DIGEST}.thumb.jpg"
+    assert shard_path("0123abcd_legacy.png") == "0123abcd_legacy.png"
+
+
+def post_image(client, name):
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), (10, 20, 30)).save(buf, "PNG")
+    buf.seek(0)
+    client.post("/upload", data={"file": (buf, name)}, content_type="multipart/form-data")
+
+
+def test_same_content_stored_once(app, client, login):
+    login("alice")
+    post_image(client, "a.png")
+    login("bob")
+    post_image(client, "b.png")
+    with app.app_context():
+        first, second = Upload.query.order_by(Upload.id).all()
+        filename = first.filename
+        assert second.filename == filename
+        assert db.session.get(MediaBlob, filename).refs == 2
+    path = storage.backend.path(filename)
+    assert os.path.exists(path)
+
+    client.post(f"/delete/{second.id}")
+    assert os.path.exists(path)
+    login("alice")
+    client.post(f"/delete/{first.id}")
+
+    assert not os.path.exists(path)
+    assert not os.path.exists(storage.backend.path(f"{filename.rsplit('.', 1)[0]}.thumb.jpg"))
+
+
+def test_purge_keeps_files_in_use(app, tmp_path):
+    src = tmp_path / "incoming"
+    src.write_bytes(b"data")
+    with app.app_context():
+        name = storage.put(str(src), f"{DIGEST}.bin")
+        assert not storage.purge(name)
+        assert storage.release(name) == 0
+        assert storage.purge(name)
+    assert not storage.exists(name)
+
+
+def test_unknown_backend():
+    with pytest.raises(RuntimeError, match="MEDIA_STORAGE"):
+        MediaStore.make_backend({"MEDIA_STORAGE": "ftp"})
+
+
+class FakeS3:
+    """The few S3 client calls S3Storage makes, over a dict."""
+
+    class exceptions:
+        class ClientError(Exception):
+            def __init__(self, code):
+                self.response = {"Error": {"Code": code}}
+
+    def __init__(self):
+        self.objects = {}  # key -> (bytes, extra args)
+
+    def upload_file(self, path, bucket, key, ExtraArgs):
+        with open(path, "rb") as fh:
+            self.objects[key] = (fh.read(), ExtraArgs)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.ClientError("404")
+
+    def download_file(self, bucket, key, path):
+        with open(path, "wb") as fh:
+            fh.write(self.objects[key][0])
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def get_paginator(self, name):
+        fake = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                return [{"Contents": [{"Key": k} for k in fake.objects if k.startswith(Prefix)]}]
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"])
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def test_s3_backend(tmp_path):
+    client = FakeS3()
+    s3 = S3Storage("media", prefix="/prod/", client=client)
+    src = tmp_path / "clip.mp4"
+    src.write_bytes(b"video")
+    name = f"{DIGEST}.mp4"
+
+    s3.save(str(src), name)
+    with s3.workspace(name) as folder:
+        os.makedirs(os.path.join(folder, f"{DIGEST}.hls"))
+        with open(os.path.join(folder, f"{DIGEST}.hls", "master.m3u8"), "w") as fh:
+            fh.write("#EXTM3U\n")
+
+    key = f"prod/9f/86/{name}"
+    assert client.objects[key] == (b"video", {"ContentType": "video/mp4", "CacheControl": IMMUTABLE})
+    assert f"prod/9f/86/{DIGEST}.hls/master.m3u8" in client.objects
+    assert not src.exists()
+    assert s3.url(name) == f"https://s3.example.com/media/{key}?expires=3600"
+
+    s3.delete(f"{DIGEST}.hls")
+    s3.delete(name)
+    assert client.objects == {}
+    assert not s3.exists(name)
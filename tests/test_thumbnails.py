@@ -0,0 +1,40 @@
+import io
+
+from PIL import Image
+
+from models import Upload, db
+from thumbnails import process_media
+
+
+def test_upload_gets_thumbnails(app, client, login, upload):
+    login("alice")
+    upload_id = upload()
+
+    with app.app_context():
+        row = db.session.get(Upload, upload_id)
+        thumbnail, stem = row.thumbnail, row.filename.rsplit(".", 1)[0]
+    assert thumbnail == f"{stem}.thumb.jpg"
+    for name, fmt in ((thumbnail, "JPEG"), (f"{stem}.thumb.webp", "WEBP")):
+        response = client.get(f"/media/{name}")
+        assert response.status_code == 200
+        assert Image.open(io.BytesIO(response.data)).format == fmt
+
+
+def test_large_image_is_scaled_down(tmp_path):
+    Image.new("RGB", (2000, 1000), (0, 0, 0)).save(tmp_path / "big.png")
+
+    result = process_media(str(tmp_path), "big.png", "image")
+
+    assert result == {"thumbnail": "big.thumb.jpg", "poster": None}
+    assert Image.open(tmp_path / "big.thumb.jpg").size == (480, 240)
+
+
+def test_unreadable_media(tmp_path):
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    (tmp_path / "clip.mp4").write_bytes(b"not a video")
+
+    assert process_media(str(tmp_path), "broken.png", "image") == {"thumbnail": None, "poster": None}
+    # No ffmpeg at that name: no poster, and the player shows the video itself
+    assert process_media(str(tmp_path), "clip.mp4", "video", ffmpeg="no-such-ffmpeg") == {
+        "thumbnail": None, "poster": None,
+    }
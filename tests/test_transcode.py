@@ -0,0 +1,93 @@
+import io
+import os
+import stat
+import sys
+
+import pytest
+
+from models import Upload
+from transcode import TranscodeError, build_hls, parse_ladder, plan_renditions
+
+FAKE_FFMPEG = """#!{python}
+# Stands in for ffmpeg: reports a 1280x720 video with audio, grabs a black
+# frame and writes one segment per rendition
+import sys
+
+args = sys.argv[1:]
+if args[:1] == ["-hide_banner"]:
+    sys.stderr.write("  Stream #0:0(und): Video: h264 (High), yuv420p, 1280x720, 2000 kb/s\\n")
+    sys.stderr.write("  Stream #0:1(und): Audio: aac (LC), 48000 Hz, stereo\\n")
+    sys.exit(1)
+if "-frames:v" in args:
+    from PIL import Image
+    Image.new("RGB", (64, 36)).save(args[-1], "JPEG")
+    sys.exit(0)
+if {fail}:
+    sys.stderr.write("Invalid data found when processing input")
+    sys.exit(1)
+for i, arg in enumerate(args):
+    if arg == "-hls_segment_filename":
+        open(args[i + 1] % 0, "wb").write(b"ts")
+        open(args[i + 2], "w").write("#EXTM3U\\n")
+"""
+
+
+@pytest.fixture
+def ffmpeg(tmp_path):
+    """Path of a fake ffmpeg; `ffmpeg(fail=True)` one that can't encode."""
+    def ffmpeg(fail=False):
+        path = tmp_path / ("ffmpeg-broken" if fail else "ffmpeg")
+        path.write_text(FAKE_FFMPEG.format(python=sys.executable, fail=fail))
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+        return str(path)
+    return ffmpeg
+
+
+def test_ladder():
+    ladder = parse_ladder("720:2800:128, 360:800:96")
+    assert ladder == [(360, 800, 96), (720, 2800, 128)]
+
+    assert [(r["width"], r["height"]) for r in plan_renditions(1920, 1080, ladder)] == [(640, 360), (1280, 720)]
+    # Smaller than every rung: just the source size
+    assert [(r["width"], r["height"]) for r in plan_renditions(320, 241, ladder)] == [(318, 240)]
+    with pytest.raises(ValueError):
+        parse_ladder("720:2800")
+
+
+def test_build_hls(tmp_path, ffmpeg):
+    (tmp_path / "clip.mp4").write_bytes(b"video")
+
+    playlist = build_hls(str(tmp_path), "clip.mp4", parse_ladder("360:800:96,720:2800:128"), ffmpeg=ffmpeg())
+
+    assert playlist == "clip.hls/master.m3u8"
+    master = (tmp_path / playlist).read_text().splitlines()
+    assert master[2] == '#EXT-X-STREAM-INF:BANDWIDTH=952000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"'
+    assert master[3::2] == ["360p/index.m3u8", "720p/index.m3u8"]
+    assert (tmp_path / "clip.hls/720p/seg_00000.ts").exists()
+    assert sorted(os.listdir(tmp_path)) == ["clip.hls", "clip.mp4", "ffmpeg"]
+
+
+def test_build_hls_fails_cleanly(tmp_path, ffmpeg):
+    (tmp_path / "clip.mp4").write_bytes(b"video")
+    ladder = parse_ladder("360:800:96")
+
+    with pytest.raises(TranscodeError, match="Invalid data"):
+        build_hls(str(tmp_path), "clip.mp4", ladder, ffmpeg=ffmpeg(fail=True))
+    with pytest.raises(TranscodeError, match="not found"):
+        build_hls(str(tmp_path), "clip.mp4", ladder, ffmpeg=str(tmp_path / "missing"))
+    assert sorted(os.listdir(tmp_path)) == ["clip.mp4", "ffmpeg-broken"]
+
+
+@pytest.mark.parametrize("fail, status", [(False, "ready"), (True, "failed")])
+def test_video_upload(app, client, login, ffmpeg, fail, status):
+    app.config["FFMPEG_BINARY"] = ffmpeg(fail)
+    login("alice")
+
+    client.post("/upload", data={"file": (io.BytesIO(b"video"), "clip.mp4")}, content_type="multipart/form-data")
+
+    with app.app_context():
+        upload = Upload.query.one()
+        assert (upload.transcode_status, upload.poster is not None) == (status, True)
+        playlist = upload.hls_playlist
+    if not fail:
+        assert client.get(f"/media/{playlist}").data.startswith(b"#EXTM3U")
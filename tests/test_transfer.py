@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from models import User, db
+
+TOKEN = "s3cret"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+
+
+@pytest.fixture
+def admin(app):
+    app.config["ADMIN_TOKEN"] = TOKEN
+
+
+def test_export_and_import_users(app, client, login, admin):
+    login("alice")
+    login("bob")
+    exported = client.get("/admin/export/users.ndjson", headers=AUTH).get_data(as_text=True)
+    assert [json.loads(line)["username"] for line in exported.splitlines()] == ["alice", "bob"]
+
+    with app.app_context():
+        User.query.filter_by(username="bob").delete()
+        db.session.commit()
+    response = client.post("/admin/import/users.ndjson", data=exported, headers=AUTH)
+
+    assert response.get_json() == {"inserted": 1, "skipped": 1}
+    with app.app_context():
+        assert User.query.filter_by(username="bob").count() == 1
+    assert client.get("/api/search/autocomplete?q=bo").get_json()["users"][0]["username"] == "bob"
+
+
+def test_csv_round_trip(app, client, login, admin):
+    login("alice")
+    exported = client.get("/admin/export/users.csv", headers=AUTH).get_data(as_text=True)
+    assert exported.splitlines()[0].startswith("id,username,")
+
+    response = client.post("/admin/import/users.csv", data=exported, headers=AUTH)
+    assert response.get_json() == {"inserted": 0, "skipped": 1}
+    response = client.post("/admin/import/users.csv?on_conflict=error", data=exported, headers=AUTH)
+    assert response.status_code == 409
+
+
+def test_bad_import(client, admin):
+    response = client.post("/admin/import/users.ndjson", data='{"id": 1,\n', headers=AUTH)
+    assert response.status_code == 400
+    assert client.post("/admin/import/groups.ndjson", data="", headers=AUTH).status_code == 404
+    assert client.get("/admin/export/users.xml", headers=AUTH).status_code == 404
+
+
+def test_admin_token_required(app, client):
+    assert client.get("/admin/export/users.ndjson").status_code == 404
+    app.config["ADMIN_TOKEN"] = TOKEN
+    assert client.get("/admin/export/users.ndjson").status_code == 403
+    assert client.get("/admin/export/users.ndjson", headers={"Authorization": "Bearer nope"}).status_code == 403
@@ -0,0 +1,114 @@
+import logging
+import os
+import shutil
+import subprocess
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (480, 480)
+
+
+def derived_name(filename, suffix):
+    """`abc_clip.mp4` -> `abc_clip.poster.jpg` for suffix `poster.jpg`."""
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}.{suffix}"
+
+
+def derived_files(filename):
+    """Every file the pipeline may have written next to `filename`."""
+    return [derived_name(filename, s) for s in ("thumb.jpg", "thumb.webp", "poster.jpg")]
+
+
+def make_image_thumbnails(folder, filename, size=THUMBNAIL_SIZE, name_from=None):
+    """
+    Writes `<stem>.thumb.jpg` and `<stem>.thumb.webp` next to the original.
+    `name_from` names the outputs after another file (the video for a poster).
+    Returns: name of the JPEG thumbnail.
+    """
+    base = name_from or filename
+    jpeg_name = derived_name(base, "thumb.jpg")
+    with Image.open(os.path.join(folder, filename)) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(size)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(os.path.join(folder, jpeg_name), "JPEG", quality=80, optimize=True, progressive=True)
+        img.save(os.path.join(folder, derived_name(base, "thumb.webp")), "WEBP", quality=75, method=4)
+    return jpeg_name
+
+
+def make_video_poster(folder, filename, ffmpeg="ffmpeg", timeout=60):
+    """
+    Grabs a frame with ffmpeg as `<stem>.poster.jpg`.
+    Returns: the poster name, or None when ffmpeg is missing or fails.
+    """
+    if not shutil.which(ffmpeg):
+        logger.warning("ffmpeg not found, skipping poster for %s", filename)
+        return None
+
+    poster_name = derived_name(filename, "poster.jpg")
+    src = os.path.join(folder, filename)
+    dst = os.path.join(folder, poster_name)
+    # Try one second in first to skip black intro frames, then the very first frame
+    for offset in ("1", "0"):
+        cmd = [ffmpeg, "-v", "error", "-y", "-ss", offset, "-i", src, "-frames:v", "1", "-q:v", "3", dst]
+        try:
+            subprocess.run(cmd, check=True, timeout=timeout, capture_output=True)
+        except (subprocess.SubprocessError, OSError):
+            continue
+        if os.path.exists(dst) and os.path.getsize(dst) > 0:
+            return poster_name
+    logger.warning("ffmpeg could not extract a poster from %s", filename)
+    return None
+
+
+def process_media(folder, filename, filetype, ffmpeg="ffmpeg"):
+    """
+    Builds the derived files for one upload.
+    Returns: {"thumbnail": ..., "poster": ...} with None for anything that failed.
+    """
+    result = {"thumbnail": None, "poster": None}
+    try:
+        if filetype == "video":
+            result["poster"] = make_video_poster(folder, filename, ffmpeg)
+            if result["poster"]:
+                # Small card-sized version of the poster for the feeds
+                result["thumbnail"] = make_image_thumbnails(folder, result["poster"], name_from=filename)
+        else:
+            result["thumbnail"] = make_image_thumbnails(folder, filename)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", filename)
+    return result
+
+
+class ThumbnailWorker:
+    """
+    Runs `process_media` for one upload, in a workspace of the media store
+    (see storage.py), and stores the result on its row.
+    Called from the "thumbnail" job (at most `MEDIA_WORKERS` at once per job
+    worker) and from the `backfill-thumbnails` command.
+    """
+
+    def __init__(self, model, app=None, db=None):
+        self.model = model
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("MEDIA_WORKERS", int(os.environ.get("MEDIA_WORKERS", 2)))
+        app.config.setdefault("FFMPEG_BINARY", os.environ.get("FFMPEG_BINARY", "ffmpeg"))
+        app.extensions["thumbnails"] = self
+
+    def process(self, upload_id, filename, filetype):
+        with self.app.app_context():
+            # Derived files are stored when the workspace closes, before the row points at them
+            with self.app.extensions["media"].workspace(filename) as folder:
+                result = process_media(folder, filename, filetype, self.app.config["FFMPEG_BINARY"])
+            if result["thumbnail"] or result["poster"]:
+                self.model.query.filter_by(id=upload_id).update(result)
+                self.db.session.commit()
+        return result
@@ -0,0 +1,142 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+
+from thumbnails import derived_name
+
+logger = logging.getLogger(__name__)
+
+# height:video kbps:audio kbps, smallest first
+DEFAULT_LADDER = "360:800:96,720:2800:128"
+
+# H.264 Main profile at the level each height needs, as (max height, -level, CODECS tag)
+H264_LEVELS = ((480, "3.0", "avc1.4d401e"), (720, "3.1", "avc1.4d401f"), (1080, "4.0", "avc1.4d4028"))
+
+_VIDEO_STREAM = re.compile(r"Stream #\d+:\d+.*?: Video: .*?(\d{2,5})x(\d{2,5})")
+_ROTATION = re.compile(r"rotat\w* of (-?\d+(?:\.\d+)?) degrees|rotate\s*:\s*(-?\d+)")
+
+
+class TranscodeError(Exception):
+    """ffmpeg is missing or could not read/encode the file; retrying won't help."""
+
+
+def parse_ladder(spec):
+    """"360:800:96,720:2800:128" -> [(360, 800, 96), (720, 2800, 128)]"""
+    rungs = []
+    for rung in spec.split(","):
+        height, video_kbps, audio_kbps = (int(part) for part in rung.strip().split(":"))
+        rungs.append((height, video_kbps, audio_kbps))
+    return sorted(rungs)
+
+
+def hls_dir(filename):
+    """`abc_clip.mov` -> `abc_clip.hls`, the folder holding the playlists and segments."""
+    return derived_name(filename, "hls")
+
+
+def probe(src, ffmpeg="ffmpeg", timeout=60):
+    """
+    Reads the display size and whether there is audio from `ffmpeg -i`, so
+    no ffprobe binary is needed.
+    Returns: {"width": ..., "height": ..., "audio": bool}
+    """
+    if not shutil.which(ffmpeg):
+        raise TranscodeError(f"{ffmpeg} not found")
+    try:
+        # Without an output ffmpeg exits 1 after printing the stream info
+        out = subprocess.run([ffmpeg, "-hide_banner", "-i", src], capture_output=True, text=True, timeout=timeout).stderr
+    except (subprocess.SubprocessError, OSError) as e:
+        raise TranscodeError(f"could not probe {src}: {e}")
+    match = _VIDEO_STREAM.search(out)
+    if not match:
+        raise TranscodeError(f"no video stream in {src}")
+    width, height = int(match.group(1)), int(match.group(2))
+    rotation = _ROTATION.search(out)
+    if rotation and abs(round(float(rotation.group(1) or rotation.group(2)))) % 180 == 90:
+        # Phones store portrait video sideways; ffmpeg rotates it back when encoding
+        width, height = height, width
+    return {"width": width, "height": height, "audio": " Audio: " in out}
+
+
+def h264_level(height):
+    for max_height, level, codec in H264_LEVELS:
+        if height <= max_height:
+            return level, codec
+    return "4.1", "avc1.4d4029"
+
+
+def plan_renditions(width, height, ladder):
+    """The ladder rungs no taller than the source (or just the source size), with even widths."""
+    rungs = [rung for rung in ladder if rung[0] <= height]
+    if not rungs:
+        rungs = [(height - height % 2, ladder[0][1], ladder[0][2])]
+    return [
+        {"height": h, "width": max(2, round(width * h / height / 2) * 2), "video_kbps": v, "audio_kbps": a}
+        for h, v, a in rungs
+    ]
+
+
+def build_hls(folder, filename, ladder, ffmpeg="ffmpeg", segment_seconds=4, timeout=3600):
+    """
+    Encodes `filename` into one H.264/AAC HLS rendition per ladder rung in a
+    single ffmpeg run (the source is decoded once), plus a master playlist:
+
+        <stem>.hls/master.m3u8
+        <stem>.hls/360p/index.m3u8, 360p/seg_00000.ts, ...
+
+    Keyframes are forced every `segment_seconds` so every rendition cuts its
+    segments at the same times and players can switch between them. The
+    output is built in a hidden folder and renamed into place when complete.
+    Returns: path of the master playlist relative to `folder`.
+    """
+    src = os.path.join(folder, filename)
+    info = probe(src, ffmpeg)
+    renditions = plan_renditions(info["width"], info["height"], ladder)
+
+    final_dir = os.path.join(folder, hls_dir(filename))
+    work_dir = os.path.join(folder, f".{hls_dir(filename)}.{os.getpid()}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    cmd = [ffmpeg, "-v", "error", "-y", "-i", src]
+    for r in renditions:
+        out_dir = os.path.join(work_dir, f"{r['height']}p")
+        os.makedirs(out_dir)
+        level, _ = h264_level(r["height"])
+        cmd += [
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-vf", f"scale={r['width']}:{r['height']}",
+            "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-level:v", level,
+            "-pix_fmt", "yuv420p",
+            "-b:v", f"{r['video_kbps']}k",
+            "-maxrate", f"{int(r['video_kbps'] * 1.07)}k",
+            "-bufsize", f"{int(r['video_kbps'] * 1.5)}k",
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})", "-sc_threshold", "0",
+            "-c:a", "aac", "-b:a", f"{r['audio_kbps']}k", "-ac", "2",
+            "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "vod",
+            "-hls_segment_filename", os.path.join(out_dir, "seg_%05d.ts"),
+            os.path.join(out_dir, "index.m3u8"),
+        ]
+    try:
+        subprocess.run(cmd, check=True, timeout=timeout, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise TranscodeError(f"ffmpeg failed on {filename}: {e.stderr.decode(errors='replace')[-500:]}")
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for r in renditions:
+        _, codec = h264_level(r["height"])
+        codecs = f"{codec},mp4a.40.2" if info["audio"] else codec
+        bandwidth = int((r["video_kbps"] * 1.07 + (r["audio_kbps"] if info["audio"] else 0)) * 1000)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={r["width"]}x{r["height"]},CODECS="{codecs}"')
+        lines.append(f"{r['height']}p/index.m3u8")
+    with open(os.path.join(work_dir, "master.m3u8"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(work_dir, final_dir)
+    return f"{hls_dir(filename)}/master.m3u8"
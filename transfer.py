@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import DateTime, Float, Integer, func, insert, select
+
+from dedup import insert_ignore
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+
+
+class TransferError(ValueError):
+    pass
+
+
+def decode_lines(stream, encoding="utf-8"):
+    """
+    Text lines of a binary stream (an upload, a file opened "rb"), split at
+    "\n" only, so CSV fields keep their "\r\n" and no Unicode line
+    separator inside a JSON string ends its line.
+    """
+    for line in stream:
+        yield line.decode(encoding)
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _decoder(col, blank_is_null):
+    """Turns an exported value back into what `col` stores."""
+    kind = col.type
+    if isinstance(kind, DateTime):
+        convert = datetime.fromisoformat
+    elif isinstance(kind, Integer):
+        convert = int
+    elif isinstance(kind, Float):
+        convert = float
+    else:
+        convert = str
+
+    def decode(value):
+        if value is None or (blank_is_null and value == "" and col.nullable):
+            return None
+        return convert(value)
+    return decode
+
+
+class DataTransfer:
+    """
+    Streams whole tables out as NDJSON or CSV and loads them back, in
+    constant memory whatever their size.
+
+    `tables` maps the names used on the command line and in URLs to tables,
+    in the order they have to be imported (a row's foreign keys must exist
+    first).
+
+    Export reads through a server-side cursor (`yield_per`): the rows come in
+    `TRANSFER_BATCH_SIZE` at a time and each batch is encoded into one chunk.
+    Import parses the stream line by line and inserts a batch at a time, one
+    transaction each; rows whose key already exists are skipped (or, with
+    `on_conflict="error"`, fail the import). Primary keys are kept, so
+    PostgreSQL sequences are moved past the largest imported id afterwards.
+    In CSV an empty field is NULL in a nullable column.
+
+    Both run on `db.engine` connections of their own and, their statement
+    count growing with the data by design, outside the request's query
+    count (see metrics.py).
+    """
+
+    def __init__(self, tables, app=None, db=None):
+        self.tables = tables
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.config.setdefault("TRANSFER_BATCH_SIZE", 1000)
+        app.extensions["transfer"] = self
+
+    def _table(self, kind):
+        try:
+            return self.tables[kind]
+        except KeyError:
+            raise TransferError(f"Unknown table {kind!r}, expected one of {', '.join(self.tables)}") from None
+
+    # ---------- export ----------
+    def export(self, kind, fmt="ndjson"):
+        """Yields `kind` as text chunks, one per batch of rows (CSV: the header first)."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}")
+        table = self._table(kind)
+        names = [c.name for c in table.columns]
+        stmt = select(table).order_by(*table.primary_key.columns)
+        if fmt == "csv":
+            yield ",".join(names) + "\r\n"
+
+        with self.db.engine.connect() as conn:
+            conn = conn.execution_options(count_query=False, yield_per=self.app.config["TRANSFER_BATCH_SIZE"])
+            result = conn.execute(stmt)
+            for rows in result.partitions():
+                buf = io.StringIO()
+                if fmt == "csv":
+                    writer = csv.writer(buf)
+                    writer.writerows([_encode(v) for v in row] for row in rows)
+                else:
+                    for row in rows:
+                        buf.write(json.dumps({k: _encode(v) for k, v in zip(names, row)}, ensure_ascii=False))
+                        buf.write("\n")
+                yield buf.getvalue()
+
+    # ---------- import ----------
+    def _records(self, lines, fmt):
+        if fmt == "csv":
+            yield from csv.DictReader(lines)
+            return
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise TransferError(f"line {number}: {e}") from None
+
+    def load(self, kind, lines, fmt="ndjson", on_conflict="skip", prepare=None, on_batch=None):
+        """
+        Inserts the rows read from `lines` (any iterable of text lines, see
+        `decode_lines()`). `prepare(row)` may adjust each
+        decoded row before it is inserted; `on_batch(rows)` is called with the
+        rows of each batch that were actually inserted, after its commit.
+        Returns: {"inserted": n, "skipped": n}
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}")
+        table = self._table(kind)
+        decoders = {c.name: _decoder(c, blank_is_null=fmt == "csv") for c in table.columns}
+        batch_size = self.app.config["TRANSFER_BATCH_SIZE"]
+        totals = {"inserted": 0, "skipped": 0}
+
+        batch = []
+        for number, record in enumerate(self._records(lines, fmt), start=1):
+            try:
+                row = {name: decoders[name](value) for name, value in record.items() if name in decoders}
+            except (TypeError, ValueError) as e:
+                raise TransferError(f"{kind} row {number}: {e}") from None
+            batch.append(prepare(row) if prepare else row)
+            if len(batch) >= batch_size:
+                self._insert(table, batch, on_conflict, totals, on_batch)
+                batch = []
+        if batch:
+            self._insert(table, batch, on_conflict, totals, on_batch)
+        if totals["inserted"]:
+            self._advance_sequence(table)
+        logger.info("Imported %s: %d rows inserted, %d skipped", kind, totals["inserted"], totals["skipped"])
+        return totals
+
+    def _insert(self, table, rows, on_conflict, totals, on_batch):
+        engine = self.db.engine
+        stmt = insert(table) if on_conflict == "error" else insert_ignore(table, engine.dialect.name)
+        with engine.begin() as conn:
+            # insertmanyvalues: one round trip per batch, and only the rows that went in come back
+            conn = conn.execution_options(count_query=False)
+            inserted = conn.execute(stmt.returning(*table.columns), rows).mappings().all()
+        totals["inserted"] += len(inserted)
+        totals["skipped"] += len(rows) - len(inserted)
+        if on_batch and inserted:
+            on_batch(inserted)
+
+    def _advance_sequence(self, table):
+        pk = list(table.primary_key.columns)
+        if self.db.engine.dialect.name != "postgresql" or len(pk) != 1 or not pk[0].autoincrement:
+            return
+        if not isinstance(pk[0].type, Integer):
+            return
+        with self.db.engine.begin() as conn:
+            name = conn.dialect.identifier_preparer.format_table(table)
+            conn.execution_options(count_query=False).execute(select(func.setval(
+                func.pg_get_serial_sequence(name, pk[0].name),
+                select(func.coalesce(func.max(pk[0]), 0) + 1).scalar_subquery(),
+                False,
+            )))
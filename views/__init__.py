@@ -0,0 +1,48 @@
+"""
+The site's routes, one blueprint per area, registered by `create_app()`:
+
+    auth     login, registration, logout and passwords
+    media    uploads, media files and the jobs that process them
+    social   feeds, views and likes, users, search, games and leaderboards
+    profile  dashboard, profiles, avatars and accounts
+    admin    data export/import and account removal, behind ADMIN_TOKEN
+"""
+import os
+
+from flask import current_app, g, request
+
+
+# ------------------------ QUERY BUDGETS ------------------------
+# Every SQL statement run while handling a request is counted in g.query_count
+# (see metrics.py).
+# With QUERY_BUDGET_ENFORCE (on by default when TESTING) a request that runs
+# more statements than its route allows raises QueryBudgetExceeded, which
+# turns an N+1 regression into a failing test.
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """Caps the number of SQL statements a view may run (checked in tests)."""
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+
+def check_query_budget(response):
+    app = current_app
+    if not (app.config['QUERY_BUDGET_ENFORCE'] or app.testing):
+        return response
+    view = app.view_functions.get(request.endpoint)
+    limit = getattr(view, "query_budget", app.config['QUERY_BUDGET_DEFAULT'])
+    used = g.get("query_count", 0)
+    if used > limit:
+        raise QueryBudgetExceeded(f"{request.endpoint} ran {used} queries (budget {limit})")
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('QUERY_BUDGET_DEFAULT', int(os.environ.get('QUERY_BUDGET_DEFAULT', 10)))
+    app.config.setdefault('QUERY_BUDGET_ENFORCE', os.environ.get('QUERY_BUDGET_ENFORCE') == '1')
+    app.after_request(check_query_budget)
@@ -0,0 +1,148 @@
+import hmac
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+
+import click
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from sqlalchemy.exc import IntegrityError
+
+from extensions import analytics, cache, jobs, search, storage, transfer
+from models import User
+from storage import CONTENT_KEY
+from transfer import FORMATS, TransferError, decode_lines
+from views.profile import delete_user_key
+
+# Its CLI commands stay top-level: `flask export`, not `flask admin export`
+bp = Blueprint("admin", __name__, url_prefix="/admin", cli_group=None)
+
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@bp.record_once
+def configure(state):
+    # The admin endpoints are off (404) until a token is set
+    state.app.config.setdefault('ADMIN_TOKEN', os.environ.get('ADMIN_TOKEN'))
+
+
+def admin_required(f):
+    """Requires `Authorization: Bearer <ADMIN_TOKEN>`."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config['ADMIN_TOKEN']
+        if not token:
+            abort(404)
+        given = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# ------------------------ IMPORT ------------------------
+# Only rows are moved: the media files themselves are copied separately
+# (same UPLOAD_FOLDER or bucket, or `flask migrate-media`). Imported rows
+# count as references to their files, like uploaded ones.
+def retain_files(rows):
+    storage.retain_many(Counter(row["filename"] for row in rows))
+
+
+def retain_avatars(rows):
+    storage.retain_many(Counter(row["avatar"] for row in rows if row["avatar"] and CONTENT_KEY.match(row["avatar"])))
+
+
+def touch_stats(row):
+    # Stamped now, so every worker's leaderboards read them at their next flush
+    row["updated_at"] = datetime.utcnow()
+    return row
+
+
+AFTER_BATCH = {"users": retain_avatars, "uploads": retain_files}
+PREPARE = {"game_stats": touch_stats}
+
+
+def import_rows(kind, lines, fmt="ndjson", on_conflict="skip"):
+    """
+    Imports one table, then brings the search index, the dashboard stats
+    and the caches up to date. Batches are committed as they go: a failed import keeps the ones
+    before the failure, and running it again skips them.
+    """
+    totals = transfer.load(
+        kind, lines, fmt, on_conflict=on_conflict, prepare=PREPARE.get(kind), on_batch=AFTER_BATCH.get(kind),
+    )
+    if totals["inserted"]:
+        if kind in ("users", "uploads"):
+            search.rebuild()
+        if kind in ("uploads", "views"):
+            analytics.rebuild()
+        cache.invalidate("feed", "users", "profiles")
+    return totals
+
+
+# ------------------------ ROUTES ------------------------
+@bp.route("/export/<kind>.<fmt>")
+@admin_required
+def export(kind, fmt):
+    if kind not in transfer.tables or fmt not in FORMATS:
+        abort(404)
+    return Response(
+        stream_with_context(transfer.export(kind, fmt)),
+        mimetype=CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={kind}.{fmt}"},
+    )
+
+
+@bp.route("/import/<kind>.<fmt>", methods=["POST"])
+@admin_required
+def import_(kind, fmt):
+    """The file is the raw request body: `curl --data-binary @users.ndjson ...`."""
+    if kind not in transfer.tables or fmt not in FORMATS:
+        abort(404)
+    on_conflict = request.args.get("on_conflict", "skip")
+    if on_conflict not in ("skip", "error"):
+        abort(400)
+    try:
+        totals = import_rows(kind, decode_lines(request.stream), fmt, on_conflict)
+    except (TransferError, UnicodeDecodeError) as e:
+        return jsonify(error=str(e)), 400
+    except IntegrityError as e:
+        return jsonify(error=str(e.orig)), 409
+    return jsonify(totals)
+
+
+@bp.route("/users/<int:user_id>", methods=["DELETE"])
+@admin_required
+def delete_user(user_id):
+    User.query.get_or_404(user_id)
+    job_id = jobs.enqueue("delete_user", {"user_id": user_id}, key=delete_user_key(user_id))
+    return jsonify(job_id=job_id), 202
+
+
+# ------------------------ CLI ------------------------
+@bp.cli.command("export")
+@click.argument("kind", type=click.Choice(list(transfer.tables)))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="ndjson")
+@click.option("-o", "--output", type=click.File("w", encoding="utf-8"), default="-", help="default: stdout")
+def export_command(kind, fmt, output):
+    """Write one table as NDJSON or CSV."""
+    for chunk in transfer.export(kind, fmt):
+        output.write(chunk)
+
+
+@bp.cli.command("import")
+@click.argument("kind", type=click.Choice(list(transfer.tables)))
+@click.argument("source", type=click.File("rb"))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="ndjson")
+@click.option("--on-conflict", type=click.Choice(["skip", "error"]), default="skip",
+              help="rows whose key already exists")
+def import_command(kind, source, fmt, on_conflict):
+    """Load one table from an export (tables in the order: users, uploads, likes, views, game_stats)."""
+    try:
+        totals = import_rows(kind, decode_lines(source), fmt, on_conflict)
+    except (TransferError, UnicodeDecodeError) as e:
+        raise click.ClickException(str(e))
+    except IntegrityError as e:
+        raise click.ClickException(str(e.orig))
+    print(f"📥 {kind}: {totals['inserted']} rows imported, {totals['skipped']} already there", file=sys.stderr)
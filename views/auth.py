@@ -0,0 +1,236 @@
+import re
+from functools import wraps
+
+from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from itsdangerous import BadSignature, SignatureExpired
+
+import events
+from extensions import login_identifier_throttle, login_ip_throttle, passwords, serializer
+from models import User, db
+from passwords import HashingBusy
+
+bp = Blueprint("auth", __name__)
+
+
+# ------------------------ PASSWORD VALIDATION ------------------------
+def validate_password(password):
+    """
+    Validates a password:
+    - Min 8 chars
+    - At least 1 uppercase, 1 lowercase, 1 number, 1 special char
+    Returns: (bool, message)
+    """
+    if len(password) < 8:
+        return False, "Password must be at least 8 characters long."
+    if not re.search(r"[A-Z]", password):
+        return False, "Password must contain at least one uppercase letter."
+    if not re.search(r"[a-z]", password):
+        return False, "Password must contain at least one lowercase letter."
+    if not re.search(r"[0-9]", password):
+        return False, "Password must contain at least one digit."
+    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+        return False, "Password must contain at least one special character."
+    return True, ""
+
+
+# ------------------------ LOGIN REQUIRED DECORATOR ------------------------
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get("user_id") or session.get("logged_out"):
+            flash("⚠️ Please login to continue.", "warning")
+            return redirect(url_for("auth.login"))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# ---------- LOGIN ----------
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'GET':
+        return render_template("login.html")
+
+    identifier = request.form.get("email") or request.form.get("username") or request.form.get("identifier")
+    password = request.form.get("password", "")
+
+    if not identifier:
+        flash("Please enter your email or username.", "warning")
+        return redirect(url_for("auth.login"))
+
+    identifier = identifier.strip()
+    ip = request.remote_addr or "unknown"
+    if login_ip_throttle.blocked(ip) or login_identifier_throttle.blocked(identifier.lower()):
+        flash("⚠️ Too many login attempts. Please wait a few minutes and try again.", "warning")
+        return render_template("login.html"), 429
+    login_ip_throttle.hit(ip)
+
+    if "@" in identifier:
+        user = User.query.filter(db.func.lower(User.email) == identifier.lower()).first()
+    else:
+        user = User.query.filter_by(username=identifier).first()
+
+    try:
+        password_ok = user is not None and passwords.verify(user.password, password)
+    except HashingBusy:
+        flash("⚠️ Server is busy. Please try again in a moment.", "warning")
+        return render_template("login.html"), 503
+
+    if password_ok:
+        login_identifier_throttle.reset(identifier.lower())
+        if passwords.needs_rehash(user.password):
+            # Work factor changed since this hash was made; upgrade it now that we know the password
+            try:
+                user.password = passwords.hash(password)
+                db.session.commit()
+                events.emit(events.user_updated, user=user, fields={"password"})
+            except HashingBusy:
+                pass  # try again on a later login
+
+        # ✅ clear old session + set fresh values
+        session.clear()
+        session['user_id'] = user.id
+        session['username'] = user.username
+        session['email'] = user.email
+        session['logged_out'] = False   # reset logout flag
+
+        # flash(f"🎉 Welcome back, {user.username}!", "success")
+        return redirect(url_for("profile.dashboard"))
+
+    login_identifier_throttle.hit(identifier.lower())
+    flash("❌ Invalid email/username or password!", "danger")
+    return redirect(url_for("auth.login"))
+
+
+# ---------- REGISTER ----------
+@bp.route('/register', methods=['POST'])
+def register():
+    username = request.form['username']
+    email = request.form['email']
+    password = request.form['password']
+
+    existing_user = User.query.filter(
+        (User.username == username) | (User.email == email)
+    ).first()
+
+    if existing_user:
+        flash("❌ Username or email already taken. Please try again.", "danger")
+        return redirect(url_for('auth.login'))
+
+    try:
+        hashed_password = passwords.hash(password)
+    except HashingBusy:
+        flash("⚠️ Server is busy. Please try again in a moment.", "warning")
+        return redirect(url_for('auth.login'))
+    new_user = User(username=username, email=email, password=hashed_password)
+    db.session.add(new_user)
+    db.session.commit()
+    events.emit(events.user_registered, user=new_user)
+
+    flash("✅ Account created successfully! Please login.", "success")
+    return redirect(url_for('auth.login'))
+
+
+# ---------- LOGOUT ----------
+@bp.route("/logout")
+def logout():
+    session["logged_out"] = True
+    # flash("You have been logged out.", "info")
+    return redirect(url_for("auth.login"))
+
+
+# ---------- CHANGE PASSWORD ----------
+@bp.route("/change_password", methods=["GET", "POST"])
+@login_required
+def change_password():
+    user = User.query.filter_by(username=session["username"]).first()
+
+    if request.method == "POST":
+        current_password = request.form["current_password"]
+        new_password = request.form["new_password"]
+
+        is_valid, message = validate_password(new_password)
+        if not is_valid:
+            flash(f"❌ {message}", "danger")
+            return redirect(url_for("auth.change_password"))
+
+        try:
+            password_ok = passwords.verify(user.password, current_password)
+            if password_ok:
+                user.password = passwords.hash(new_password)
+        except HashingBusy:
+            flash("⚠️ Server is busy. Please try again in a moment.", "warning")
+            return redirect(url_for("auth.change_password"))
+
+        if password_ok:
+            db.session.commit()
+            events.emit(events.user_updated, user=user, fields={"password"})
+            flash("Password updated successfully!", "success")
+            return redirect(url_for("profile.profile", username=user.username))
+        else:
+            flash("❌ Wrong current password!", "danger")
+
+    return render_template("change_password.html", user=user)
+
+
+# ---------- FORGOT PASSWORD ----------
+@bp.route("/forgot_password", methods=["GET", "POST"])
+def forgot_password():
+    reset_link = None
+    message = None
+    if request.method == "POST":
+        email = request.form.get("email", "").strip()
+        user = User.query.filter(db.func.lower(User.email) == email.lower()).first()
+        if user:
+            token = serializer().dumps(user.email, salt="password-reset-salt")
+            reset_link = url_for("auth.reset_password", token=token, _external=True)
+            message = "✅ Reset link generated! Click below."
+        else:
+            message = "❌ Email not found."
+    return render_template("forgot_password.html", reset_link=reset_link, message=message)
+
+
+@bp.route("/reset_password/<token>", methods=["GET", "POST"])
+def reset_password(token):
+    try:
+        email = serializer().loads(token, salt="password-reset-salt", max_age=3600)
+    except SignatureExpired:
+        flash("⚠️ Token expired. Please request a new reset link.", "warning")
+        return redirect(url_for("auth.forgot_password"))
+    except BadSignature:
+        return redirect(url_for("auth.forgot_password"))
+
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        flash("⚠️ User not found.", "danger")
+        return redirect(url_for("auth.forgot_password"))
+
+    if request.method == "POST":
+        new_password = request.form.get("password")
+        is_valid, message = validate_password(new_password)
+        if not is_valid:
+            flash(f"❌ {message}", "danger")
+            return redirect(url_for("auth.reset_password", token=token))
+
+        try:
+            user.password = passwords.hash(new_password)
+        except HashingBusy:
+            flash("⚠️ Server is busy. Please try again in a moment.", "warning")
+            return redirect(url_for("auth.reset_password", token=token))
+        db.session.commit()
+        events.emit(events.user_updated, user=user, fields={"password"})
+        flash("✅ Password reset successfully! Please login.", "success")
+        return redirect(url_for("auth.login"))
+
+    return render_template("reset_password.html", email=email)
+
+
+# ------------------------ DISABLE BACK BUTTON CACHE ------------------------
+@bp.after_app_request
+def add_header(response):
+    # Only logged-in HTML pages must not come back from the cache after logout;
+    # static assets and media keep their own caching headers
+    if response.mimetype == "text/html" and session.get("user_id") and not session.get("logged_out"):
+        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = "0"
+    return response
@@ -0,0 +1,564 @@
+import hashlib
+import mimetypes
+import os
+import re
+import uuid
+
+from flask import (
+    Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request,
+    send_from_directory, session, url_for,
+)
+from sqlalchemy import delete
+from werkzeug.utils import secure_filename
+
+import events
+from extensions import analytics, chunked_uploads, jobs, storage, thumbnails
+from ingest import UploadSessionError, hash_file, stream_to_file
+from models import Upload, UploadActivity, UploadDailyStat, UploadView, User, VideoLike, db
+from storage import CONTENT_KEY, LocalStorage, content_key
+from thumbnails import derived_files, derived_name
+from transcode import DEFAULT_LADDER, TranscodeError, build_hls, hls_dir, parse_ladder
+from views import query_budget
+from views.auth import login_required
+
+# Its CLI commands stay top-level: `flask migrate-media`, not `flask media migrate-media`
+bp = Blueprint("media", __name__, cli_group=None)
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi'}
+
+
+@bp.record_once
+def configure(state):
+    app = state.app
+    app.config.setdefault('ALLOWED_EXTENSIONS', ALLOWED_EXTENSIONS)
+
+    # ---------- VIDEO TRANSCODING ----------
+    # Every video gets an H.264 HLS ladder (TRANSCODE_LADDER, "height:video kbps:audio kbps,...")
+    # built by the job worker with the local ffmpeg; the players switch to it once
+    # `transcode_status` is "ready" and play the original file until then.
+    app.config.setdefault('TRANSCODE_LADDER', parse_ladder(os.environ.get('TRANSCODE_LADDER', DEFAULT_LADDER)))
+    app.config.setdefault('TRANSCODE_WORKERS', int(os.environ.get('TRANSCODE_WORKERS', 1)))
+    app.config.setdefault('TRANSCODE_TIMEOUT', int(os.environ.get('TRANSCODE_TIMEOUT', 3600)))
+    app.config.setdefault('HLS_SEGMENT_SECONDS', int(os.environ.get('HLS_SEGMENT_SECONDS', 4)))
+
+    # ---------- MEDIA SERVING ----------
+    # MEDIA_OFFLOAD: "" serves files from Python, "x-sendfile" hands them to
+    # Apache/lighttpd, "x-accel" to nginx via an internal location that maps
+    # MEDIA_ACCEL_PREFIX onto UPLOAD_FOLDER. With MEDIA_STORAGE=s3 clients are
+    # redirected to the bucket instead.
+    app.config.setdefault('MEDIA_OFFLOAD', os.environ.get('MEDIA_OFFLOAD', ''))
+    app.config.setdefault('MEDIA_ACCEL_PREFIX', os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/'))
+    app.config.setdefault('MEDIA_MAX_AGE', int(os.environ.get('MEDIA_MAX_AGE', 365 * 24 * 3600)))
+    app.config['USE_X_SENDFILE'] = app.config['MEDIA_OFFLOAD'] == 'x-sendfile'
+
+
+# ------------------------ BACKGROUND JOBS ------------------------
+@jobs.handler("thumbnail", concurrency='MEDIA_WORKERS', priority=10)
+def build_thumbnails(upload_id, filename, filetype):
+    result = thumbnails.process(upload_id, filename, filetype)
+    if result["thumbnail"] or result["poster"]:
+        events.emit(events.upload_processed, upload_ids=[upload_id])
+
+
+@jobs.handler("transcode", concurrency='TRANSCODE_WORKERS', max_attempts=3)
+def transcode_video(filename):
+    """Builds the HLS renditions of a video file for every upload row that uses it."""
+    config = current_app.config
+    uploads = Upload.query.filter_by(filename=filename)
+    ids = [u.id for u in uploads.with_entities(Upload.id)]
+    if not ids:
+        return  # deleted before its turn came
+    uploads.update({"transcode_status": "processing"}, synchronize_session=False)
+    db.session.commit()
+    try:
+        with storage.workspace(filename) as folder:
+            playlist = build_hls(
+                folder, filename, config['TRANSCODE_LADDER'],
+                ffmpeg=config['FFMPEG_BINARY'],
+                segment_seconds=config['HLS_SEGMENT_SECONDS'],
+                timeout=config['TRANSCODE_TIMEOUT'],
+            )
+        values = {"transcode_status": "ready", "hls_playlist": playlist}
+    except TranscodeError as e:
+        # Unreadable file or no ffmpeg: keep playing the original
+        current_app.logger.warning("Transcoding %s failed: %s", filename, e)
+        values = {"transcode_status": "failed"}
+    uploads.update(values, synchronize_session=False)
+    db.session.commit()
+    events.emit(events.upload_processed, upload_ids=ids)
+
+
+@jobs.handler("delete_media", concurrency=2)
+def delete_media(filename):
+    """Removes a stored file and its derived files, unless something uses it again."""
+    storage.purge(filename, [filename] + derived_files(filename) + [hls_dir(filename)])
+
+
+def media_job_keys(filename):
+    """Idempotency keys of the jobs that build a stored file's derived files."""
+    # By file, not upload id: SQLite hands a deleted row's id to the next upload
+    return [f"thumbnail:{filename}", f"transcode:{filename}"]
+
+
+def release_media(filename):
+    """Call after a row stops using `filename`; the last one to go queues its deletion."""
+    if filename and storage.release(filename) == 0:
+        jobs.cancel(media_job_keys(filename))
+        jobs.enqueue("delete_media", {"filename": filename})
+
+
+def release_media_many(counts):
+    """`release_media()` for {filename: rows that stopped using it}, with one job per file left unused."""
+    unused = storage.release_many(counts)
+    jobs.cancel(key for name in unused for key in media_job_keys(name))
+    jobs.enqueue_many("delete_media", [{"filename": name} for name in unused])
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+def allowed_avatar(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
+
+
+# ------------------------ UPLOAD INGESTION ------------------------
+def store_upload(user, original_name, src_path, digest):
+    """
+    Turns a fully received file into an Upload row.
+    The file is stored under its content hash, so identical bytes are kept
+    once; when another upload already has them, its thumbnails and HLS
+    renditions are reused too instead of being built again.
+    Returns: (upload, reused)
+    """
+    existing = Upload.query.filter_by(content_hash=digest).first()
+    if existing and storage.exists(existing.filename):
+        storage.retain(existing.filename)
+        os.remove(src_path)
+        new_upload = Upload(
+            filename=existing.filename,
+            original_name=secure_filename(original_name),
+            filetype=existing.filetype,
+            user_id=user.id,
+            content_hash=digest,
+            thumbnail=existing.thumbnail,
+            poster=existing.poster,
+            transcode_status=existing.transcode_status,
+            hls_playlist=existing.hls_playlist,
+        )
+        db.session.add(new_upload)
+        db.session.commit()
+        events.emit(events.upload_created, upload=new_upload)
+        return new_upload, True
+
+    filename = storage.put(src_path, content_key(digest, original_name))
+
+    ext = filename.rsplit('.', 1)[1].lower()
+    filetype = "video" if ext in ["mp4", "mov", "avi"] else "image"
+
+    new_upload = Upload(
+        filename=filename,
+        original_name=secure_filename(original_name),
+        filetype=filetype,
+        user_id=user.id,
+        content_hash=digest,
+        transcode_status="pending" if filetype == "video" else None,
+    )
+    db.session.add(new_upload)
+    db.session.commit()
+    thumbnail_key, transcode_key = media_job_keys(filename)
+    jobs.enqueue(
+        "thumbnail",
+        {"upload_id": new_upload.id, "filename": filename, "filetype": filetype},
+        key=thumbnail_key,
+    )
+    if filetype == "video":
+        jobs.enqueue("transcode", {"filename": filename}, key=transcode_key)
+    events.emit(events.upload_created, upload=new_upload)
+    return new_upload, False
+
+
+def stage_stream(stream):
+    """Copies an already-open file (e.g. a form upload) into the staging folder. Returns: (path, sha256)."""
+    tmp_path = chunked_uploads.staging_path(f"{uuid.uuid4().hex}.form")
+    hasher = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as fh:
+            stream_to_file(stream, fh, hasher, limit=current_app.config['MAX_UPLOAD_SIZE'])
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, hasher.hexdigest()
+
+
+def ingest_stream(user, original_name, stream):
+    """Streams an already-open file through the same path as chunked uploads."""
+    tmp_path, digest = stage_stream(stream)
+    return store_upload(user, original_name, tmp_path, digest)
+
+
+def store_avatar(user, file):
+    """Stores an uploaded profile picture and points `user` at it."""
+    tmp_path, digest = stage_stream(file.stream)
+    old_avatar = user.avatar
+    user.avatar = storage.put(tmp_path, content_key(digest, file.filename))
+    db.session.commit()
+    events.emit(events.user_updated, user=user, fields={"avatar"})
+    release_media(old_avatar)
+
+
+# ------------------------ MEDIA SERVING ------------------------
+# Stored names start with their content hash (older ones with a uuid4 hex),
+# so their bytes never change; nor do the HLS folders named after them,
+# which are renamed into place complete
+IMMUTABLE_MEDIA = re.compile(r"^[0-9a-f]{32}_|^[0-9a-f]{64}\.")
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+
+@bp.app_template_global()
+def media_url(filename):
+    return url_for('media.media', filename=filename)
+
+
+@bp.app_template_global()
+def avatar_url(avatar):
+    """Avatars in the media store, else the default or a pre-store one in static/avatars."""
+    if avatar and CONTENT_KEY.match(avatar):
+        return media_url(avatar)
+    return url_for('static', filename='avatars/' + (avatar or 'default-avatar.png'))
+
+
+@bp.app_template_global()
+def thumbnail_url(upload):
+    """Card-sized image for an upload; falls back to the original image."""
+    if upload.thumbnail:
+        return media_url(upload.thumbnail)
+    if upload.filetype == "image":
+        return media_url(upload.filename)
+    return None
+
+
+@bp.app_template_global()
+def thumbnail_webp_url(upload):
+    if not upload.thumbnail:
+        return None
+    return media_url(derived_name(upload.filename, "thumb.webp"))
+
+
+@bp.app_template_global()
+def poster_url(upload):
+    if not upload.poster:
+        return None
+    return media_url(upload.poster)
+
+
+def hls_url(upload):
+    return media_url(upload.hls_playlist) if upload.hls_playlist else None
+
+
+@bp.route("/media/<path:filename>")
+def media(filename):
+    # Never serve staging files (".incoming/...") or other hidden paths
+    if any(part.startswith(".") for part in filename.split("/")):
+        abort(404)
+
+    config = current_app.config
+    backend = storage.backend
+    if backend.remote:
+        if not filename.endswith(".m3u8"):
+            # The bucket serves the bytes and Range requests; presigned URLs expire, so revalidate
+            response = redirect(backend.url(filename))
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        # Playlists are passed through so their relative segment URLs stay under /media
+        if not backend.exists(filename):
+            abort(404)
+        response = Response(backend.open(filename).read(), mimetype=mimetypes.guess_type(filename)[0])
+    elif config['MEDIA_OFFLOAD'] == 'x-accel':
+        if not os.path.isfile(backend.path(filename)):
+            abort(404)
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        response.headers["X-Accel-Redirect"] = config['MEDIA_ACCEL_PREFIX'] + backend.relpath(filename)
+    else:
+        # Handles Range (206), ETag and If-Modified-Since/If-None-Match (304)
+        response = send_from_directory(config['UPLOAD_FOLDER'], backend.relpath(filename), conditional=True)
+
+    if IMMUTABLE_MEDIA.match(filename):
+        response.headers["Cache-Control"] = f"public, max-age={config['MEDIA_MAX_AGE']}, immutable"
+    else:
+        response.headers["Cache-Control"] = "public, no-cache"
+    return response
+
+
+# ---------- UPLOAD FILE ----------
+@bp.route('/upload', methods=['GET', 'POST'])
+@login_required
+def upload_file():
+    user = User.query.filter_by(username=session["username"]).first()
+    if request.method == 'POST':
+        if 'file' not in request.files:
+            flash('❌ No file part', "danger")
+            return redirect(request.url)
+
+        file = request.files['file']
+        if file.filename == '':
+            flash('❌ No selected file', "danger")
+            return redirect(request.url)
+
+        if file and allowed_file(file.filename):
+            try:
+                ingest_stream(user, file.filename, file.stream)
+            except UploadSessionError:
+                flash('❌ File is too large!', "danger")
+                return redirect(request.url)
+
+            # flash('✅ File uploaded to your profile!', "success")
+            return redirect(url_for('profile.dashboard'))
+        else:
+            flash('❌ Invalid file type!', "danger")
+            return redirect(request.url)
+
+    return render_template('upload.html', chunk_size=current_app.config['UPLOAD_CHUNK_SIZE'])
+
+
+# ---------- CHUNKED / RESUMABLE UPLOAD API ----------
+def upload_session_error(e):
+    body = {"error": str(e)}
+    if e.offset is not None:
+        body["offset"] = e.offset
+    return jsonify(body), e.status
+
+
+@bp.route('/api/upload-sessions', methods=['POST'])
+@login_required
+def start_upload_session():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    original_name = data.get("filename")
+    if not isinstance(original_name, str) or not allowed_file(original_name):
+        return jsonify({"error": "Invalid file type"}), 400
+    try:
+        meta = chunked_uploads.start(session["user_id"], original_name, data.get("size"))
+    except UploadSessionError as e:
+        return upload_session_error(e)
+    return jsonify({
+        "token": meta["token"],
+        "offset": 0,
+        "chunk_size": current_app.config['UPLOAD_CHUNK_SIZE'],
+    }), 201
+
+
+@bp.route('/api/upload-sessions/<token>', methods=['GET'])
+@login_required
+def upload_session_status(token):
+    try:
+        meta = chunked_uploads.status(token, session["user_id"])
+    except UploadSessionError as e:
+        return upload_session_error(e)
+    return jsonify({"token": token, "offset": meta["offset"], "size": meta["size"]})
+
+
+@bp.route('/api/upload-sessions/<token>', methods=['PUT'])
+@login_required
+def upload_session_chunk(token):
+    # The chunk is the raw request body; Upload-Offset says where it starts
+    offset = request.headers.get("Upload-Offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Missing Upload-Offset header"}), 400
+    try:
+        new_offset = chunked_uploads.append(token, session["user_id"], offset, request.stream)
+    except UploadSessionError as e:
+        return upload_session_error(e)
+    return jsonify({"token": token, "offset": new_offset})
+
+
+@bp.route('/api/upload-sessions/<token>/finalize', methods=['POST'])
+@login_required
+def finalize_upload_session(token):
+    user = User.query.filter_by(username=session["username"]).first()
+    try:
+        meta, part_path, digest = chunked_uploads.finish(token, session["user_id"])
+    except UploadSessionError as e:
+        return upload_session_error(e)
+
+    new_upload, reused = store_upload(user, meta["name"], part_path, digest)
+    chunked_uploads.discard(token)
+    return jsonify({
+        "id": new_upload.id,
+        "url": media_url(new_upload.filename),
+        "view_url": url_for('social.view_upload', upload_id=new_upload.id),
+        "deduplicated": reused,
+    }), 201
+
+
+# ---------- DELETE UPLOAD ----------
+@bp.route("/delete/<int:upload_id>", methods=["POST"])
+@login_required
+@query_budget(13)
+def delete_upload(upload_id):
+    upload = Upload.query.get_or_404(upload_id)
+    user = User.query.filter_by(username=session["username"]).first()
+
+    if upload.user_id != user.id:
+        flash("❌ You are not allowed to delete this upload.", "danger")
+        return redirect(url_for("profile.dashboard"))
+
+    # Off its owner's totals by what its daily rows counted, while they exist
+    analytics.upload_removed(upload)
+    # What references it goes first, set-based and in the same transaction,
+    # as in purge_user (views/profile.py)
+    for table, column in (
+        (VideoLike.__table__, "video_id"),
+        (UploadView.__table__, "upload_id"),
+        (UploadActivity.__table__, "upload_id"),
+        (UploadDailyStat.__table__, "upload_id"),
+    ):
+        db.session.execute(delete(table).where(table.c[column] == upload.id))
+    db.session.delete(upload)
+    db.session.commit()
+    events.emit(events.upload_deleted, upload=upload)
+    release_media(upload.filename)
+
+    flash("✅ Upload deleted successfully.", "success")
+    return redirect(url_for("profile.dashboard"))
+
+
+# ------------------------ CLI ------------------------
+@bp.cli.command("backfill-thumbnails")
+def backfill_thumbnails():
+    """Build thumbnails/posters for uploads that don't have them yet."""
+    last_id, done = 0, 0
+    while True:
+        batch = (
+            Upload.query.filter(Upload.id > last_id, Upload.thumbnail.is_(None))
+            .order_by(Upload.id)
+            .limit(100)
+            .all()
+        )
+        if not batch:
+            break
+        for upload in batch:
+            last_id = upload.id
+            if not storage.exists(upload.filename):
+                continue
+            result = thumbnails.process(upload.id, upload.filename, upload.filetype)
+            if result["thumbnail"]:
+                done += 1
+        db.session.expire_all()
+    print(f"✅ Thumbnails built for {done} uploads")
+
+
+@bp.cli.command("backfill-transcodes")
+def backfill_transcodes():
+    """Queue HLS transcoding for videos that don't have renditions yet."""
+    filenames = {
+        name for (name,) in db.session.query(Upload.filename).filter(
+            Upload.filetype == "video",
+            db.or_(Upload.transcode_status.is_(None), Upload.transcode_status == "failed"),
+        )
+    }
+    for filename in filenames:
+        Upload.query.filter_by(filename=filename).update({"transcode_status": "pending"})
+        db.session.commit()
+        jobs.enqueue("transcode", {"filename": filename})
+    print(f"🎞 Queued transcoding for {len(filenames)} videos")
+
+
+def move_into_storage(local, old, new):
+    """Moves `old` (file or folder) from local disk into the media store as `new`."""
+    path = local.path(old)
+    if not os.path.exists(path):
+        return False
+    if storage.exists(new) and not os.path.isdir(path):
+        local.delete(old)  # same content already stored
+    else:
+        storage.backend.save(path, new)
+    return True
+
+
+@bp.cli.command("migrate-media")
+def migrate_media():
+    """Move uploads and avatars from the flat folders into the media store."""
+    local = LocalStorage(current_app.config['UPLOAD_FOLDER'])
+    moved, missing = 0, []
+
+    last_id = 0
+    while True:
+        batch = (
+            db.session.query(Upload.id, Upload.filename)
+            .filter(Upload.id > last_id)
+            .order_by(Upload.id)
+            .limit(100)
+            .all()
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for name in dict.fromkeys(filename for _, filename in batch):
+            if CONTENT_KEY.match(name):
+                # Already content-addressed; only a switch to S3 leaves anything to move
+                if storage.backend.remote and move_into_storage(local, name, name):
+                    for derived in derived_files(name) + [hls_dir(name)]:
+                        move_into_storage(local, derived, derived)
+                    moved += 1
+                continue
+            if not os.path.isfile(local.path(name)):
+                missing.append(name)
+                continue
+
+            digest = hash_file(local.path(name)).hexdigest()
+            key = content_key(digest, name)
+            move_into_storage(local, name, key)
+            for suffix in ("thumb.jpg", "thumb.webp", "poster.jpg"):
+                move_into_storage(local, derived_name(name, suffix), derived_name(key, suffix))
+            move_into_storage(local, hls_dir(name), hls_dir(key))
+
+            uploads = Upload.query.filter_by(filename=name)
+            ids = [u.id for u in uploads.with_entities(Upload.id)]
+            uploads.update({
+                "filename": key,
+                "content_hash": digest,
+                "thumbnail": db.case((Upload.thumbnail.is_(None), None), else_=derived_name(key, "thumb.jpg")),
+                "poster": db.case((Upload.poster.is_(None), None), else_=derived_name(key, "poster.jpg")),
+                "hls_playlist": db.case((Upload.hls_playlist.is_(None), None), else_=f"{hls_dir(key)}/master.m3u8"),
+            }, synchronize_session=False)
+            VideoLike.query.filter_by(filename=name).update({"filename": key}, synchronize_session=False)
+            db.session.commit()
+            storage.retain(key, len(ids))
+            storage.forget(name)
+            events.emit(events.upload_processed, upload_ids=ids)  # cached cards link the old name
+            moved += 1
+
+    avatars = LocalStorage(current_app.config['AVATAR_FOLDER'])
+    legacy_avatars = {
+        name for (name,) in db.session.query(User.avatar).filter(
+            User.avatar.isnot(None), User.avatar != "default-avatar.png"
+        ).distinct()
+        if not CONTENT_KEY.match(name)
+    }
+    for name in legacy_avatars:
+        if not os.path.isfile(avatars.path(name)):
+            missing.append(f"avatars/{name}")
+            continue
+        key = content_key(hash_file(avatars.path(name)).hexdigest(), name)
+        move_into_storage(avatars, name, key)
+        users = User.query.filter_by(avatar=name).all()
+        for user in users:
+            user.avatar = key
+        db.session.commit()
+        storage.retain(key, len(users))
+        for user in users:
+            events.emit(events.user_updated, user=user, fields={"avatar"})
+        moved += 1
+
+    print(f"📦 Moved {moved} files into the media store")
+    if missing:
+        print(f"⚠️ {len(missing)} referenced files were not found: {', '.join(missing[:20])}")
+
+
+@bp.cli.command("retry-failed-jobs")
+def retry_failed_jobs():
+    """Queue jobs that ran out of attempts again."""
+    print(f"🔁 Requeued {jobs.retry_failed()} failed jobs")
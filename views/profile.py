@@ -0,0 +1,234 @@
+import os
+from collections import Counter
+
+from flask import Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, session, url_for
+from sqlalchemy import delete, select, update
+
+import events
+from extensions import analytics, counters, jobs
+from models import (
+    GameStat, Upload, UploadActivity, UploadCards, UploadDailyStat, UploadView, User, UserActivity, UserStat,
+    VideoLike, db,
+)
+from views import query_budget
+from views.auth import login_required
+from views.media import allowed_avatar, release_media, release_media_many, store_avatar
+
+# Its CLI commands stay top-level: `flask rebuild-analytics`
+bp = Blueprint("profile", __name__, cli_group=None)
+
+# What the dashboard charts show, and the most the stats API returns
+DASHBOARD_SPANS = {"hour": 48, "day": 30}
+MAX_SPANS = {"hour": 7 * 24, "day": 366}
+
+
+@bp.record_once
+def configure(state):
+    app = state.app
+    app.config.setdefault('DASHBOARD_PAGE_SIZE', int(os.environ.get('DASHBOARD_PAGE_SIZE', 24)))
+    # A deleted upload is taken off by delete_upload, before its daily rows go
+    events.upload_created.connect(count_new_upload, sender=app)
+
+
+# ------------------------ ANALYTICS ------------------------
+def count_new_upload(sender, upload, **extra):
+    analytics.upload_added(upload.user_id)
+
+
+def span_arg(grain):
+    """?count= buckets of `grain`, within what is kept."""
+    n = request.args.get("count", DASHBOARD_SPANS[grain], type=int)
+    return max(1, min(n, MAX_SPANS[grain]))
+
+
+def series_to_json(series):
+    return [{**entry, "start": entry["start"].isoformat() + "Z"} for entry in series]
+
+
+# ---------- DASHBOARD ----------
+@bp.route("/dashboard")
+@login_required
+@query_budget(4)
+def dashboard():
+    """Same cost for every user: totals and charts come from the rollups, uploads a page at a time."""
+    user = User.query.filter_by(email=session["email"]).first()
+    if not user:
+        flash("⚠ User not found!", "danger")
+        return redirect(url_for("auth.login"))
+
+    page_size = current_app.config['DASHBOARD_PAGE_SIZE']
+    query = UploadCards.apply(Upload.query).filter_by(user_id=user.id).order_by(Upload.id.desc())
+    after = request.args.get("after", type=int)
+    if after:
+        query = query.filter(Upload.id < after)
+    uploads = query.limit(page_size + 1).all()
+    next_cursor = uploads[page_size - 1].id if len(uploads) > page_size else None
+
+    return render_template(
+        "dashboard.html", user=user, uploads=uploads[:page_size], next_cursor=next_cursor,
+        totals=analytics.totals(user.id), activity=analytics.user_activity(user.id, DASHBOARD_SPANS),
+    )
+
+
+@bp.route("/api/stats")
+@login_required
+@query_budget(2)
+def api_stats():
+    """The current user's totals and ?grain=hour|day activity over the last ?count= buckets."""
+    grain = request.args.get("grain", "day")
+    if grain not in DASHBOARD_SPANS:
+        return jsonify({"error": "grain must be hour or day"}), 400
+    user_id = session["user_id"]
+    series = analytics.user_activity(user_id, {grain: span_arg(grain)})[grain]
+    return jsonify({"totals": analytics.totals(user_id), "grain": grain, "series": series_to_json(series)})
+
+
+@bp.route("/api/uploads/<int:upload_id>/stats")
+@login_required
+@query_budget(2)
+def api_upload_stats(upload_id):
+    """Daily views and likes of one of the current user's uploads over the last ?count= days."""
+    upload = db.session.get(Upload, upload_id)
+    if upload is None or upload.user_id != session["user_id"]:
+        abort(404)
+    series = analytics.upload_activity(upload_id, span_arg("day"))
+    return jsonify({
+        "upload_id": upload_id, "views": counters.value(upload, "views"), "likes": counters.value(upload, "likes"),
+        "grain": "day", "series": series_to_json(series),
+    })
+
+
+@bp.cli.command("rebuild-analytics")
+def rebuild_analytics():
+    """Recompute the dashboard stats from the uploads and recorded views (e.g. after an import)."""
+    print(f"📊 Stats rebuilt for {analytics.rebuild()} users")
+
+
+# ---------- PROFILE ----------
+@bp.route("/profile/<username>", methods=["GET", "POST"])
+def profile(username):
+    user = User.query.filter_by(username=username).first_or_404()
+
+    if request.method == "POST":
+        if "avatar" in request.files and request.files["avatar"].filename != "":
+            avatar = request.files["avatar"]
+            if not allowed_avatar(avatar.filename):
+                flash("Invalid file type. Please upload an image.", "danger")
+                return redirect(url_for("profile.profile", username=user.username))
+            store_avatar(user, avatar)
+            flash("Avatar updated!", "success")
+            return redirect(url_for("profile.profile", username=user.username))
+
+        if "bio" in request.form:
+            user.bio = request.form["bio"]
+            db.session.commit()
+            events.emit(events.user_updated, user=user, fields={"bio"})
+            flash("Bio updated!", "success")
+            return redirect(url_for("profile.profile", username=user.username))
+
+    return render_template("profile.html", user=user)
+
+
+# ---------- UPLOAD AVATAR ----------
+@bp.route("/upload_avatar", methods=["POST"])
+@login_required
+def upload_avatar():
+    user = User.query.filter_by(username=session["username"]).first()
+    file = request.files.get("avatar")
+    if not file or file.filename == "":
+        flash("No file selected!", "warning")
+        return redirect(url_for("profile.dashboard"))
+
+    if file and allowed_avatar(file.filename):
+        store_avatar(user, file)
+        flash("Profile picture updated!", "success")
+    else:
+        flash("Invalid file type. Please upload an image.", "danger")
+
+    return redirect(url_for("profile.dashboard"))
+
+
+# ---------- CHANGE USERNAME ----------
+@bp.route("/change_username", methods=["GET", "POST"])
+@login_required
+def change_username():
+    user = User.query.filter_by(username=session["username"]).first()
+
+    if request.method == "POST":
+        new_username = request.form["new_username"]
+
+        if User.query.filter_by(username=new_username).first():
+            flash("That username is already taken!", "error")
+        else:
+            old_username = user.username
+            user.username = new_username
+            session["username"] = new_username
+            db.session.commit()
+            events.emit(events.user_updated, user=user, fields={"username"}, old_username=old_username)
+            flash("Username updated successfully!", "success")
+            return redirect(url_for("profile.profile", username=new_username))
+
+    return render_template("change_username.html", user=user)
+
+
+# ---------- DELETE ACCOUNT ----------
+def delete_user_key(user_id):
+    return f"delete-user:{user_id}"
+
+
+@jobs.handler("delete_user", priority=5)
+def purge_user(user_id, batch_size=1000):
+    """
+    Deletes an account and everything that references it, set-based: no row
+    is loaded into the session. Each transaction deletes a batch of uploads
+    along with their likes, views and activity; their files are released in
+    one statement and those nothing uses any more are queued for deletion.
+    """
+    users, uploads = User.__table__, Upload.__table__
+    with db.engine.connect() as conn:
+        avatar = conn.execute(select(users.c.avatar).where(users.c.id == user_id)).first()
+    if avatar is None:
+        return
+    while True:
+        with db.engine.begin() as conn:
+            batch = conn.execute(
+                select(uploads.c.id, uploads.c.filename)
+                .where(uploads.c.user_id == user_id).order_by(uploads.c.id).limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            ids = [row.id for row in batch]
+            for table, column in (
+                (VideoLike.__table__, "video_id"),
+                (UploadView.__table__, "upload_id"),
+                (UploadActivity.__table__, "upload_id"),
+                (UploadDailyStat.__table__, "upload_id"),
+                (uploads, "id"),
+            ):
+                conn.execute(delete(table).where(table.c[column].in_(ids)))
+        events.emit(events.uploads_purged, upload_ids=ids)
+        release_media_many(Counter(row.filename for row in batch))
+
+    with db.engine.begin() as conn:
+        views = UploadView.__table__
+        conn.execute(update(views).where(views.c.user_id == user_id).values(user_id=None))
+        for table in (GameStat.__table__, UserStat.__table__, UserActivity.__table__):
+            conn.execute(delete(table).where(table.c.user_id == user_id))
+        conn.execute(delete(users).where(users.c.id == user_id))
+    # The id may be given to the next account, which must be deletable in its turn
+    jobs.cancel([delete_user_key(user_id)])
+    events.emit(events.user_deleted, user_id=user_id)
+    release_media(avatar.avatar)
+
+
+@bp.route('/delete_user/<int:user_id>', methods=['POST'])
+@login_required
+def delete_user(user_id):
+    # Only the account's owner; anyone else's goes through DELETE /admin/users/<id>
+    if user_id != session["user_id"]:
+        abort(403)
+    User.query.get_or_404(user_id)
+    # Uploads, views and files go with the account, which can take a while
+    jobs.enqueue("delete_user", {"user_id": user_id}, key=delete_user_key(user_id))
+    session.clear()
+    return redirect(url_for('social.users'))
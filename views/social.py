@@ -0,0 +1,617 @@
+import os
+import uuid
+
+from flask import Blueprint, Response, abort, current_app, jsonify, render_template, request, session, url_for
+from itsdangerous import BadSignature, SignatureExpired
+from markupsafe import Markup
+
+import events
+from extensions import (
+    cache, count, counters, leaderboards, like_dedup, live, ranking, score_throttle, search, serializer, view_dedup,
+)
+from leaderboard import GAMES, GLOBAL_BOARD, ScoreRejected
+from models import Upload, UploadDetail, UploadFeed, User, UserDirectory, UserResults, db
+from ranking import RANKINGS
+from search import SEARCH_TYPES
+from views import query_budget
+from views.auth import login_required
+from views.media import avatar_url, hls_url, media_url, poster_url, thumbnail_url, thumbnail_webp_url
+
+bp = Blueprint("social", __name__)
+
+# Games are started with a signed, single-use session token; the score is
+# submitted with it, so the server knows how long the game really took.
+GAME_TOKEN_SALT = "game-session"
+LEADERBOARD_PAGE_SIZE = 50
+
+
+@bp.record_once
+def configure(state):
+    app = state.app
+    # ---------- FEED PAGINATION ----------
+    app.config.setdefault('FEED_PAGE_SIZE', int(os.environ.get('FEED_PAGE_SIZE', 24)))
+    app.config.setdefault('FEED_MAX_PAGE_SIZE', int(os.environ.get('FEED_MAX_PAGE_SIZE', 100)))
+    # ---------- CACHING, see below ----------
+    app.config.setdefault('CACHE_FEED_TTL', int(os.environ.get('CACHE_FEED_TTL', 30)))
+    app.config.setdefault('CACHE_CARD_TTL', int(os.environ.get('CACHE_CARD_TTL', 60)))
+    connect_events(app)
+
+
+# ------------------------ VIEWER IDENTITY ------------------------
+def viewer_key():
+    """Stable id for the current visitor: the user when logged in, else the anonymous session."""
+    if session.get("user_id") and not session.get("logged_out"):
+        return f"user:{session['user_id']}"
+    # Anonymous visitors only get a session once they view or like something
+    return f"anon:{session.setdefault('session_id', str(uuid.uuid4()))}"
+
+
+def liked_upload_ids(upload_ids):
+    # Anonymous visitors who never liked anything skip the lookup entirely
+    if not (session.get("user_id") and not session.get("logged_out")) and not session.get("has_likes"):
+        return set()
+    return like_dedup.seen_many(upload_ids, viewer_key())
+
+
+# ------------------------ FEED PAGINATION ------------------------
+def feed_page(after=None, limit=None):
+    """
+    Keyset pagination over uploads, newest first.
+    `after` is the id of the last upload the client already has; only rows
+    with a smaller id are returned, so the cost does not grow with the table.
+    Returns: (uploads, next_cursor) — next_cursor is None on the last page.
+    """
+    page_size = limit or current_app.config['FEED_PAGE_SIZE']
+    page_size = max(1, min(page_size, current_app.config['FEED_MAX_PAGE_SIZE']))
+
+    query = UploadFeed.apply(Upload.query).order_by(Upload.id.desc())
+    if after:
+        query = query.filter(Upload.id < after)
+
+    # Fetch one extra row to know whether another page exists
+    uploads = query.limit(page_size + 1).all()
+    next_cursor = None
+    if len(uploads) > page_size:
+        uploads = uploads[:page_size]
+        next_cursor = uploads[-1].id
+    return uploads, next_cursor
+
+
+FEED_SORTS = ("new",) + tuple(RANKINGS)
+
+
+def ranked_page(sort, after=None, limit=None):
+    """
+    One page of a ranking ("trending", "top_day", "top_week"), read from the
+    in-memory top list. `after` is the number of ranked uploads the client
+    already has. Returns the same shape as `cached_feed()`, plus the scores.
+    """
+    page_size = limit or current_app.config['FEED_PAGE_SIZE']
+    page_size = max(1, min(page_size, current_app.config['FEED_MAX_PAGE_SIZE']))
+    offset = max(after or 0, 0)
+    entries, more = ranking.page(sort, offset, page_size)
+    return {
+        "ids": [upload_id for upload_id, _ in entries],
+        "scores": dict(entries),
+        "next_cursor": offset + page_size if more else None,
+    }
+
+
+def upload_to_dict(upload):
+    return {
+        "id": upload.id,
+        "filename": upload.filename,
+        "name": upload.original_name,
+        "filetype": upload.filetype,
+        "username": upload.user.username,
+        "url": media_url(upload.filename),
+        "thumbnail_url": thumbnail_url(upload),
+        "thumbnail_webp_url": thumbnail_webp_url(upload),
+        "poster_url": poster_url(upload),
+        "hls_url": hls_url(upload),
+        "view_url": url_for('social.view_upload', upload_id=upload.id),
+        "views": counters.value(upload, "views"),
+        "likes": counters.value(upload, "likes"),
+    }
+
+
+# ------------------------ CACHING ------------------------
+# Feed pages (lists of ids), gallery cards, API card dicts, view pages and the
+# /users table are cached. Entries depend on namespaces that the write routes
+# invalidate through the signals in events.py:
+#   feed          - which uploads exist          (upload created/deleted)
+#   upload:<id>   - one upload's card and page   (liked, deleted)
+#   counts:<id>   - its counts for /view and /like (counts flushed)
+#   users         - the /users table             (any account change)
+#   profiles      - usernames/avatars on cards   (any account change)
+# View counts on cached cards may lag by up to CACHE_CARD_TTL seconds.
+def cached_feed(after=None, limit=None):
+    """
+    Cached `feed_page()`.
+    Returns: ({"ids": [...], "next_cursor": ...}, {id: Upload} for rows loaded on a miss)
+    """
+    key = cache.key("feed", after or 0, limit or 0, depends=("feed",))
+    page = cache.get(key)
+    if page is not None:
+        return page, {}
+    uploads, next_cursor = feed_page(after=after, limit=limit)
+    page = {"ids": [u.id for u in uploads], "next_cursor": next_cursor}
+    cache.set(key, page, ttl=current_app.config['CACHE_FEED_TTL'])
+    return page, {u.id: u for u in uploads}
+
+
+def cached_cards(upload_ids, fmt, loaded=None):
+    """
+    Gallery card HTML (fmt="html") or API dicts (fmt="json") for `upload_ids`,
+    in order. Only uploads missing from both the cache and `loaded` are
+    queried, in one SELECT.
+    """
+    loaded = dict(loaded or {})
+    keys = {
+        uid: cache.key(f"card-{fmt}", uid, depends=(f"upload:{uid}", "profiles"))
+        for uid in upload_ids
+    }
+    found = {uid: cache.get(key) for uid, key in keys.items()}
+
+    missing = [uid for uid, value in found.items() if value is None and uid not in loaded]
+    if missing:
+        for upload in UploadFeed.apply(Upload.query).filter(Upload.id.in_(missing)):
+            loaded[upload.id] = upload
+
+    for uid in upload_ids:
+        if found[uid] is not None or uid not in loaded:
+            continue
+        upload = loaded[uid]
+        if fmt == "html":
+            value = render_template(
+                "_upload_card.html",
+                upload=upload,
+                views=counters.value(upload, "views"),
+                likes=counters.value(upload, "likes"),
+            )
+        else:
+            value = upload_to_dict(upload)
+        cache.set(keys[uid], value, ttl=current_app.config['CACHE_CARD_TTL'])
+        found[uid] = value
+
+    cards = [found[uid] for uid in upload_ids if found[uid] is not None]
+    return [Markup(card) for card in cards] if fmt == "html" else cards
+
+
+def upload_counts(upload_id):
+    """
+    {"filename", "filetype", "views", "likes"} of an upload as stored, or None
+    if it doesn't exist: what /view and /like need, without a query per hit.
+    See `counted()` for the counts including this worker's pending ones.
+    """
+    key = cache.key("counts", upload_id, depends=(f"upload:{upload_id}", f"counts:{upload_id}"))
+    row = cache.get(key)
+    if row is None:
+        found = db.session.execute(
+            db.select(Upload.filename, Upload.filetype, Upload.views, Upload.likes).where(Upload.id == upload_id)
+        ).first()
+        if found is None:
+            return None
+        row = {"filename": found.filename, "filetype": found.filetype,
+               "views": found.views or 0, "likes": found.likes or 0}
+        cache.set(key, row, ttl=current_app.config['CACHE_CARD_TTL'])
+    return row
+
+
+def counted(upload_id, column):
+    """An upload's views or likes as this worker knows them: stored plus pending."""
+    upload = upload_counts(upload_id) or {column: 0}
+    return upload[column] + counters.pending(upload_id, column)
+
+
+def invalidate_feed(sender, **extra):
+    cache.invalidate("feed")
+
+
+def invalidate_deleted_upload(sender, upload, **extra):
+    cache.invalidate("feed", f"upload:{upload.id}")
+
+
+def unrank_deleted_upload(sender, upload, **extra):
+    ranking.discard(upload.id)
+
+
+def invalidate_purged_uploads(sender, upload_ids, **extra):
+    cache.invalidate("feed", *[f"upload:{uid}" for uid in upload_ids])
+
+
+def unrank_purged_uploads(sender, upload_ids, **extra):
+    ranking.discard_many(upload_ids)
+
+
+def invalidate_liked_upload(sender, upload_id, **extra):
+    cache.invalidate(f"upload:{upload_id}")
+
+
+def invalidate_processed_uploads(sender, upload_ids, **extra):
+    cache.invalidate(*[f"upload:{uid}" for uid in upload_ids])
+
+
+def invalidate_profiles(sender, **extra):
+    cache.invalidate("users", "profiles")
+
+
+def invalidate_deleted_user(sender, **extra):
+    cache.invalidate("users", "profiles", "feed")
+
+
+def drop_deleted_player(sender, user_id, **extra):
+    leaderboards.discard_user(user_id)
+
+
+# ------------------------ SEARCH INDEX ------------------------
+# On SQLite the FTS5 tables are kept current from the domain events below.
+def index_new_user(sender, user, **extra):
+    search.index_user(user.id, user.username, user.bio)
+
+
+def reindex_user(sender, user, fields, **extra):
+    if fields & {"username", "bio"}:
+        search.index_user(user.id, user.username, user.bio)
+
+
+def unindex_deleted_user(sender, user_id, **extra):
+    search.remove_user(user_id)
+
+
+def index_new_upload(sender, upload, **extra):
+    search.index_upload(upload.id, upload.original_name)
+
+
+def unindex_deleted_upload(sender, upload, **extra):
+    search.remove_upload(upload.id)
+
+
+def unindex_purged_uploads(sender, upload_ids, **extra):
+    search.remove_uploads(upload_ids)
+
+
+def connect_events(app):
+    receivers = [
+        (events.upload_created, invalidate_feed),
+        (events.upload_created, index_new_upload),
+        (events.upload_deleted, invalidate_deleted_upload),
+        (events.upload_deleted, unrank_deleted_upload),
+        (events.upload_deleted, unindex_deleted_upload),
+        (events.uploads_purged, invalidate_purged_uploads),
+        (events.uploads_purged, unrank_purged_uploads),
+        (events.uploads_purged, unindex_purged_uploads),
+        (events.upload_liked, invalidate_liked_upload),
+        (events.upload_processed, invalidate_processed_uploads),
+        (events.user_registered, invalidate_profiles),
+        (events.user_registered, index_new_user),
+        (events.user_updated, invalidate_profiles),
+        (events.user_updated, reindex_user),
+        (events.user_deleted, invalidate_deleted_user),
+        (events.user_deleted, drop_deleted_player),
+        (events.user_deleted, unindex_deleted_user),
+    ]
+    for signal, receiver in receivers:
+        signal.connect(receiver, sender=app)
+
+
+# ------------------------ ROUTES ------------------------
+@bp.route('/')
+@query_budget(0)
+def index():
+    # The landing page shows no uploads: the feed is /gallery
+    return render_template("index.html")
+
+
+# ---------- PUBLIC VIDEO VIEW ----------
+@bp.route("/view/<int:upload_id>", methods=["GET"])
+@query_budget(1)
+def view_upload(upload_id):
+    key = cache.key("view-page", upload_id, depends=(f"upload:{upload_id}", "profiles"))
+    page = cache.get(key)
+    if page is None:
+        upload = UploadDetail.apply(Upload.query).filter_by(id=upload_id).first_or_404()
+        page = render_template("view.html", upload=upload)
+        cache.set(key, page, ttl=current_app.config['CACHE_CARD_TTL'])
+    return page
+
+@bp.route("/view/<int:upload_id>", methods=["POST"])
+def api_increment_view(upload_id):
+    upload = upload_counts(upload_id)
+    if upload is None:
+        abort(404)
+
+    # Only count the first view per viewer
+    user_id = session.get("user_id") if not session.get("logged_out") else None
+    if view_dedup.add(upload_id, viewer_key(), user_id=user_id):
+        count(upload_id, "views")
+
+    return jsonify({"views": counted(upload_id, "views")})
+
+
+# ---------- PUBLIC VIDEO LIKE ----------
+@bp.route("/like/<int:upload_id>", methods=["POST"])
+def like_upload(upload_id):
+    upload = upload_counts(upload_id)
+    if upload is None:
+        abort(404)
+
+    if not like_dedup.add(upload_id, viewer_key(), filename=upload["filename"], filetype=upload["filetype"]):
+        return jsonify({"error": "Already liked"}), 400
+
+    count(upload_id, "likes")
+    session["has_likes"] = True
+    events.emit(events.upload_liked, upload_id=upload_id, viewer=viewer_key())
+    return jsonify({"likes": counted(upload_id, "likes")})
+
+
+@bp.route("/api/live")
+@query_budget(1)
+def live_counts():
+    """
+    Server-Sent Events with the counts of ?ids=1,2,3. Under asgi.py the
+    stream is held open on the event loop and this view never runs; a sync
+    worker only sends the current counts and has the browser reconnect
+    after LIVE_POLL_INTERVAL seconds (see live.py).
+    """
+    try:
+        ids = live.parse_ids(request.args.get("ids", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    body = live.message(live.values(ids), retry=current_app.config['LIVE_POLL_INTERVAL'])
+    return Response(body, mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# ---------- GALLERY ----------
+@bp.route("/gallery")
+@query_budget(2)
+def gallery():
+    sort = request.args.get("sort", "new")
+    if sort not in FEED_SORTS:
+        sort = "new"
+    after = request.args.get("after", type=int)
+    if sort == "new":
+        page, loaded = cached_feed(after=after)
+    else:
+        page, loaded = ranked_page(sort, after=after), {}
+    return render_template(
+        "gallery.html",
+        cards=cached_cards(page["ids"], "html", loaded),
+        next_cursor=page["next_cursor"],
+        liked_ids=liked_upload_ids(page["ids"]),
+        sort=sort,
+        sorts=FEED_SORTS,
+    )
+
+
+@bp.route("/api/uploads")
+@query_budget(2)
+def api_uploads():
+    sort = request.args.get("sort", "new")
+    if sort not in FEED_SORTS:
+        return jsonify({"error": f"sort must be one of: {', '.join(FEED_SORTS)}"}), 400
+    after = request.args.get("after", type=int)
+    limit = request.args.get("limit", type=int)
+    if sort == "new":
+        page, loaded = cached_feed(after=after, limit=limit)
+    else:
+        page, loaded = ranked_page(sort, after=after, limit=limit), {}
+
+    liked_ids = liked_upload_ids(page["ids"])
+    uploads = []
+    for card in cached_cards(page["ids"], "json", loaded):
+        item = dict(card, liked=card["id"] in liked_ids)
+        if "scores" in page:
+            item["score"] = round(page["scores"][card["id"]], 3)
+        uploads.append(item)
+    return jsonify({"uploads": uploads, "sort": sort, "next_cursor": page["next_cursor"]})
+
+
+# ---------- USERS ----------
+@bp.route("/users")
+@query_budget(1)
+def users():
+    all_users = cache.get_or_set(
+        cache.key("users", depends=("users",)),
+        lambda: [
+            {"id": u.id, "username": u.username, "email": u.email, "password": u.password}
+            for u in UserDirectory.apply(User.query)
+        ],
+    )
+    username = session.get("username")
+    current_user = next((u for u in all_users if u["username"] == username), None) if username else None
+    return render_template("users.html", users=all_users, me=current_user)
+
+
+# ---------- SEARCH ----------
+def search_results(q, kinds, fmt, limit, offset=0):
+    """
+    Ranked matches for `q` of each kind in `kinds`: one query for the ranking
+    plus one to load the rows. Uploads come back as `cached_cards()` in `fmt`.
+    Returns: {"users": [...], "uploads": [...], "ids": {kind: [...]}, "next_offset": {kind: int or None}}
+    """
+    results = {"ids": {}, "next_offset": {}}
+    for kind in kinds:
+        ranked = search.search(kind, q, limit=limit, offset=offset)
+        ids = [rid for rid, _ in ranked]
+        scores = dict(ranked)
+        if kind == "users":
+            by_id = {u.id: u for u in UserResults.apply(User.query).filter(User.id.in_(ids))} if ids else {}
+            items = [
+                {
+                    "id": u.id,
+                    "username": u.username,
+                    "bio": u.bio,
+                    "avatar_url": avatar_url(u.avatar),
+                    "profile_url": url_for('profile.profile', username=u.username),
+                }
+                for u in (by_id[rid] for rid in ids if rid in by_id)
+            ]
+        else:
+            items = cached_cards(ids, fmt) if ids else []
+        if fmt == "json":
+            items = [dict(item, score=round(scores[item["id"]], 3)) for item in items]
+        results[kind] = items
+        results["ids"][kind] = ids
+        results["next_offset"][kind] = offset + limit if len(ranked) == limit else None
+    return results
+
+
+@bp.route("/api/search/autocomplete")
+@query_budget(1)
+def api_autocomplete():
+    users = search.autocomplete(request.args.get("q", ""))
+    return jsonify({"users": [
+        {
+            "username": u["username"],
+            "avatar_url": avatar_url(u["avatar"]),
+            "profile_url": url_for('profile.profile', username=u["username"]),
+        }
+        for u in users
+    ]})
+
+
+@bp.route("/api/search")
+@query_budget(5)
+def api_search():
+    q = request.args.get("q", "")
+    kind = request.args.get("type")
+    if kind and kind not in SEARCH_TYPES:
+        return jsonify({"error": f"type must be one of: {', '.join(SEARCH_TYPES)}"}), 400
+    limit = request.args.get("limit", type=int) or current_app.config['SEARCH_RESULT_LIMIT']
+    limit = max(1, min(limit, current_app.config['FEED_MAX_PAGE_SIZE']))
+    offset = max(0, request.args.get("offset", 0, type=int))
+    results = search_results(q, [kind] if kind else SEARCH_TYPES, "json", limit, offset)
+    ids = results.pop("ids")
+    if "uploads" in results:
+        liked_ids = liked_upload_ids(ids["uploads"])
+        for upload in results["uploads"]:
+            upload["liked"] = upload["id"] in liked_ids
+    return jsonify(dict(results, q=q))
+
+
+@bp.route("/search")
+@query_budget(5)
+def search_page():
+    q = request.args.get("q", "").strip()
+    results = search_results(q, SEARCH_TYPES, "html", current_app.config['SEARCH_RESULT_LIMIT']) if q else {}
+    return render_template(
+        "search.html",
+        q=q,
+        users=results.get("users", []),
+        cards=results.get("uploads", []),
+        liked_ids=liked_upload_ids(results["ids"]["uploads"]) if q else set(),
+    )
+
+
+# ---------- GAMES & LEADERBOARDS ----------
+@bp.route("/api/games/<game>/sessions", methods=["POST"])
+@login_required
+def start_game(game):
+    if game not in GAMES:
+        return jsonify({"error": "unknown game"}), 404
+    token = serializer().dumps(
+        {"game": game, "user_id": session["user_id"], "id": uuid.uuid4().hex}, salt=GAME_TOKEN_SALT
+    )
+    return jsonify({"token": token}), 201
+
+
+@bp.route("/api/games/<game>/scores", methods=["POST"])
+@login_required
+def submit_score(game):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    token = data.get("token")
+    if not isinstance(token, str):
+        return jsonify({"error": "invalid or expired game token"}), 400
+    user_id = session["user_id"]
+    try:
+        claims, started_at = serializer().loads(
+            token, salt=GAME_TOKEN_SALT,
+            max_age=current_app.config['GAME_MAX_SECONDS'], return_timestamp=True,
+        )
+    except (SignatureExpired, BadSignature):
+        return jsonify({"error": "invalid or expired game token"}), 400
+    if claims.get("game") != game or claims.get("user_id") != user_id:
+        return jsonify({"error": "game token does not match"}), 400
+
+    if score_throttle.blocked(str(user_id)):
+        return jsonify({"error": "too many scores submitted, try again later"}), 429
+    score_throttle.hit(str(user_id))
+
+    try:
+        xp = leaderboards.submit(
+            user_id, game, data.get("score"), data.get("result"), data.get("moves"),
+            started_at=started_at.timestamp(), token_id=claims["id"],
+        )
+    except ScoreRejected as e:
+        return jsonify({"error": e.message}), e.status
+
+    rank, total = leaderboards.rank(GLOBAL_BOARD, user_id)
+    game_rank, _ = leaderboards.rank(game, user_id)
+    return jsonify({"xp_awarded": xp, "xp": total, "rank": rank, "game_rank": game_rank})
+
+
+def leaderboard_rows(board, offset, limit):
+    """Board entries with usernames: one query for the page, however big the board is."""
+    entries, total = leaderboards.page(board, offset, limit)
+    names = {}
+    if entries:
+        names = dict(
+            db.session.query(User.id, User.username).filter(User.id.in_([uid for _, uid, _ in entries]))
+        )
+    rows = [
+        {"rank": rank, "user_id": uid, "username": names[uid], "value": value}
+        for rank, uid, value in entries if uid in names
+    ]
+    return rows, total
+
+
+@bp.route("/leaderboard")
+@bp.route("/leaderboard/<board>")
+@query_budget(1)
+def leaderboard(board=GLOBAL_BOARD):
+    if board not in leaderboards.board_names():
+        abort(404)
+    page = max(request.args.get("page", 1, type=int), 1)
+    rows, total = leaderboard_rows(board, (page - 1) * LEADERBOARD_PAGE_SIZE, LEADERBOARD_PAGE_SIZE)
+
+    me = None
+    if session.get("user_id") and not session.get("logged_out"):
+        rank, value = leaderboards.rank(board, session["user_id"])
+        if rank:
+            me = {"rank": rank, "value": value, "page": (rank - 1) // LEADERBOARD_PAGE_SIZE + 1}
+    return render_template(
+        "leaderboard.html",
+        board=board,
+        boards=leaderboards.board_names(),
+        games=GAMES,
+        rows=rows,
+        me=me,
+        page=page,
+        pages=max((total + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE, 1),
+    )
+
+
+@bp.route("/api/leaderboard/<board>")
+@query_budget(1)
+def api_leaderboard(board):
+    """
+    ?offset=&limit= for a range of ranks, or ?around=<user_id> for the
+    players just above and below someone.
+    """
+    if board not in leaderboards.board_names():
+        return jsonify({"error": "unknown leaderboard"}), 404
+    limit = max(1, min(request.args.get("limit", LEADERBOARD_PAGE_SIZE, type=int), 100))
+    offset = max(request.args.get("offset", 0, type=int), 0)
+
+    around = request.args.get("around", type=int)
+    if around is not None:
+        rank, _ = leaderboards.rank(board, around)
+        if rank is None:
+            return jsonify({"error": "player is not on this leaderboard"}), 404
+        offset = max(rank - 1 - limit // 2, 0)
+
+    rows, total = leaderboard_rows(board, offset, limit)
+    return jsonify({"board": board, "total": total, "entries": rows})
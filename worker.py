@@ -0,0 +1,21 @@
+"""
+Job worker entry point: runs the jobs queued by the web app (thumbnails,
+media file removal, account deletion, ...). Gunicorn serves requests only;
+run this as its own process next to it:
+
+    python worker.py
+
+Several workers may run at once; they share the job table. See jobs.py.
+Like the web app it expects a migrated database (`flask db upgrade`).
+"""
+import logging
+import os
+
+from app import jobs
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    jobs.run_worker()